@@ -9,6 +9,13 @@ chown -R app:app /app/logs /app/pdfs /app/data /app/staticfiles || true
 
 echo "Entrypoint started. Checking command: $1"
 
+# Start every run with empty Prometheus multiprocess files (values of dead processes would linger)
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    chown -R app:app "$PROMETHEUS_MULTIPROC_DIR" || true
+fi
+
 # If the command is 'celery', wait for RabbitMQ to be ready
 if [ "$1" = 'celery' ]; then
     echo "Celery command detected. Waiting for RabbitMQ..."
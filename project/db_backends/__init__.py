@@ -0,0 +1,13 @@
+"""
+Pooled database backends for the 'hospital' alias.
+
+Django 3.2 has no connection pooling: with `CONN_MAX_AGE = 0` every request
+and every Celery task opens a new connection to the hospital database, which
+costs hundreds of milliseconds over the DB link. The backends of this package
+wrap the stock ones (`oracle`, `postgresql` and `mssql`) so that opening a
+Django connection checks one out of a bounded pool of this process and
+closing it returns it to the pool.
+
+They are selected by `settings.HOSPITAL_DB_POOL` and configured through the
+`POOL` entry of `DATABASES['hospital']` (see `pool.PooledDatabaseWrapperMixin`).
+"""
@@ -0,0 +1,24 @@
+"""
+cx_Oracle module served by python-oracledb.
+
+python-oracledb is the only Oracle driver installed (requirements.txt). Django 3.2
+still does `import cx_Oracle`, so `install()` registers this module under that
+name. Every attribute is delegated to `oracledb`, which is left untouched;
+`version` is the cx_Oracle API level python-oracledb implements, the value
+Django reads to pick its code paths (`cx_oracle_version`).
+"""
+import sys
+
+import oracledb
+
+# cx_Oracle API implemented by python-oracledb (its real version is `oracledb.__version__`)
+version = "8.3.0"
+
+
+def __getattr__(name):
+    return getattr(oracledb, name)
+
+
+def install():
+    """Registers this module as `cx_Oracle`; must run before Django's Oracle backend is imported."""
+    sys.modules.setdefault('cx_Oracle', sys.modules[__name__])
@@ -0,0 +1,8 @@
+"""SQL Server (mssql-django) backend whose connections are checked out of a per-process pool."""
+from mssql import base as mssql_base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, mssql_base.DatabaseWrapper):
+    pass
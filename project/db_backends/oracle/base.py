@@ -0,0 +1,105 @@
+"""
+Oracle backend backed by a python-oracledb session pool.
+
+Django 3.2 drives Oracle through cx_Oracle. python-oracledb is its
+API-compatible successor and the driver the settings initialize in thick mode
+(Instant Client), so `cx_oracle_compat` serves it under the cx_Oracle name
+before the stock backend is imported. Sessions come from an `oracledb` pool, which does
+the bounding, waiting and health checks (`ping_interval`) natively and keeps a
+statement cache of `STMT_CACHE_SIZE` per session.
+"""
+import time
+
+import oracledb
+
+from .. import cx_oracle_compat
+
+cx_oracle_compat.install()
+
+from django.conf import settings  # noqa: E402
+from django.db.backends.oracle import base as oracle_base  # noqa: E402
+from django.db.backends.oracle.utils import dsn  # noqa: E402
+
+from ..pool import BasePool, PooledDatabaseWrapperMixin  # noqa: E402
+
+# Errors raised by `ConnectionPool.acquire` when `wait_timeout` expires (thin/thick mode)
+POOL_TIMEOUT_ERRORS = ('DPY-4005', 'ORA-24457')
+
+
+def _init_session(connection, requested_tag):
+    """Applies the session settings of Django's Oracle backend once per new pooled session."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("ALTER SESSION SET NLS_TERRITORY = 'AMERICA'")
+        cursor.execute(
+            "ALTER SESSION SET NLS_DATE_FORMAT = 'YYYY-MM-DD HH24:MI:SS'"
+            " NLS_TIMESTAMP_FORMAT = 'YYYY-MM-DD HH24:MI:SS.FF'" +
+            (" TIME_ZONE = 'UTC'" if settings.USE_TZ else '')
+        )
+    finally:
+        cursor.close()
+
+
+class OracleSessionPool(BasePool):
+    """Adapts an `oracledb` session pool to the checkout interface and metrics of `BasePool`."""
+
+    def __init__(self, alias, settings_dict, conn_params, options):
+        super().__init__(alias, options['MAX_SIZE'])
+        self.timeout = float(options['TIMEOUT'])
+        self._pool = oracledb.create_pool(
+            user=settings_dict['USER'],
+            password=settings_dict['PASSWORD'],
+            dsn=dsn(settings_dict),
+            min=min(int(options['MIN_SIZE']), self.max_size),
+            max=self.max_size,
+            increment=1,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=int(self.timeout * 1000),
+            ping_interval=int(options['PING_INTERVAL']),
+            stmtcachesize=int(options['STMT_CACHE_SIZE']),
+            session_callback=_init_session,
+            **conn_params,
+        )
+
+    def usage(self):
+        return self._pool.opened, self._pool.busy
+
+    def acquire(self, connect=None):
+        started = time.monotonic()
+        saturated = self._pool.busy >= self.max_size
+        try:
+            connection = self._pool.acquire()
+        except oracledb.DatabaseError as e:
+            error = e.args[0] if e.args else None
+            if getattr(error, 'full_code', None) in POOL_TIMEOUT_ERRORS:
+                waited = time.monotonic() - started
+                self._record_timeout(waited)
+                raise self._timeout_error(waited) from e
+            raise
+        self._record_checkout(time.monotonic() - started, saturated)
+        return connection
+
+    def release(self, connection, discard=False):
+        # The pool rolls back any open transaction of released sessions
+        if discard:
+            self._pool.drop(connection)
+            with self._stats_lock:
+                self.discarded += 1
+        else:
+            self._pool.release(connection)
+        self._export_usage()
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, oracle_base.DatabaseWrapper):
+
+    def create_pool(self):
+        return OracleSessionPool(self.alias, self.settings_dict, self.get_connection_params(), self.pool_options())
+
+    def init_connection_state(self):
+        # Session settings are applied by `_init_session`; Django's LIKE check
+        # runs once per thread, like in the stock backend
+        if 'operators' not in self.__dict__:
+            super().init_connection_state()
+        elif not self.get_autocommit():
+            self.commit()
+        self.connection.stmtcachesize = int(self.pool_options()['STMT_CACHE_SIZE'])
@@ -0,0 +1,304 @@
+"""
+Process-wide connection pools and their metrics.
+
+A pool is created lazily, per database alias and per process (a pool
+inherited through `fork`, e.g. by Celery prefork children, is never used by
+the child), and is bounded by `MAX_SIZE`: when every connection is checked
+out, a checkout waits up to `TIMEOUT` seconds for one to be returned and then
+fails with `OperationalError`. Idle connections are checked with a cheap
+query before being handed out again if they have been idle for more than
+`PING_INTERVAL` seconds; broken ones are discarded and replaced.
+
+Every pool records how long checkouts waited for a connection and how
+saturated it is (`BasePool.stats`), and exports them as Prometheus metrics
+(`ward_db_pool_*`, see `ward_data_app.metrics`).
+"""
+import os
+import time
+import logging
+import threading
+
+from django.db import OperationalError
+
+from ward_data_app import metrics
+from ward_data_app.logging_config import setup_logger
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+# Defaults of the `POOL` entry of a DATABASES alias
+POOL_DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 8,
+    'TIMEOUT': 30,
+    'PING_INTERVAL': 60,
+    'STMT_CACHE_SIZE': 50,
+}
+
+
+class BasePool:
+    """Checkout/wait/saturation metrics shared by every pool implementation."""
+
+    def __init__(self, alias, max_size):
+        self.alias = alias
+        self.max_size = max(1, int(max_size))
+        self.pid = os.getpid()
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        # Checkouts that found every connection in use and had to wait
+        self.saturated_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.created = 0
+        self.discarded = 0
+
+    def _record_checkout(self, waited_seconds, saturated):
+        with self._stats_lock:
+            self.checkouts += 1
+            self.saturated_checkouts += int(saturated)
+            self.wait_seconds_total += waited_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, waited_seconds)
+        metrics.DB_POOL_CHECKOUT_WAIT.labels(self.alias).observe(waited_seconds)
+        if saturated:
+            metrics.DB_POOL_SATURATED_CHECKOUTS.labels(self.alias).inc()
+        self._export_usage()
+
+    def _record_timeout(self, waited_seconds):
+        with self._stats_lock:
+            self.timeouts += 1
+            self.saturated_checkouts += 1
+            self.wait_seconds_total += waited_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, waited_seconds)
+        # Called with the pool lock held: the usage gauges are left to the next checkout/release
+        metrics.DB_POOL_CHECKOUT_WAIT.labels(self.alias).observe(waited_seconds)
+        metrics.DB_POOL_SATURATED_CHECKOUTS.labels(self.alias).inc()
+        metrics.DB_POOL_TIMEOUTS.labels(self.alias).inc()
+        logger.warning(f"No '{self.alias}' connection available after {waited_seconds:.1f}s "
+                       f"({self.max_size} in use).")
+
+    def _timeout_error(self, waited_seconds):
+        return OperationalError(
+            f"Timed out after {waited_seconds:.1f}s waiting for a '{self.alias}' connection "
+            f"(pool of {self.max_size} exhausted)."
+        )
+
+    def usage(self):
+        """Returns (open connections, connections checked out)."""
+        raise NotImplementedError
+
+    def _export_usage(self):
+        """Updates the in-use/saturation gauges of this pool; called after a checkout or a release."""
+        _, in_use = self.usage()
+        metrics.DB_POOL_IN_USE.labels(self.alias).set(in_use)
+        metrics.DB_POOL_MAX_SIZE.labels(self.alias).set(self.max_size)
+        metrics.DB_POOL_SATURATION.labels(self.alias).set(in_use / self.max_size)
+
+    def stats(self):
+        """Returns the pool size and usage and the checkout/wait counters."""
+        size, in_use = self.usage()
+        with self._stats_lock:
+            return {
+                'alias': self.alias,
+                'size': size,
+                'in_use': in_use,
+                'max_size': self.max_size,
+                'saturation': round(in_use / self.max_size, 3),
+                'checkouts': self.checkouts,
+                'saturated_checkouts': self.saturated_checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'wait_seconds_avg': round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                'created': self.created,
+                'discarded': self.discarded,
+            }
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool(BasePool):
+    """
+    A bounded, thread-safe pool of DB-API connections.
+
+    Connections are opened on demand by the `connect` callable given to
+    `acquire` (so the backend keeps its own connection setup) and idle ones are
+    reused most recently returned first. `ping(connection)` must raise if the
+    connection is broken.
+    """
+
+    def __init__(self, alias, max_size=8, timeout=30, ping_interval=60, ping=None):
+        super().__init__(alias, max_size)
+        self.timeout = float(timeout)
+        self.ping_interval = float(ping_interval)
+        self._ping = ping
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._available = threading.Condition(threading.Lock())
+
+    def usage(self):
+        with self._available:
+            return self._size, self._in_use
+
+    def _is_healthy(self, connection, idle_since):
+        if self._ping is None or time.monotonic() - idle_since < self.ping_interval:
+            return True
+        try:
+            self._ping(connection)
+        except Exception as e:
+            logger.warning(f"Discarding a broken '{self.alias}' connection: {e}")
+            return False
+        return True
+
+    def _forget(self):
+        with self._available:
+            self._size -= 1
+            self._in_use -= 1
+            self._available.notify()
+
+    def acquire(self, connect):
+        """Checks out an idle connection, or opens one with `connect()` if the pool is not full."""
+        started = time.monotonic()
+        saturated = False
+        while True:
+            with self._available:
+                while not self._idle and self._size >= self.max_size:
+                    saturated = True
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        waited = time.monotonic() - started
+                        self._record_timeout(waited)
+                        raise self._timeout_error(waited)
+                    self._available.wait(remaining)
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    connection, idle_since = None, None
+                    self._size += 1
+                self._in_use += 1
+            waited = time.monotonic() - started
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self._forget()
+                    raise
+                with self._stats_lock:
+                    self.created += 1
+            elif not self._is_healthy(connection, idle_since):
+                _close_quietly(connection)
+                self._forget()
+                with self._stats_lock:
+                    self.discarded += 1
+                continue
+
+            self._record_checkout(waited, saturated)
+            return connection
+
+    def release(self, connection, discard=False):
+        """Returns a checked-out connection, or closes it for good with `discard`."""
+        if discard:
+            _close_quietly(connection)
+            self._forget()
+            with self._stats_lock:
+                self.discarded += 1
+        else:
+            with self._available:
+                self._idle.append((connection, time.monotonic()))
+                self._in_use -= 1
+                self._available.notify()
+        self._export_usage()
+
+    def close(self):
+        """Closes the idle connections (checked-out ones are closed when returned)."""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for connection, _ in idle:
+            _close_quietly(connection)
+
+
+# -----------------------------------------------------------------------------
+# Per-process registry
+# -----------------------------------------------------------------------------
+
+_pools = {}
+_registry_lock = threading.Lock()
+
+
+def get_pool(alias, factory):
+    """Returns the pool of `alias` for this process, creating it with `factory()` on first use."""
+    pool = _pools.get(alias)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _registry_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            # A pool inherited from the parent process shares its sockets: never use it
+            pool = factory()
+            _pools[alias] = pool
+            logger.info(f"Connection pool for '{alias}' created in process {pool.pid} (max {pool.max_size}).")
+        return pool
+
+
+# -----------------------------------------------------------------------------
+# Django integration
+# -----------------------------------------------------------------------------
+
+def ping_with_select(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Makes a Django `DatabaseWrapper` check its connections out of the pool of
+    its alias instead of opening them, and return them instead of closing
+    them. Connections closed inside a transaction, with a changed autocommit
+    or after an error that broke them are discarded instead.
+
+    Options come from the `POOL` entry of the alias settings (see
+    `POOL_DEFAULTS`); the backends combine it with the stock `CONN_MAX_AGE = 0`,
+    so that every request/task returns its connection when it finishes.
+    """
+
+    def pool_options(self):
+        return {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+
+    def create_pool(self):
+        options = self.pool_options()
+        return ConnectionPool(
+            self.alias,
+            max_size=options['MAX_SIZE'],
+            timeout=options['TIMEOUT'],
+            ping_interval=options['PING_INTERVAL'],
+            ping=ping_with_select,
+        )
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.create_pool)
+
+    def get_new_connection(self, conn_params):
+        backend = super(PooledDatabaseWrapperMixin, self)
+        return self.pool.acquire(lambda: backend.get_new_connection(conn_params))
+
+    def _is_reusable(self):
+        if self.in_atomic_block or self.autocommit != self.settings_dict['AUTOCOMMIT']:
+            return False
+        return not self.errors_occurred or self.is_usable()
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                return self.pool.release(self.connection, discard=not self._is_reusable())
@@ -0,0 +1,8 @@
+"""PostgreSQL backend whose connections are checked out of a per-process pool."""
+from django.db.backends.postgresql import base as postgresql_base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, postgresql_base.DatabaseWrapper):
+    pass
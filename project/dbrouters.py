@@ -16,6 +16,8 @@ class HospitalRouter:
        disallowed, treating the 'hospital' database as read-only.
     3. Migrations for the 'hospital' database are disabled to
        prevent accidental changes to a legacy database schema.
+    4. Models flagged with `local_replica = True` (the local census
+       replica) are read from and written to the 'default' database.
     """
 
     def db_for_read(self, model, **hints):
@@ -23,6 +25,8 @@ class HospitalRouter:
         Directs reads for `ward_data_app` to the 'hospital' database.
         """
         if model._meta.app_label == 'ward_data_app':
+            if getattr(model, 'local_replica', False):
+                return 'default'
             return 'hospital'
         # No preference for other apps
         return None
@@ -32,6 +36,8 @@ class HospitalRouter:
         Blocks writes for `ward_data_app`.
         """
         if model._meta.app_label == 'ward_data_app':
+            if getattr(model, 'local_replica', False):
+                return 'default'
             # Returning None prevents the write operation for this app.
             # This is a crucial safeguard for an external database.
             return None
@@ -22,6 +22,9 @@ DB_TYPE = os.environ.get('DB_TYPE', 'oracle')
 if DB_TYPE == 'oracle':
     try:
         import oracledb
+        # Django's Oracle backend imports cx_Oracle: serve python-oracledb under that name
+        from project.db_backends import cx_oracle_compat
+        cx_oracle_compat.install()
         # This path is internal to the Docker container
         oracledb.init_oracle_client(lib_dir="/opt/oracle/instantclient_19_3")
     except ImportError:
@@ -72,6 +75,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ward_data_app.middleware.MetricsMiddleware',
+    'ward_data_app.middleware.QueryTraceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +84,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ward_data_app.middleware.DataSourceMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -94,6 +100,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'ward_data_app.context_processors.data_source',
             ],
         },
     },
@@ -111,6 +118,8 @@ DB_ENGINES = {
     'oracle': 'django.db.backends.oracle',
     'postgres': 'django.db.backends.postgresql',
     'sqlserver': 'mssql', 
+    # Synthetic hospital database of the benchmarks (`manage.py benchmark`)
+    'sqlite': 'django.db.backends.sqlite3',
 }
 
 DATABASES = {
@@ -128,6 +137,28 @@ DATABASES = {
     }
 }
 
+# Pooled connections for the 'hospital' alias (see project/db_backends): one bounded pool per process
+HOSPITAL_DB_POOL = os.environ.get('HOSPITAL_DB_POOL', 'False').lower() in ['true', '1']
+DB_POOL_ENGINES = {
+    'oracle': 'project.db_backends.oracle',
+    'postgres': 'project.db_backends.postgresql',
+    'sqlserver': 'project.db_backends.mssql',
+}
+if HOSPITAL_DB_POOL and DB_TYPE in DB_POOL_ENGINES:
+    DATABASES['hospital']['ENGINE'] = DB_POOL_ENGINES.get(DB_TYPE, 'project.db_backends.oracle')
+    DATABASES['hospital']['POOL'] = {
+        # Sessions opened when the pool is created (Oracle only; the other pools open on demand)
+        'MIN_SIZE': int(os.environ.get('HOSPITAL_DB_POOL_MIN_SIZE', 1)),
+        # Upper bound of open connections per process (gunicorn threads x DAL_SECTION_WORKERS)
+        'MAX_SIZE': int(os.environ.get('HOSPITAL_DB_POOL_MAX_SIZE', 8)),
+        # Seconds a checkout waits for a free connection before failing
+        'TIMEOUT': float(os.environ.get('HOSPITAL_DB_POOL_TIMEOUT', 30)),
+        # Idle seconds after which a connection is pinged before being reused
+        'PING_INTERVAL': int(os.environ.get('HOSPITAL_DB_POOL_PING_INTERVAL', 60)),
+        # Statements cached per session (Oracle only)
+        'STMT_CACHE_SIZE': int(os.environ.get('HOSPITAL_DB_STMT_CACHE_SIZE', 50)),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -162,18 +193,98 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# RabbitMQ queues are declared with message priorities 0..N (backup chunks are sent by priority).
+# An existing queue cannot gain priorities (PRECONDITION_FAILED on redeclaration), so tasks
+# no longer use the 'celery' queue of older installs but a new default queue
+CELERY_TASK_QUEUE_MAX_PRIORITY = int(os.environ.get('CELERY_QUEUE_MAX_PRIORITY', 10))
+CELERY_TASK_DEFAULT_QUEUE = os.environ.get('CELERY_DEFAULT_QUEUE', 'backup')
+# On-demand PDF jobs run on their own queue (and worker), never behind a backup cycle
+PDF_JOBS_QUEUE = os.environ.get('PDF_JOBS_QUEUE', 'pdf_jobs')
+CELERY_TASK_ROUTES = {
+    'ward_data_app.tasks.render_pdf_job': {'queue': PDF_JOBS_QUEUE},
+}
 
 # --- Celery Beat (Scheduled Tasks) ---
 BACKUP_INTERVAL_SECONDS = int(os.environ.get('BACKUP_INTERVAL', 7200))
+# Number of patients loaded (one query per section) and rendered per backup task
+BACKUP_BATCH_SIZE = int(os.environ.get('BACKUP_BATCH_SIZE', 50))
+# Admissions, diary entries and medication changes within this many hours move a patient
+# ahead in the backup cycle (after the patients with no backup PDF)
+BACKUP_PRIORITY_RECENT_HOURS = int(os.environ.get('BACKUP_PRIORITY_RECENT_HOURS', 24))
 CELERY_BEAT_SCHEDULE = {
     'generate-periodic-pdf-backup': {
         'task': 'ward_data_app.tasks.generate_periodic_pdf_backup',
         'schedule': float(BACKUP_INTERVAL_SECONDS),
     },
 }
+# Refresh interval of the local census replica (0 disables the sync)
+CENSUS_REPLICA_SYNC_INTERVAL = int(os.environ.get('CENSUS_REPLICA_SYNC_INTERVAL', 300))
+if CENSUS_REPLICA_SYNC_INTERVAL > 0:
+    CELERY_BEAT_SCHEDULE['sync-census-replica'] = {
+        'task': 'ward_data_app.tasks.sync_census_replica',
+        'schedule': float(CENSUS_REPLICA_SYNC_INTERVAL),
+    }
 
 # --- Application Settings ---
+# Opt-in parallel fetching of the patient detail sections (one 'hospital' connection per thread)
+DAL_CONCURRENT_SECTIONS = os.environ.get('DAL_CONCURRENT_SECTIONS', 'False').lower() in ['true', '1']
+DAL_SECTION_WORKERS = int(os.environ.get('DAL_SECTION_WORKERS', 4))
+DAL_SECTION_TIMEOUT = float(os.environ.get('DAL_SECTION_TIMEOUT', 30))
+# Where the web views read from: 'live' (hospital DB), 'replica' (local census replica)
+# or 'auto' (hospital DB, falling back to the replica while it is unreachable)
+DAL_READ_MODE = os.environ.get('DAL_READ_MODE', 'live').lower()
+# In 'auto' mode, seconds to keep serving the replica after a hospital DB failure
+DAL_REPLICA_RETRY_SECONDS = float(os.environ.get('DAL_REPLICA_RETRY_SECONDS', 30))
+# Seconds between rebuilds of the per-process patient name index (typeahead and name search)
+NAME_INDEX_REFRESH_SECONDS = int(os.environ.get('NAME_INDEX_REFRESH_SECONDS', 300))
+# Rows fetched per round trip by streaming queries (census export, patient IDs)
+DAL_FETCH_BATCH_SIZE = int(os.environ.get('DAL_FETCH_BATCH_SIZE', 500))
+# Touched by `manage.py flush_query_cache`: every process clears its query cache within a second
+QUERY_CACHE_FLUSH_FILE = os.environ.get('QUERY_CACHE_FLUSH_FILE', '/app/data/query_cache.flush')
+# Diary window of the patient details, API and PDFs: only the entries of the last N days and/or
+# the last N entries are read (in SQL), plus always the most recent one (0 = no limit)
+DIARY_WINDOW_DAYS = int(os.environ.get('DIARY_WINDOW_DAYS', 0))
+DIARY_WINDOW_ENTRIES = int(os.environ.get('DIARY_WINDOW_ENTRIES', 0))
+# Query budgets per request / Celery task: exceeding the query count or the duration (seconds)
+# logs a structured slow-request record with the queries by key (0 disables a budget)
+QUERY_BUDGET_REQUEST_COUNT = int(os.environ.get('QUERY_BUDGET_REQUEST_COUNT', 25))
+QUERY_BUDGET_REQUEST_SECONDS = float(os.environ.get('QUERY_BUDGET_REQUEST_SECONDS', 2))
+QUERY_BUDGET_TASK_COUNT = int(os.environ.get('QUERY_BUDGET_TASK_COUNT', 0))
+QUERY_BUDGET_TASK_SECONDS = float(os.environ.get('QUERY_BUDGET_TASK_SECONDS', 120))
+# Directories of prometheus_client multiprocess files merged by /metrics (one per service)
+METRICS_COLLECT_DIRS = [d.strip() for d in os.environ.get('METRICS_COLLECT_DIRS', os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')).split(',') if d.strip()]
 OFFLINE_BACKUP_DIR = os.environ.get('OFFLINE_BACKUP_DIR', '/app/pdfs')
+# Per-patient content hashes used to skip re-rendering unchanged charts. Kept outside
+# OFFLINE_BACKUP_DIR, which is replicated to the ward workstations
+BACKUP_MANIFEST_DIR = os.environ.get('BACKUP_MANIFEST_DIR', '/app/data/backup_manifest')
+# Stale backup PDFs are kept, with a warning, when a census would remove more than this
+# fraction of them (likely a failed query rather than discharges; 1 disables the check)
+BACKUP_MAX_REMOVED_FRACTION = float(os.environ.get('BACKUP_MAX_REMOVED_FRACTION', 0.5))
+# Additional single-document booklets per 'room' and/or 'specialty' (comma-separated; empty disables them)
+BACKUP_BOOKLETS = [m.strip() for m in os.environ.get('BACKUP_BOOKLETS', '').split(',') if m.strip() in ('room', 'specialty')]
+# WeasyPrint output profile of the backup PDFs: 'default' or 'compact' (downsampled, recompressed
+# images: smaller files for more render CPU). Changing it re-renders the backup.
+BACKUP_PDF_PROFILE = os.environ.get('BACKUP_PDF_PROFILE', 'default').lower()
+# Write <OFFLINE_BACKUP_DIR>/index.html, a static page (works from file://) to search the backup PDFs
+BACKUP_OFFLINE_INDEX = os.environ.get('BACKUP_OFFLINE_INDEX', 'True').lower() in ['true', '1']
+# generate_pdf_view serves the backup PDF of a patient, instead of rendering it, when the backup
+# wrote or confirmed it within this many seconds (0 always renders)
+BACKUP_PDF_MAX_AGE = int(os.environ.get('BACKUP_PDF_MAX_AGE', BACKUP_INTERVAL_SECONDS))
+# nginx internal location aliasing OFFLINE_BACKUP_DIR: backup PDFs are then sent by nginx
+# (X-Accel-Redirect) instead of through the Python worker (empty: served by Django)
+BACKUP_PDF_ACCEL_PREFIX = os.environ.get('BACKUP_PDF_ACCEL_PREFIX', '')
+# On-demand PDF jobs (status JSON and rendered PDF), shared by the web and Celery containers
+# (outside OFFLINE_BACKUP_DIR: they are not part of the backup)
+PDF_JOBS_DIR = os.environ.get('PDF_JOBS_DIR', '/app/data/pdf_jobs')
+# nginx internal location aliasing PDF_JOBS_DIR, like BACKUP_PDF_ACCEL_PREFIX (empty: served by Django)
+PDF_JOBS_ACCEL_PREFIX = os.environ.get('PDF_JOBS_ACCEL_PREFIX', '')
+# Seconds an on-demand PDF job (and its PDF) is kept
+PDF_JOB_TTL = int(os.environ.get('PDF_JOB_TTL', 3600))
+# Seconds an on-demand PDF job may stay queued or running before it is reported as failed
+PDF_JOB_TIMEOUT = int(os.environ.get('PDF_JOB_TIMEOUT', 300))
+# One JSON line per completed backup cycle (duration, throughput, failures); outside
+# OFFLINE_BACKUP_DIR, which is replicated to the workstations
+BACKUP_REPORT_PATH = os.environ.get('BACKUP_REPORT_PATH', '/app/data/backup_cycles.jsonl')
 LOG_PATH = os.environ.get('LOG_PATH', '/app/logs')
 
 # --- Authentication Settings ---
@@ -12,11 +12,21 @@ urlpatterns = [
     # API Endpoints
     path('api/recent_patients_api/', views.recent_patients_api, name='recent_patients_api'),
     path('api/patient_info/', views.patient_info_api, name='patient_info_api'),
+    path('api/patient/', views.patient_header_api, name='patient_header_api'),
+    path('api/patient/<str:patient_id_str>/<str:section>/', views.patient_section_api, name='patient_section_api'),
+    path('api/patient_search/', views.patient_search_api, name='patient_search_api'),
     path('api/all_patients/', views.all_patients_api, name='all_patients_api'),
+    path('api/census/export/', views.census_export_api, name='census_export_api'),
     
     # PDF Generation
     path('generate_pdf/<str:patient_id_str>/', views.generate_pdf_view, name='generate_patient_pdf'),
+    path('api/pdf_jobs/', views.pdf_job_create_api, name='pdf_job_create_api'),
+    path('api/pdf_jobs/<str:job_id>/', views.pdf_job_status_api, name='pdf_job_status_api'),
+    path('pdf_jobs/<str:job_id>/pdf/', views.pdf_job_download_view, name='pdf_job_download'),
     
+    # Monitoring (Prometheus)
+    path('metrics', views.metrics_view, name='metrics'),
+
     # Auth
     path('accounts/', include('django.contrib.auth.urls')), 
 ]
\ No newline at end of file
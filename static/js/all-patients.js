@@ -10,6 +10,15 @@ document.addEventListener("DOMContentLoaded", () => {
 
     let currentPage = 1;
     const limit = 10; 
+    // Keyset pagination: cursors[n] fetches page n + 1; the total comes with the first page
+    let cursors = [""];
+    let totalPages = 1;
+
+    function resetPagination() {
+        currentPage = 1;
+        cursors = [""];
+        totalPages = 1;
+    }
 
     async function fetchPatients() {
         const searchQuery = searchInput.value.trim();
@@ -17,7 +26,8 @@ document.addEventListener("DOMContentLoaded", () => {
         const sortOrder = sortOrderSelect.value;
 
         // The API URL is loaded from the relative path
-        const url = `/api/all_patients/?page=${currentPage}&limit=${limit}&sort_by=${sortBy}&sort_order=${sortOrder}&search=${encodeURIComponent(searchQuery)}`; 
+        const cursor = cursors[currentPage - 1] || "";
+        const url = `/api/all_patients/?pagination=cursor&cursor=${encodeURIComponent(cursor)}&limit=${limit}&sort_by=${sortBy}&sort_order=${sortOrder}&search=${encodeURIComponent(searchQuery)}`; 
 
         try {
             patientsTableBody.innerHTML = `<tr><td colspan="8" class="text-center">Loading...</td></tr>`;
@@ -25,11 +35,12 @@ document.addEventListener("DOMContentLoaded", () => {
             nextBtn.disabled = true;
             paginationInfo.textContent = 'Loading...'; 
 
-            const response = await fetch(url);
+            // Revalidate the browser's copy (If-None-Match): unchanged pages come back as an empty 304
+            const response = await fetch(url, { cache: "no-cache" });
 
              if (response.status === 404) {
                  renderError("API not found (404). Check the API URL in JavaScript and urls.py.");
-                 updatePagination(1, 1); 
+                 updatePagination(1, 1, false); 
                  return;
              }
 
@@ -37,16 +48,22 @@ document.addEventListener("DOMContentLoaded", () => {
 
             if (response.ok) { 
                 renderPatients(data.patients); 
-                updatePagination(data.page, data.total_pages);
+                if (data.total_pages !== undefined) {
+                    totalPages = data.total_pages;
+                }
+                if (data.has_more) {
+                    cursors[currentPage] = data.next_cursor;
+                }
+                updatePagination(currentPage, totalPages, data.has_more);
             } else { 
                 console.error("API Error:", data); 
                 renderError(data.error || `Error ${response.status} fetching patients.`);
-                updatePagination(1, 1); 
+                updatePagination(1, 1, false); 
             }
         } catch (error) {
             console.error("Fetch request error:", error);
             renderError("Network error or error processing response.");
-            updatePagination(1, 1); 
+            updatePagination(1, 1, false); 
         }
     }
 
@@ -66,8 +83,6 @@ document.addEventListener("DOMContentLoaded", () => {
             const dataEntrada = patient.data_entrada || 'N/A';
             const ultimoDiario = patient.ultimo_diario || 'No records'; 
 
-            const pdfUrl = `/generate_pdf/${idUtente}/`; 
-            
             // UPDATED: Corrected navigation URL to /info-patient/
             const patientUrl = `/info-patient/?id=${idUtente}`;
 
@@ -81,7 +96,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     <td class="diario"><div class='diario-content'>${ultimoDiario}</div></td>
                     <td>
                         <button class="btn btn-sm btn-pdf"
-                             onclick="window.open('${pdfUrl}', '_blank')">
+                             onclick="generatePdf('${idUtente}')">
                             <i class="bi bi-file-earmark-pdf me-1"></i> Generate PDF
                         </button>
                     </td>
@@ -95,12 +110,12 @@ document.addEventListener("DOMContentLoaded", () => {
         patientsTableBody.innerHTML = `<tr><td colspan="8" class="text-center text-danger">${message}</td></tr>`;
     }
 
-    function updatePagination(page, totalPages) {
+    function updatePagination(page, totalPages, hasMore) {
          const currentPageNum = Number(page) || 1; 
-         const maxPages = Math.max(1, Number(totalPages) || 1); 
+         const maxPages = Math.max(currentPageNum, Number(totalPages) || 1); 
         paginationInfo.textContent = `Page ${currentPageNum} of ${maxPages}`;
         prevBtn.disabled = currentPageNum <= 1;
-        nextBtn.disabled = currentPageNum >= maxPages;
+        nextBtn.disabled = !hasMore;
     }
 
     prevBtn.addEventListener("click", () => {
@@ -111,6 +126,9 @@ document.addEventListener("DOMContentLoaded", () => {
     });
 
     nextBtn.addEventListener("click", () => {
+        if (!cursors[currentPage]) {
+            return;
+        }
         currentPage++;
         fetchPatients();
     });
@@ -120,18 +138,18 @@ document.addEventListener("DOMContentLoaded", () => {
     searchInput.addEventListener('input', () => {
         clearTimeout(searchTimeout);
         searchTimeout = setTimeout(() => {
-            currentPage = 1; 
+            resetPagination(); 
             fetchPatients();
         }, 300); // 300ms delay
     });
 
     sortBySelect.addEventListener('change', () => {
-        currentPage = 1;
+        resetPagination();
         fetchPatients();
     });
 
     sortOrderSelect.addEventListener('change', () => {
-        currentPage = 1;
+        resetPagination();
         fetchPatients();
     });
 
@@ -4,4 +4,69 @@ document.getElementById("toggle-btn").addEventListener("click", function () {
 
       const title = document.getElementById("sidebar-title");
       title.style.display = sidebar.classList.contains("collapsed") ? "none" : "block";
-  });
\ No newline at end of file
+  });
+
+// Show the "data as of" banner when an API response was served from the local census replica
+const originalFetch = window.fetch;
+window.fetch = async function (...args) {
+    const response = await originalFetch.apply(this, args);
+    if (response.headers.get("X-Data-Source") === "replica") {
+        const banner = document.getElementById("data-as-of-banner");
+        if (banner) {
+            document.getElementById("data-as-of-time").textContent = response.headers.get("X-Data-As-Of") || "";
+            banner.classList.remove("d-none");
+        }
+    }
+    return response;
+};
+
+// "Generate PDF": enqueue a PDF job, poll its status, then open the PDF.
+// The window is opened right away (inside the click) so popup blockers allow it.
+function getCsrfToken() {
+    const cookie = document.cookie.split("; ").find((c) => c.startsWith("csrftoken="));
+    if (cookie) return decodeURIComponent(cookie.split("=")[1]);
+    const input = document.querySelector("input[name=csrfmiddlewaretoken]");
+    return input ? input.value : "";
+}
+
+const PDF_JOB_POLL_MS = 1000;
+// Polling stops this long after the server-side job timeout (`timeout` in the job, seconds)
+const PDF_JOB_POLL_GRACE_MS = 30000;
+const PDF_JOB_STAGES = { loading: "Loading patient data", rendering: "Rendering PDF" };
+
+async function generatePdf(patientId) {
+    const win = window.open("", "_blank");
+    const showMessage = (text) => {
+        if (win && !win.closed) win.document.body.innerHTML = `<p style="font-family: sans-serif">${text}</p>`;
+    };
+    showMessage("Queued...");
+
+    try {
+        const response = await fetch("/api/pdf_jobs/", {
+            method: "POST",
+            headers: { "X-CSRFToken": getCsrfToken(), "Content-Type": "application/x-www-form-urlencoded" },
+            body: new URLSearchParams({ patient_id: patientId }),
+        });
+        let job = await response.json();
+        if (!response.ok) throw new Error(job.error || `HTTP ${response.status}`);
+
+        const deadline = Date.now() + (job.timeout || 300) * 1000 + PDF_JOB_POLL_GRACE_MS;
+        while (job.status !== "done") {
+            if (job.status === "failed") throw new Error(job.error || "PDF generation failed.");
+            if (Date.now() > deadline) throw new Error("PDF generation timed out. Please try again later.");
+            showMessage(`${PDF_JOB_STAGES[job.stage] || "Queued"}... (${job.progress || 0}%)`);
+            await new Promise((resolve) => setTimeout(resolve, PDF_JOB_POLL_MS));
+            const status = await fetch(job.status_url, { cache: "no-store" });
+            job = await status.json();
+            if (!status.ok) throw new Error(job.error || `HTTP ${status.status}`);
+        }
+        if (win && !win.closed) {
+            win.location = job.download_url;
+        } else {
+            window.open(job.download_url, "_blank");
+        }
+    } catch (error) {
+        console.error("Error generating PDF:", error);
+        showMessage(`Error generating PDF: ${error.message}`);
+    }
+}
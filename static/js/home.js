@@ -1,5 +1,6 @@
 document.addEventListener("DOMContentLoaded", () => {
-    fetch('/api/recent_patients_api/')
+    // Revalidate the browser's copy (If-None-Match): an unchanged list comes back as an empty 304
+    fetch('/api/recent_patients_api/', { cache: "no-cache" })
         .then(response => response.json())
         .then(data => {
             const tableBody = document.getElementById("recentPatientsTableBody");
@@ -14,7 +15,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     <td>${paciente.sala || '-'}</td>
                     <td>${paciente.cama || '-'}</td>
                     <td>
-                        <button class="btn btn-sm btn-pdf" onclick="window.open('/generate_pdf/${paciente.episode_id}', '_blank')">Generate PDF</button>
+                        <button class="btn btn-sm btn-pdf" onclick="generatePdf('${paciente.episode_id}')">Generate PDF</button>
                     </td>
                 `;
                 tableBody.appendChild(row);
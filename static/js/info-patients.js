@@ -22,6 +22,35 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    // Typeahead: suggest matching patients (the value of a suggestion is the episode ID)
+    const suggestions = document.getElementById("patient-suggestions");
+    let suggestTimeout;
+    searchInput.addEventListener("input", () => {
+        clearTimeout(suggestTimeout);
+        const query = searchInput.value.trim();
+        if (!suggestions || query.length < 2 || /^\d+$/.test(query)) {
+            return;
+        }
+        suggestTimeout = setTimeout(async () => {
+            try {
+                const response = await fetch(`/api/patient_search/?q=${encodeURIComponent(query)}&limit=10`);
+                if (!response.ok) {
+                    return;
+                }
+                const data = await response.json();
+                suggestions.innerHTML = "";
+                (data.results || []).forEach(patient => {
+                    const option = document.createElement("option");
+                    option.value = patient.episode_id;
+                    option.label = `${patient.patient_name} (Room ${patient.sala || '-'}, Bed ${patient.cama || '-'})`;
+                    suggestions.appendChild(option);
+                });
+            } catch (error) {
+                console.error("Typeahead request error:", error);
+            }
+        }, 150);
+    });
+
      searchInput.addEventListener("keypress", function(event) {
         if (event.key === "Enter") {
             event.preventDefault(); 
@@ -29,16 +58,26 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    // Items per page of the sections loaded page by page ("Load more")
+    const SECTION_PAGE_SIZE = 20;
+    // Incremented for every patient shown, so late section responses of a previous patient are dropped
+    let patientGeneration = 0;
+
     async function fetchPatient(searchQuery) {
         renderLoading();
-        const url = `/api/patient_info/?search=${encodeURIComponent(searchQuery)}`;
+        const url = `/api/patient/?search=${encodeURIComponent(searchQuery)}`;
 
         try {
-            const response = await fetch(url);
+            // Header first: the sections are loaded lazily once it is on screen
+            const response = await fetch(url, { cache: "no-cache" });
             const data = await response.json();
 
             if (response.ok) {
-                renderPatient(data); 
+                const generation = ++patientGeneration;
+                renderPatient(data);
+                (data.sections || []).forEach(section => {
+                    loadSection(data.episode_id, section, (data.paginated_sections || []).includes(section), generation);
+                });
 
             } else {
                 console.error("API Error:", data);
@@ -50,6 +89,70 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    // How each section is shown: the element it fills and the function building its HTML from all the items loaded so far
+    const SECTION_RENDERERS = {
+        telefone: { target: "section-telefone", render: items => formatarContactos(items[0]?.telefone_morada, items[0]?.telemovel) },
+        observacoes: {
+            target: "section-observacoes",
+            render: items => items.map(o => o.observacoes?.trim()).filter(o => o).join(", ") || "No observations registered.",
+        },
+        diagnostico: { target: "section-diagnostico", render: items => items.join(", ") || "No medical diagnosis registered." },
+        antecedentes: { target: "section-antecedentes", render: items => items.join(", ") || "No history registered." },
+        pessoa_signif: {
+            target: "section-pessoa_signif",
+            render: items => items.map(p => p.pessoa_signif?.trim()).filter(p => p).join(", "),
+        },
+        fenomenos: { target: "section-fenomenos", render: generateDiagnosticsCard },
+        medicacao: { target: "section-medicacao", render: generatePrescriptions },
+        analises: { target: "section-analises", render: generateAnalysis },
+        exames: { target: "section-exames", render: generateExams },
+        atitudes_terapeuticas: { target: "section-atitudes_terapeuticas", render: generateTherapeutics },
+        diarios: { target: "section-diarios", render: generateDiaries },
+    };
+
+    async function loadSection(patientId, section, paginated, generation, items = [], offset = 0) {
+        const renderer = SECTION_RENDERERS[section];
+        if (!renderer) {
+            return;
+        }
+        let url = `/api/patient/${encodeURIComponent(patientId)}/${section}/`;
+        if (paginated) {
+            url += `?offset=${offset}&limit=${SECTION_PAGE_SIZE}`;
+        }
+
+        try {
+            const response = await fetch(url, { cache: "no-cache" });
+            const data = await response.json();
+            if (generation !== patientGeneration) {
+                return;
+            }
+            const target = document.getElementById(renderer.target);
+            if (!response.ok) {
+                console.error(`API Error (section ${section}):`, data);
+                target.innerHTML = `<span class="text-warning">Could not be loaded.</span>`;
+                return;
+            }
+
+            const allItems = items.concat(data.items || []);
+            target.innerHTML = renderer.render(allItems);
+            if (data.next_offset !== null && data.next_offset !== undefined) {
+                const button = document.createElement("button");
+                button.className = "btn btn-sm btn-search mb-3";
+                button.textContent = "Load more";
+                button.addEventListener("click", () => {
+                    button.disabled = true;
+                    loadSection(patientId, section, paginated, generation, allItems, data.next_offset);
+                });
+                target.appendChild(button);
+            }
+        } catch (error) {
+            if (generation === patientGeneration) {
+                console.error(`Fetch request error (section ${section}):`, error);
+                document.getElementById(renderer.target).innerHTML = `<span class="text-warning">Could not be loaded.</span>`;
+            }
+        }
+    }
+
     // --- HTML Generation Functions ---
 
     function generatePrescriptions(medicacoes = []) {
@@ -210,6 +313,71 @@ document.addEventListener("DOMContentLoaded", () => {
         </div>`;
     }
     
+    // Helper for formatting contact numbers
+    function formatarContactos(telefone_morada, telemovel) {
+        if (telefone_morada && telemovel) {
+            if (telefone_morada !== telemovel) {
+            return `${telefone_morada} / ${telemovel}`;
+            } else {
+            return telefone_morada;
+            }
+        }
+        return telefone_morada || telemovel || "No phone registered.";
+    }
+
+    // Helper for formatting nursing diagnoses
+    function generateDiagnosticsCard(fenomenos) {
+        if (!fenomenos || fenomenos.length === 0) {
+            return `<p>No nursing diagnoses registered.</p>`;
+        }
+
+        function criarDataManual(dataStr, horaStr) {
+            if (!dataStr || !horaStr) return null;
+            const [dia, mes, ano] = dataStr.split('-').map(Number);
+            const [hora, minuto] = horaStr.split(':').map(Number);
+            return new Date(ano, mes - 1, dia, hora, minuto);
+        }
+
+        function compararDiagnosticos(a, b) {
+            const dataHoraA = criarDataManual(a.dta_fenom, a.hora_fenom);
+            const dataHoraB = criarDataManual(b.dta_fenom, b.hora_fenom);
+            if (!dataHoraA) return 1;
+            if (!dataHoraB) return -1;
+            return dataHoraB - dataHoraA; // Sort descending
+        }
+
+        const fenomenosOrdenados = [...fenomenos].sort(compararDiagnosticos);
+
+        let html = '';
+        fenomenosOrdenados.forEach(fenomeno => {
+            const nomeFenomeno = fenomeno.fenomeno || 'Unknown diagnosis';
+            const definicao = fenomeno.def_fenom || '-';
+            const data = fenomeno.dta_fenom || '-';
+            const hora = fenomeno.hora_fenom || '-';
+
+            html += `
+            <strong class="diagnostico mt-3 mb-2">${nomeFenomeno}</strong>
+            <table class="table table-striped table-sm custom-table-color">
+                <thead>
+                    <tr>
+                        <th>Date</th>
+                        <th>Time</th>
+                        <th>Diagnosis</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    <tr>
+                        <td>${data}</td>
+                        <td>${hora}</td>
+                        <td>${definicao}</td>
+                    </tr>
+                </tbody>
+            </table>`;
+        });
+        return html;
+    }
+
+    // Renders the patient header, with placeholders that `loadSection` fills as each section arrives
     function renderPatient(patient) {
         const patientInfoDiv = document.getElementById("patientInfo");
         patientInfoDiv.innerHTML = '';
@@ -221,94 +389,10 @@ document.addEventListener("DOMContentLoaded", () => {
         const cama = patient.cama || 'N/A';
         const dataEntrada = patient.data_entrada || '---';
         const horaEntrada = patient.hora_entrada || '';
-        const telemovel = patient.telefone?.[0]?.telemovel || 'N/A';
-        const telefone_morada = patient.telefone?.[0]?.telefone_morada || 'N/A';
-
-        const antecedentes = Array.isArray(patient.antecedentes) && patient.antecedentes.length > 0
-            ? patient.antecedentes.join(', ')
-            : 'No history registered.';
-        const diagnostico = Array.isArray(patient.diagnostico) && patient.diagnostico.length > 0
-            ? patient.diagnostico.join(', ')
-            : 'No medical diagnosis registered.';
-        const observacoes = (patient.observacoes?.map(o => o.observacoes?.trim()).filter(o => o) || []).join(", ") ||
-        "No observations registered.";
-        const pessoa_signif = (patient.pessoa_signif?.map(p => p.pessoa_signif?.trim()).filter(p => p) || []).join(", ") ||
-        "";
-
-        // Helper for formatting contact numbers
-        function formatarContactos(telefone_morada, telemovel) {
-            if (telefone_morada && telemovel) {
-                if (telefone_morada !== telemovel) {
-                return `${telefone_morada} / ${telemovel}`;
-                } else {
-                return telefone_morada;
-                }
-            }
-            return telefone_morada || telemovel || "No phone registered.";
-        }
-        
-        // Helper for formatting nursing diagnoses
-        function generateDiagnosticsCard(fenomenos) {
-            if (!fenomenos || fenomenos.length === 0) {
-                return `<p>No nursing diagnoses registered.</p>`;
-            }
-
-            function criarDataManual(dataStr, horaStr) {
-                if (!dataStr || !horaStr) return null;
-                const [dia, mes, ano] = dataStr.split('-').map(Number);
-                const [hora, minuto] = horaStr.split(':').map(Number);
-                return new Date(ano, mes - 1, dia, hora, minuto);
-            }
-
-            function compararDiagnosticos(a, b) {
-                const dataHoraA = criarDataManual(a.dta_fenom, a.hora_fenom);
-                const dataHoraB = criarDataManual(b.dta_fenom, b.hora_fenom);
-                if (!dataHoraA) return 1;
-                if (!dataHoraB) return -1;
-                return dataHoraB - dataHoraA; // Sort descending
-            }
-
-            const fenomenosOrdenados = [...fenomenos].sort(compararDiagnosticos);
-
-            let html = '';
-            fenomenosOrdenados.forEach(fenomeno => {
-                const nomeFenomeno = fenomeno.fenomeno || 'Unknown diagnosis';
-                const definicao = fenomeno.def_fenom || '-';
-                const data = fenomeno.dta_fenom || '-';
-                const hora = fenomeno.hora_fenom || '-';
-
-                html += `
-                <strong class="diagnostico mt-3 mb-2">${nomeFenomeno}</strong>
-                <table class="table table-striped table-sm custom-table-color">
-                    <thead>
-                        <tr>
-                            <th>Date</th>
-                            <th>Time</th>
-                            <th>Diagnosis</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        <tr>
-                            <td>${data}</td>
-                            <td>${hora}</td>
-                            <td>${definicao}</td>
-                        </tr>
-                    </tbody>
-                </table>`;
-            });
-            return html;
-        } 
-
-        // Generate HTML for all sections
-        const telefone = formatarContactos(telefone_morada, telemovel);
-        const fenomenosHtml = generateDiagnosticsCard(patient.fenomenos);
-        const medicacaoHtml = generatePrescriptions(patient.medicacao);
-        const atitudesHtml = generateTherapeutics(patient.atitudes_terapeuticas);
-        const analisesHtml = generateAnalysis(patient.analises);
-        const examesHtml = generateExams(patient.exames);
-        const diariosHtml = generateDiaries(patient.diarios);
 
         const formattedDataEntrada = `${dataEntrada} ${horaEntrada}`.trim();
+        const loadingText = `<span class="text-muted">Loading...</span>`;
+        const loadingCard = `<div class="card p-3 mb-3">${loadingText}</div>`;
 
         // Final patient HTML structure
         const patientHtml = `
@@ -325,23 +409,23 @@ document.addEventListener("DOMContentLoaded", () => {
                     </div>
                     <div class="d-flex align-items-center mb-1">
                         <div><strong>Phone:</strong></div>
-                        <div class="ms-2"><span>${telefone}</span></div>
+                        <div class="ms-2"><span id="section-telefone">${loadingText}</span></div>
                     </div>
                     <div class="d-flex align-items-center mb-1">
                         <div><strong>Observations:</strong></div>
-                        <div class="ms-2"><span>${observacoes}</span></div>
+                        <div class="ms-2"><span id="section-observacoes">${loadingText}</span></div>
                     </div>
                     <div class="d-flex align-items-baseline mb-1">
                         <div><strong>Medical&nbsp;Diagnosis:</strong></div>
-                        <div class="ms-2"><span>${diagnostico}</span></div>
+                        <div class="ms-2"><span id="section-diagnostico">${loadingText}</span></div>
                     </div>
                     <div class="d-flex align-items-baseline mb-1">
                         <div><strong>History:</strong></div>
-                        <div class="ms-2"><span>${antecedentes}</span></div>
+                        <div class="ms-2"><span id="section-antecedentes">${loadingText}</span></div>
                     </div>
                     <div class="d-flex align-items-baseline mb-1">
                         <div><strong>Contact Person:</strong></div>
-                        <div class="ms-2"><span>${pessoa_signif}</span></div>
+                        <div class="ms-2"><span id="section-pessoa_signif">${loadingText}</span></div>
                     </div>
                     <div class="d-flex align-items-center mb-1">
                         <div><strong>Admission Date:</strong></div>
@@ -357,7 +441,7 @@ document.addEventListener("DOMContentLoaded", () => {
                         <div><strong>Bed:</strong></div>
                         <div class="ms-2"><span>${cama}</span></div>
                     </div>
-                    <button class="btn btn-sm btn-search mt-2" id='gerar-pdf-button' onclick="window.open('/generate_pdf/${patientId}', '_blank')">
+                    <button class="btn btn-sm btn-search mt-2" id='gerar-pdf-button' onclick="generatePdf('${patientId}')">
                         <i class="bi bi-file-earmark-pdf me-1"></i> Generate PDF
                     </button>
                 </div>
@@ -366,30 +450,30 @@ document.addEventListener("DOMContentLoaded", () => {
             <div class="additional-info d-flex gap-4">
                 <div class="card-section" style="flex: 0 0 50%; max-width: 50%; max-height: none; overflow-y: visible;">
                     <strong>Nursing Diagnoses</strong>
-                    <div class="card p-3 mb-3">
-                        ${fenomenosHtml}
+                    <div class="card p-3 mb-3" id="section-fenomenos">
+                        ${loadingText}
                     </div>
                 </div>
                 <div class="card-section d-flex flex-column gap-3" style="flex: 0 0 48%; max-width: 48%; max-height: none; overflow-y: visible;">
                     <div>
                         <strong>Medical Prescription</strong>
-                        <div class="data-section" style="max-height: none; overflow-y: visible;">${medicacaoHtml}</div>
+                        <div class="data-section" id="section-medicacao" style="max-height: none; overflow-y: visible;">${loadingCard}</div>
                     </div>
                     <div>
                         <strong>Lab Results</strong>
-                        <div class="data-section" style="max-height: none; overflow-y: visible;">${analisesHtml}</div>
+                        <div class="data-section" id="section-analises" style="max-height: none; overflow-y: visible;">${loadingCard}</div>
                     </div>
                     <div>
                         <strong>Exams</strong>
-                        <div class="data-section" style="max-height: none; overflow-y: visible;">${examesHtml}</div>
+                        <div class="data-section" id="section-exames" style="max-height: none; overflow-y: visible;">${loadingCard}</div>
                     </div>
                     <div>
                         <strong>Therapeutic Interventions</strong>
-                        <div class="data-section" style="max-height: none; overflow-y: visible;">${atitudesHtml}</div>
+                        <div class="data-section" id="section-atitudes_terapeuticas" style="max-height: none; overflow-y: visible;">${loadingCard}</div>
                     </div>
                     <div>
                         <strong>Clinical Diary</strong>
-                        <div class="data-section" style="max-height: none; overflow-y: visible;">${diariosHtml}</div>
+                        <div class="data-section" id="section-diarios" style="max-height: none; overflow-y: visible;">${loadingCard}</div>
                     </div>
                 </div>
             </div>
@@ -399,6 +483,7 @@ document.addEventListener("DOMContentLoaded", () => {
         patientInfoDiv.innerHTML = patientHtml;
     }
 
+
     function renderLoading() {
         const patientInfoDiv = document.getElementById("patientInfo");
         patientInfoDiv.innerHTML = `<div class="d-flex justify-content-center align-items-center p-5">
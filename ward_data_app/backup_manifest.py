@@ -0,0 +1,232 @@
+"""
+Manifest of the offline PDF backup.
+
+Keeps, for every patient in the backup, a hash of the formatted report
+context and the path of the PDF written for it. The backup tasks use it to
+skip re-rendering charts that did not change since the previous cycle and
+to remove the PDFs of patients that are no longer admitted.
+
+The entry of a patient is rewritten (or touched, when the chart did not
+change) every cycle, so its modification time tells how recently the PDF was
+confirmed current: `get_fresh_pdf` lets the web app serve it instead of
+rendering the same report again.
+
+Each patient has its own small JSON entry under `settings.BACKUP_MANIFEST_DIR`,
+so concurrent Celery workers never write to the same file. With ward
+booklets enabled (`settings.BACKUP_BOOKLETS`) the formatted context of each
+patient is kept next to it (`contexts/`) so the booklets can be assembled
+without querying the hospital database again.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from .logging_config import setup_logger
+from .pdf_renderer import PDF_STYLESHEET_PATH, PDF_TEMPLATE_NAME, REPORT_BODY_TEMPLATE_NAME
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+_template_fingerprint = None
+
+
+def _get_template_fingerprint():
+    """
+    Returns a hash of the PDF template and stylesheet sources and of the backup
+    output profile, computed once per process. Including it in the context hash
+    forces a re-render after a layout or profile change.
+    """
+    global _template_fingerprint
+    if _template_fingerprint is None:
+        digest = hashlib.sha256(settings.BACKUP_PDF_PROFILE.encode('utf-8'))
+        for template_name in (PDF_TEMPLATE_NAME, REPORT_BODY_TEMPLATE_NAME):
+            digest.update(getattr(get_template(template_name).template, 'source', '').encode('utf-8'))
+        with open(PDF_STYLESHEET_PATH, 'rb') as f:
+            digest.update(f.read())
+        _template_fingerprint = digest.hexdigest()
+    return _template_fingerprint
+
+
+def context_hash(context):
+    """
+    Returns a stable SHA-256 hash of a formatted report context (see `format_context`).
+    """
+    payload = json.dumps(context, sort_keys=True, default=str)
+    digest = hashlib.sha256(_get_template_fingerprint().encode('ascii'))
+    digest.update(payload.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _entry_path(episode_id):
+    return os.path.join(settings.BACKUP_MANIFEST_DIR, f"{episode_id}.json")
+
+
+def _context_path(episode_id):
+    return os.path.join(settings.BACKUP_MANIFEST_DIR, 'contexts', f"{episode_id}.json")
+
+
+def read_json(path):
+    """Reads a JSON file, returning None if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable backup manifest file {path}: {e}")
+        return None
+
+
+def write_json(path, data):
+    """Atomically writes a JSON file (write to a temporary file, then rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def get_entry(episode_id):
+    """
+    Returns the manifest entry of a patient ({'hash', 'file_path', 'specialty_name',
+    'sala', 'cama', 'patient_name'}), or None.
+    """
+    return read_json(_entry_path(episode_id))
+
+
+def get_context(episode_id):
+    """Returns the formatted context stored for a patient, or None."""
+    return read_json(_context_path(episode_id))
+
+
+def save_entry(episode_id, hash_value, file_path, context):
+    """
+    Atomically writes the manifest entry of a patient and, when ward booklets
+    are enabled, its formatted context.
+    """
+    if settings.BACKUP_BOOKLETS:
+        write_json(_context_path(episode_id), context)
+    else:
+        remove_file(_context_path(episode_id))
+    write_json(_entry_path(episode_id), {
+        'hash': hash_value,
+        'file_path': file_path,
+        'specialty_name': context.get('specialty_name'),
+        'sala': context.get('sala'),
+        'cama': context.get('cama'),
+        'patient_name': context.get('patient_name'),
+    })
+
+
+def touch_entry(episode_id):
+    """Marks the entry of a patient as confirmed current (its PDF was checked and is unchanged)."""
+    try:
+        os.utime(_entry_path(episode_id))
+    except OSError as e:
+        logger.warning(f"Could not touch backup manifest entry of {episode_id}: {e}")
+
+
+def has_pdf(episode_id):
+    """True if the backup has a PDF file for a patient."""
+    entry = get_entry(episode_id)
+    return bool(entry and entry.get('file_path') and os.path.exists(entry['file_path']))
+
+
+def get_fresh_pdf(episode_id, max_age):
+    """
+    Returns the path of the backup PDF of a patient if the backup wrote it,
+    or confirmed it unchanged, at most `max_age` seconds ago. Returns None otherwise.
+    """
+    path = _entry_path(episode_id)
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+    if age > max_age:
+        return None
+    entry = read_json(path)
+    file_path = entry.get('file_path') if entry else None
+    if not file_path or not os.path.isfile(file_path):
+        return None
+    return file_path
+
+
+def iter_entries():
+    """Yields (episode_id, entry) for every patient in the manifest."""
+    try:
+        names = os.listdir(settings.BACKUP_MANIFEST_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        episode_id, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+        entry = get_entry(episode_id)
+        if entry:
+            yield episode_id, entry
+
+
+def is_unchanged(episode_id, hash_value, file_path):
+    """
+    True if the patient's PDF was already written at `file_path` from
+    a context with the same hash (and, with ward booklets enabled, the
+    context was stored).
+    """
+    entry = get_entry(episode_id)
+    return (
+        entry is not None
+        and entry.get('hash') == hash_value
+        and entry.get('file_path') == file_path
+        and os.path.exists(file_path)
+        and (not settings.BACKUP_BOOKLETS or os.path.exists(_context_path(episode_id)))
+    )
+
+
+def remove_file(file_path):
+    """Deletes a backup file if it exists. Returns True if a file was removed."""
+    try:
+        os.remove(file_path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Could not remove backup file {file_path}: {e}")
+        return False
+
+
+def remove_stale_entries(active_episode_ids):
+    """
+    Removes the PDFs and manifest entries of patients that are not in
+    `active_episode_ids` (e.g. discharged). Returns the episode IDs removed.
+
+    An empty census, or one that would remove more than
+    `settings.BACKUP_MAX_REMOVED_FRACTION` of the backup, is more likely a
+    failed or partial query than a mass discharge: nothing is removed then,
+    as the backup is what the wards rely on during an outage.
+    """
+    active = {str(episode_id) for episode_id in active_episode_ids}
+    entries = list(iter_entries())
+    stale = [(episode_id, entry) for episode_id, entry in entries if episode_id not in active]
+    if not stale:
+        return []
+    if not active:
+        logger.warning(f"The census returned no patients; keeping the {len(stale)} backup PDFs.")
+        return []
+    max_fraction = settings.BACKUP_MAX_REMOVED_FRACTION
+    if len(stale) > max_fraction * len(entries):
+        logger.warning(f"The census would remove {len(stale)} of {len(entries)} backup PDFs "
+                       f"(more than {max_fraction:.0%}); keeping them.")
+        return []
+
+    removed = []
+    for episode_id, entry in stale:
+        if entry.get('file_path'):
+            remove_file(entry['file_path'])
+        remove_file(_context_path(episode_id))
+        remove_file(_entry_path(episode_id))
+        removed.append(episode_id)
+    return removed
@@ -0,0 +1,290 @@
+"""
+Benchmarks of the DAL and the PDF pipeline on a synthetic hospital database.
+
+`build_synthetic_hospital` writes a SQLite file with the hospital views the
+queries of `configs/config.sqlite.json` read (the same views and columns as
+`configs/config.json`, without the DB link), filled with deterministic fake
+inpatients and realistic section volumes: a diary entry or two per day of
+stay, ten-odd active prescriptions, nursing diagnoses, attitudes, lab
+results and exams.
+
+`run_benchmarks` times the list page, patient details, formatting and full
+PDF generation on it and returns latency percentiles and throughput per
+operation. The `benchmark` management command runs both for several
+census sizes and stores the results as JSON, so they can be compared
+across commits.
+"""
+import os
+import time
+import random
+import sqlite3
+import datetime
+import tempfile
+import statistics
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+from . import dal
+from .format_utils import format_context
+
+SCHEMA = """
+CREATE TABLE VW_SPECIALTIES (SPECIALTY_CODE TEXT PRIMARY KEY, SPECIALTY_DESCRIPTION TEXT);
+CREATE TABLE VW_PATIENT_IDENTITY (PATIENT_ID INTEGER PRIMARY KEY, PATIENT_NAME TEXT);
+CREATE TABLE VW_INPATIENTS (
+    EPISODE_ID INTEGER PRIMARY KEY, PATIENT_ID INTEGER, SPECIALTY_CODE TEXT, servicoID TEXT,
+    ROOM_CODE TEXT, BED_NUMBER INTEGER, ADMISSION_DATE timestamp, ADMISSION_TIME INTEGER
+);
+CREATE TABLE VW_ADMISSION_NOTES (EPISODE_ID INTEGER, ITEM_CODE TEXT, FIELD_LABEL TEXT, ITEM_VALUE TEXT);
+CREATE TABLE VW_PATIENT_ADDRESSES (PATIENT_ID INTEGER, PHONE_HOME TEXT, PHONE_MOBILE TEXT);
+CREATE TABLE VW_TRANSFERS (EPISODE_ID INTEGER, OBSERVATIONS TEXT, DISCHARGE_DATE timestamp);
+CREATE TABLE VW_SYSTEM_CODES (CODE TEXT PRIMARY KEY, DESCRIPTION_PT TEXT);
+CREATE TABLE VW_NURSING_DIAGNOSES (
+    DIAGNOSIS_ID INTEGER PRIMARY KEY, EPISODE_ID INTEGER, DIAGNOSIS_CODE TEXT,
+    START_DATE timestamp, START_TIME INTEGER, END_DATE timestamp
+);
+CREATE TABLE VW_DIAGNOSIS_STATUS (DIAGNOSIS_ID INTEGER, SPECIFICATION TEXT);
+CREATE TABLE VW_PHARMACY_CODES (MED_ID INTEGER PRIMARY KEY, MED_NAME TEXT);
+CREATE TABLE VW_MEDICATION (
+    EPISODE_ID INTEGER, DOSE TEXT, SCHEDULE TEXT, MED_CODE INTEGER, ROUTE_CODE TEXT,
+    START_DATE timestamp, END_DATE timestamp
+);
+CREATE TABLE VW_ATTITUDE_CODES (SYS_ATTITUDE_ID INTEGER PRIMARY KEY, ATTITUDE_DESCRIPTION TEXT);
+CREATE TABLE VW_THERAPEUTIC_ATTITUDES (
+    EPISODE_ID INTEGER, ATTITUDE_ID INTEGER, SCHEDULE TEXT, MODULE_CODE TEXT, END_DATE timestamp
+);
+CREATE TABLE VW_LAB_CODES (SYS_ANALYSIS_ID INTEGER PRIMARY KEY, ANALYSIS_NAME TEXT);
+CREATE TABLE VW_LAB_RESULTS (
+    EPISODE_ID INTEGER, ANALYSIS_ID INTEGER, START_DATE timestamp, START_TIME INTEGER,
+    MODULE_CODE TEXT, END_DATE timestamp
+);
+CREATE TABLE VW_EXAM_REQUESTS (EXAM_ID INTEGER PRIMARY KEY, EPISODE_ID INTEGER, MODULE_CODE TEXT);
+CREATE TABLE VW_EXAM_REQUEST_LINES (REQUEST_ID INTEGER, DESCRIPTION TEXT);
+CREATE TABLE VW_EXAM_ORDERS (REQUEST_ID INTEGER, SCHEDULE_DATE timestamp, EXAM_DATE timestamp);
+CREATE TABLE VW_CLINICAL_DIARY (EPISODE_ID INTEGER, ENTRY_DATE timestamp, ENTRY_TIME INTEGER, DIARY_TEXT TEXT);
+
+CREATE INDEX IX_INPATIENTS_ADMISSION ON VW_INPATIENTS (ADMISSION_DATE, ADMISSION_TIME);
+CREATE INDEX IX_INPATIENTS_SPECIALTY ON VW_INPATIENTS (servicoID);
+CREATE INDEX IX_ADMISSION_NOTES_EPISODE ON VW_ADMISSION_NOTES (EPISODE_ID);
+CREATE INDEX IX_ADDRESSES_PATIENT ON VW_PATIENT_ADDRESSES (PATIENT_ID);
+CREATE INDEX IX_TRANSFERS_EPISODE ON VW_TRANSFERS (EPISODE_ID);
+CREATE INDEX IX_DIAGNOSES_EPISODE ON VW_NURSING_DIAGNOSES (EPISODE_ID);
+CREATE INDEX IX_DIAGNOSIS_STATUS ON VW_DIAGNOSIS_STATUS (DIAGNOSIS_ID);
+CREATE INDEX IX_MEDICATION_EPISODE ON VW_MEDICATION (EPISODE_ID);
+CREATE INDEX IX_ATTITUDES_EPISODE ON VW_THERAPEUTIC_ATTITUDES (EPISODE_ID);
+CREATE INDEX IX_LAB_RESULTS_EPISODE ON VW_LAB_RESULTS (EPISODE_ID);
+CREATE INDEX IX_EXAM_REQUESTS_EPISODE ON VW_EXAM_REQUESTS (EPISODE_ID);
+CREATE INDEX IX_EXAM_LINES_REQUEST ON VW_EXAM_REQUEST_LINES (REQUEST_ID);
+CREATE INDEX IX_EXAM_ORDERS_REQUEST ON VW_EXAM_ORDERS (REQUEST_ID);
+CREATE INDEX IX_DIARY_EPISODE ON VW_CLINICAL_DIARY (EPISODE_ID, ENTRY_DATE, ENTRY_TIME);
+"""
+
+SPECIALTIES = ['Medicina Interna', 'Cirurgia Geral', 'Ortopedia', 'Cardiologia', 'Neurologia', 'Pneumologia']
+FIRST_NAMES = ['Ana', 'João', 'Maria', 'José', 'Inês', 'António', 'Conceição', 'Luís', 'Fátima', 'Rui', 'Helena', 'Sérgio']
+LAST_NAMES = ['Silva', 'Santos', 'Ferreira', 'Pereira', 'Oliveira', 'Costa', 'Rodrigues', 'Martins', 'Gonçalves', 'Simões']
+DIAGNOSES = ['Risco de queda', 'Dor aguda', 'Integridade cutânea comprometida', 'Autocuidado: higiene dependente',
+             'Ventilação comprometida', 'Confusão', 'Úlcera de pressão', 'Ansiedade']
+MEDICATIONS = ['Paracetamol', 'Enoxaparina', 'Omeprazol', 'Furosemida', 'Amoxicilina + Ácido clavulânico',
+               'Metoclopramida', 'Insulina rápida', 'Tramadol', 'Ceftriaxona', 'Bisoprolol', 'Lactulose', 'Haloperidol']
+ROUTES = [('VIA_PO', 'Oral'), ('VIA_EV', 'Endovenosa'), ('VIA_SC', 'Subcutânea'), ('VIA_IM', 'Intramuscular')]
+ATTITUDES = ['Vigiar sinais vitais', 'Posicionar', 'Avaliar dor', 'Glicemia capilar', 'Balanço hídrico',
+             'Tratamento de ferida', 'Vigiar dejeções', 'Levante']
+ANALYSES = ['Hemograma', 'Bioquímica', 'PCR', 'Ionograma', 'Gasimetria', 'Coagulação', 'Hemocultura']
+EXAMS = ['Radiografia de tórax', 'TAC crânio-encefálica', 'Ecografia abdominal', 'Ecocardiograma', 'ECG']
+SCHEDULES = ['8h', '8-20h', '8-16-24h', '6-12-18-24h', 'SOS', '22h']
+DIARY_SENTENCES = [
+    "Doente consciente, orientado e colaborante.",
+    "Mantém perfusão em curso sem intercorrências.",
+    "Refere dor ligeira no local da incisão, cedeu à analgesia prescrita.",
+    "Apirético durante o turno, sinais vitais estáveis.",
+    "Alimentação oral com boa tolerância, ingeriu a totalidade da refeição.",
+    "Realizado penso à ferida operatória, sem sinais inflamatórios.",
+    "Levante para o cadeirão com ajuda parcial, bem tolerado.",
+    "Diurese espontânea presente, sem queixas urinárias.",
+    "Família informada do plano de cuidados.",
+    "Noite tranquila, dormiu por períodos.",
+    "Glicemias capilares dentro dos valores de referência.",
+    "Mantém vigilância do risco de queda com grades elevadas.",
+]
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def build_synthetic_hospital(path, patients, seed=42, today=None):
+    """
+    Writes a synthetic hospital database with `patients` inpatients to the
+    SQLite file `path` (replacing it). Same `seed`, same data. Returns the
+    number of rows written per table.
+    """
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    now = datetime.datetime.combine(today, datetime.time(12, 0))
+    if os.path.exists(path):
+        os.remove(path)
+
+    rows = {}
+
+    def add(table, *values):
+        rows.setdefault(table, []).append(values)
+
+    for index, name in enumerate(SPECIALTIES, start=1):
+        add('VW_SPECIALTIES', f"ESP{index:02d}", name)
+    for index, name in enumerate(DIAGNOSES, start=1):
+        add('VW_SYSTEM_CODES', f"DIAG{index:02d}", name)
+    for code, name in ROUTES:
+        add('VW_SYSTEM_CODES', code, name)
+    for index, name in enumerate(MEDICATIONS, start=1):
+        add('VW_PHARMACY_CODES', index, name)
+    for index, name in enumerate(ATTITUDES, start=1):
+        add('VW_ATTITUDE_CODES', index, name)
+    for index, name in enumerate(ANALYSES, start=1):
+        add('VW_LAB_CODES', index, name)
+
+    diagnosis_id = exam_id = 0
+    history_code = dal._get_config_value('parameters.ainicial_antecedentes_item', 'HISTORY_CODE')
+    diagnosis_code = dal._get_config_value('parameters.ainicial_diagnostico_item', 'DIAGNOSIS_CODE')
+    for number in range(1, patients + 1):
+        episode_id = 20000000 + number
+        patient_id = 500000 + number
+        specialty = f"ESP{rng.randint(1, len(SPECIALTIES)):02d}"
+        stay_days = min(int(rng.expovariate(1 / 9)) + 1, 90)
+        admitted = now - datetime.timedelta(days=stay_days - 1, hours=rng.randint(0, 11))
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+        add('VW_PATIENT_IDENTITY', patient_id, name)
+        add('VW_INPATIENTS', episode_id, patient_id, specialty, specialty, f"{specialty[-2:]}{rng.randint(1, 12):02d}",
+            rng.randint(1, 6), _timestamp(admitted.replace(hour=0, minute=0, second=0)), rng.randint(0, 86399))
+        add('VW_ADMISSION_NOTES', episode_id, history_code, 'Antecedentes', 'HTA; DM tipo 2; Dislipidemia.')
+        add('VW_ADMISSION_NOTES', episode_id, diagnosis_code, 'Diagnóstico', f"{rng.choice(DIAGNOSES)}.")
+        add('VW_ADMISSION_NOTES', episode_id, 'PERSON_CODE', 'Nome', f"{rng.choice(FIRST_NAMES)} (filha)")
+        add('VW_PATIENT_ADDRESSES', patient_id, f"2{rng.randint(10000000, 99999999)}", f"9{rng.randint(10000000, 99999999)}")
+        add('VW_TRANSFERS', episode_id, 'Sem observações relevantes.' if rng.random() < 0.7 else 'Alergia à penicilina.', None)
+
+        for _ in range(rng.randint(2, 8)):
+            diagnosis_id += 1
+            started = admitted + datetime.timedelta(hours=rng.randint(0, stay_days * 24))
+            add('VW_NURSING_DIAGNOSES', diagnosis_id, episode_id, f"DIAG{rng.randint(1, len(DIAGNOSES)):02d}",
+                _timestamp(started), rng.randint(0, 86399), None)
+            add('VW_DIAGNOSIS_STATUS', diagnosis_id, rng.choice(['Presente', 'Em melhoria', 'Mantém']))
+        for _ in range(rng.randint(6, 18)):
+            # Prescribed during the stay; about one in five already stopped
+            started = min(admitted + datetime.timedelta(hours=rng.randint(0, stay_days * 24)), now)
+            stopped = started + (now - started) * rng.random() if rng.random() < 0.2 else None
+            add('VW_MEDICATION', episode_id, f"{rng.choice([1, 2, 20, 40, 500, 1000])} mg", rng.choice(SCHEDULES),
+                rng.randint(1, len(MEDICATIONS)), rng.choice(ROUTES)[0], _timestamp(started),
+                stopped and _timestamp(stopped))
+        for _ in range(rng.randint(3, 10)):
+            add('VW_THERAPEUTIC_ATTITUDES', episode_id, rng.randint(1, len(ATTITUDES)), rng.choice(SCHEDULES), 'INT', None)
+        for _ in range(rng.randint(1, 6)):
+            add('VW_LAB_RESULTS', episode_id, rng.randint(1, len(ANALYSES)),
+                _timestamp(now - datetime.timedelta(days=rng.randint(0, stay_days - 1))), rng.randint(0, 86399), 'INT', None)
+        for _ in range(rng.randint(0, 3)):
+            exam_id += 1
+            add('VW_EXAM_REQUESTS', exam_id, episode_id, 'INT')
+            add('VW_EXAM_REQUEST_LINES', exam_id, rng.choice(EXAMS))
+            add('VW_EXAM_ORDERS', exam_id, _timestamp(now + datetime.timedelta(days=rng.randint(0, 5))), None)
+        # One to three diary entries per day of stay (one per shift at most)
+        for day in range(stay_days):
+            entry_date = _timestamp(datetime.datetime.combine(today - datetime.timedelta(days=day), datetime.time()))
+            for shift in rng.sample([8 * 3600, 16 * 3600, 23 * 3600], rng.randint(1, 3)):
+                text = ' '.join(rng.sample(DIARY_SENTENCES, rng.randint(3, 8)))
+                add('VW_CLINICAL_DIARY', episode_id, entry_date, shift + rng.randint(0, 3599), text)
+
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        for table, values in rows.items():
+            placeholders = ', '.join('?' * len(values[0]))
+            connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", values)
+        connection.commit()
+    finally:
+        connection.close()
+    return {table: len(values) for table, values in rows.items()}
+
+
+def use_hospital_database(path):
+    """Points the 'hospital' alias of this process to another SQLite file."""
+    connection = connections['hospital']
+    connection.settings_dict['NAME'] = path
+    connection.close()
+
+
+def _measure(func, inputs):
+    """Calls `func` once per input. Returns latency percentiles (ms) and throughput."""
+    durations = []
+    for value in inputs:
+        started = time.perf_counter()
+        func(value)
+        durations.append(time.perf_counter() - started)
+    if not durations:
+        return {'iterations': 0}
+    durations_ms = sorted(d * 1000 for d in durations)
+    total = sum(durations)
+    return {
+        'iterations': len(durations),
+        'ops_per_second': round(len(durations) / total, 2) if total else None,
+        'mean_ms': round(statistics.fmean(durations_ms), 3),
+        'p50_ms': round(durations_ms[len(durations_ms) // 2], 3),
+        'p95_ms': round(durations_ms[min(len(durations_ms) - 1, int(len(durations_ms) * 0.95))], 3),
+        'max_ms': round(durations_ms[-1], 3),
+    }
+
+
+def _average_pdf_size(pdf_dir):
+    """Average size of the PDFs written under `pdf_dir`."""
+    sizes = [os.path.getsize(os.path.join(root, name))
+             for root, _, names in os.walk(pdf_dir) for name in names if name.endswith('.pdf')]
+    return round(sum(sizes) / len(sizes)) if sizes else 0
+
+
+def run_benchmarks(patients, samples=50, pdf_samples=10, seed=42):
+    """
+    Times the DAL and the PDF pipeline against the current 'hospital' database
+    (holding `patients` inpatients). The query cache is bypassed, so every
+    call reaches the database. Returns the stats per operation.
+    """
+    from .pdf_renderer import PDF_PROFILES, WEASYPRINT_AVAILABLE
+    from .tasks import generate_patient_pdf
+
+    rng = random.Random(seed)
+    page_size = 25
+    last_page = max(1, -(-patients // page_size))
+    results = {}
+
+    with dal.force_live_reads(), dal.bypass_query_cache():
+        patient_ids = [str(pid) for pid in dal.get_all_patient_ids()]
+        sample_ids = rng.sample(patient_ids, min(samples, len(patient_ids)))
+
+        pages = [rng.randint(1, last_page) for _ in range(samples)]
+        results['get_paginated_patient_list'] = _measure(
+            lambda page: dal.get_paginated_patient_list(page, page_size), pages)
+
+        details = {}
+
+        def fetch_details(patient_id):
+            details[patient_id] = dal.get_patient_details_all(patient_id, specialty_id=None)
+        results['get_patient_details_all'] = _measure(fetch_details, sample_ids)
+
+        results['format_context'] = _measure(lambda pid: format_context(details[pid]), sample_ids)
+
+        # Distinct patients, so the backup manifest never skips the render
+        pdf_ids = rng.sample(patient_ids, min(pdf_samples, len(patient_ids)))
+        for profile in PDF_PROFILES:
+            name = 'generate_patient_pdf' if profile == 'default' else f'generate_patient_pdf_{profile}'
+            if not WEASYPRINT_AVAILABLE:
+                results[name] = {'iterations': 0, 'skipped': 'WeasyPrint not available'}
+                continue
+            with tempfile.TemporaryDirectory() as pdf_dir:
+                with override_settings(OFFLINE_BACKUP_DIR=pdf_dir, BACKUP_MANIFEST_DIR=os.path.join(pdf_dir, '.manifest'),
+                                       BACKUP_PDF_PROFILE=profile):
+                    results[name] = _measure(generate_patient_pdf.run, pdf_ids)
+                    results[name]['avg_pdf_bytes'] = _average_pdf_size(pdf_dir)
+    return results
+
+
+def hospital_is_synthetic():
+    """True if the 'hospital' alias is the SQLite benchmark database (never the real EHR)."""
+    return settings.DB_TYPE == 'sqlite' and connections['hospital'].vendor == 'sqlite'
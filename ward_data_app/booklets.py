@@ -0,0 +1,145 @@
+"""
+Ward booklets for the offline backup.
+
+Besides one PDF per patient, the backup can write one booklet per room
+(and optionally per specialty) that holds every patient report of that
+room in a single document, with an outline entry per bed. Booklets are
+assembled from the formatted contexts kept in the backup manifest and
+rendered in a single WeasyPrint pass each; a booklet is only re-rendered
+when one of its patients changed.
+
+    <Specialty>/00_SPECIALTY_<Specialty>.pdf
+    <Specialty>/<Room>/00_ROOM_<Room>.pdf
+"""
+import os
+import re
+import hashlib
+import logging
+
+from django.conf import settings
+
+from . import backup_manifest, metrics
+from .logging_config import setup_logger
+from .pdf_renderer import get_renderer
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+BOOKLET_MODES = ('room', 'specialty')
+
+
+def _bed_sort_key(entry):
+    """Sorts beds naturally ('2' before '10'), falling back to the text."""
+    bed = str(entry.get('cama') or '')
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', bed)]
+
+
+def _bookmark(entry):
+    return f"Bed {entry.get('cama') or '-'} - {entry.get('patient_name') or ''} ({entry['episode_id']})"
+
+
+def _state_path(file_path):
+    key = hashlib.sha1(file_path.encode('utf-8')).hexdigest()
+    return os.path.join(settings.BACKUP_MANIFEST_DIR, 'booklets', f"{key}.json")
+
+
+def _collect_booklets(modes):
+    """
+    Groups the manifest entries into booklets. Returns
+    {booklet_path: (title, [(room_name, [entries sorted by bed])], nested)},
+    where `nested` booklets (per specialty) have an outline level per room.
+    """
+    rooms = {}
+    for episode_id, entry in backup_manifest.iter_entries():
+        if entry.get('file_path'):
+            entry['episode_id'] = episode_id
+            rooms.setdefault(os.path.dirname(entry['file_path']), []).append(entry)
+
+    booklets = {}
+    for room_dir in sorted(rooms):
+        entries = sorted(rooms[room_dir], key=_bed_sort_key)
+        room_name = os.path.basename(room_dir)
+        specialty_dir = os.path.dirname(room_dir)
+        specialty_name = os.path.basename(specialty_dir)
+        if 'room' in modes:
+            path = os.path.join(room_dir, f"00_ROOM_{room_name}.pdf")
+            booklets[path] = (f"{specialty_name} - Room {room_name}", [(room_name, entries)], False)
+        if 'specialty' in modes:
+            path = os.path.join(specialty_dir, f"00_SPECIALTY_{specialty_name}.pdf")
+            booklets.setdefault(path, (specialty_name, [], True))[1].append((room_name, entries))
+    return booklets
+
+
+def _booklet_hash(groups):
+    """Hashes the member patients' report hashes, so unchanged booklets are skipped."""
+    digest = hashlib.sha256()
+    for room_name, entries in groups:
+        digest.update(room_name.encode('utf-8'))
+        for entry in entries:
+            digest.update(f"{entry['episode_id']}:{entry.get('hash')};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _render_booklet(file_path, title, groups, nested, base_url):
+    """Renders one booklet and writes it to `file_path`. Returns the bytes written (0 if it has no reports)."""
+    reports = []
+    for room_name, entries in groups:
+        for position, entry in enumerate(entries):
+            context = backup_manifest.get_context(entry['episode_id'])
+            if not context:
+                continue
+            reports.append({
+                'context': context,
+                'bookmark': _bookmark(entry),
+                'level': 2 if nested else 1,
+                # In specialty booklets, each room opens with its own outline entry
+                'group_title': f"Room {room_name}" if nested and position == 0 else None,
+            })
+    if not reports:
+        return 0
+
+    pdf_bytes = get_renderer().render_booklet(title, reports, base_url, profile=settings.BACKUP_PDF_PROFILE)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, file_path)
+    metrics.BACKUP_BYTES_WRITTEN.labels('booklet').inc(len(pdf_bytes))
+    return len(pdf_bytes)
+
+
+def generate_booklets(modes, base_url):
+    """
+    Writes the room and/or specialty booklets (`modes`, see `BOOKLET_MODES`)
+    for the patients currently in the backup manifest, and removes booklets
+    that no longer have patients. Returns the counts of rendered, skipped
+    (unchanged) and removed booklets and the bytes written.
+    """
+    counts = {'rendered': 0, 'skipped': 0, 'removed': 0, 'bytes_written': 0}
+    booklets = _collect_booklets(modes)
+
+    for file_path, (title, groups, nested) in booklets.items():
+        hash_value = _booklet_hash(groups)
+        state = backup_manifest.read_json(_state_path(file_path))
+        if state and state.get('hash') == hash_value and os.path.exists(file_path):
+            counts['skipped'] += 1
+            continue
+        try:
+            bytes_written = _render_booklet(file_path, title, groups, nested, base_url)
+            if bytes_written:
+                backup_manifest.write_json(_state_path(file_path), {'hash': hash_value, 'file_path': file_path})
+                counts['rendered'] += 1
+                counts['bytes_written'] += bytes_written
+        except Exception as e:
+            logger.error(f"Error generating booklet {file_path}: {e}", exc_info=True)
+
+    # Remove the booklets of rooms and specialties that are now empty
+    state_dir = os.path.join(settings.BACKUP_MANIFEST_DIR, 'booklets')
+    for name in os.listdir(state_dir) if os.path.isdir(state_dir) else []:
+        state = backup_manifest.read_json(os.path.join(state_dir, name)) or {}
+        if state.get('file_path') not in booklets:
+            if state.get('file_path'):
+                backup_manifest.remove_file(state['file_path'])
+            backup_manifest.remove_file(os.path.join(state_dir, name))
+            counts['removed'] += 1
+
+    return counts
@@ -0,0 +1,14 @@
+"""
+Template context processors of the `ward_data_app` application.
+"""
+from . import dal, replica
+
+
+def data_source(request):
+    """
+    In the 'replica' read mode, adds the time of the replica data
+    (`data_as_of`) so every page shows the "data as of" watermark.
+    """
+    if dal.get_read_mode() != 'replica':
+        return {}
+    return {'data_as_of': replica.format_as_of(replica.get_synced_at())}
@@ -5,14 +5,27 @@ This module abstracts all database interaction, providing a consistent
 interface for the rest of the application. It is configured via
 `settings.HOSPITAL_CONFIG` to support different DBMS and data schemas.
 """
+import os
+import json
+import base64
+import time
 import logging
+import datetime
+import inspect
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from decimal import Decimal, InvalidOperation
 
 from django.conf import settings
-from django.db import connections
+from django.db import Error as DatabaseDriverError, connections
 from django.http import Http404
 
-from .utils import dictfetchall, dictfetchone, format_hour, safe_strftime
+from . import metrics, name_index, query_trace
+from .query_cache import QueryCache
+from .records import ColumnPlan
+from .utils import dictfetchall, dictfetchone, dictiter, tuplefetchall, format_hour, safe_strftime, to_datetime
 from .logging_config import setup_logger
 
 logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
@@ -40,10 +53,20 @@ def _get_config_value(key_path, default=None):
         return default
 
 
-def _execute_query(sql_key=None, params=None, fetch_one=False, sql=None):
+def _execute_query(sql_key=None, params=None, fetch_one=False, sql=None, use_cache=True, as_tuples=False, stream=False):
     """
     Single entry point for query execution, ensuring centralized management
     of connections, cursors, and exception handling.
+
+    `sql_key` names the configured query; when `sql` is also given (a query
+    built dynamically from that key), it is used instead of the configured
+    text. Results of keys with a TTL in the `cache` config section are served
+    from the per-process query cache unless `use_cache` is False or the call
+    runs inside `bypass_query_cache()`.
+
+    With `as_tuples`, all rows are returned as `(column_names, row_tuples)`
+    instead of dictionaries (for `ColumnPlan` extractors). With `stream`, a
+    generator of row dictionaries is returned instead of a list (never cached).
     """
     if sql is None:
         sql = _get_config_value(f"queries.{sql_key}")
@@ -54,129 +77,545 @@ def _execute_query(sql_key=None, params=None, fetch_one=False, sql=None):
     if PARAM_STYLE == '?':
         sql = sql.replace('%s', '?')
 
+    if stream:
+        return _stream_query(sql_key, sql, params)
+
+    ttl = _get_cache_ttl(sql_key) if use_cache else 0
+    if ttl > 0:
+        _flush_if_requested()
+        cache_key = (sql_key, sql, tuple(params or []), fetch_one, as_tuples)
+        found, cached = _query_cache.get(cache_key)
+        metrics.DAL_CACHE_LOOKUPS.labels(sql_key, 'hit' if found else 'miss').inc()
+        if found:
+            query_trace.record(sql_key, 0.0, 0, cached=True)
+            return _copy_result(cached)
+
+    label = metrics.query_label(sql_key)
+    started = time.perf_counter()
     try:
         with connections['hospital'].cursor() as cursor:
             cursor.execute(sql, params or [])
-            if fetch_one:
-                return dictfetchone(cursor) # Returns a single dictionary
+            if as_tuples:
+                result = tuplefetchall(cursor) # Returns (column names, list of tuples)
+                rows = len(result[1])
+            elif fetch_one:
+                result = dictfetchone(cursor) # Returns a single dictionary
+                rows = 0 if result is None else 1
             else:
-                return dictfetchall(cursor) # Returns a list of dictionaries
+                result = dictfetchall(cursor) # Returns a list of dictionaries
+                rows = len(result)
     except Exception as e:
+        metrics.DAL_QUERY_ERRORS.labels(label).inc()
         logger.error(f"DAL Error executing query '{sql_key or 'raw SQL'}': {e}", exc_info=True)
         raise
+    elapsed = time.perf_counter() - started
+    metrics.DAL_QUERY_DURATION.labels(label).observe(elapsed)
+    metrics.DAL_QUERY_ROWS.labels(label).inc(rows)
+    query_trace.record(sql_key, elapsed, rows)
+
+    if ttl > 0:
+        metrics.DAL_CACHE_EVICTIONS.inc(_query_cache.set(cache_key, result, ttl))
+        metrics.DAL_CACHE_ENTRIES.set(len(_query_cache))
+        return _copy_result(result)
+    return result
+
+
+def _stream_query(sql_key, sql, params):
+    """
+    Yields the rows of a query as dictionaries, fetched in batches of
+    `settings.DAL_FETCH_BATCH_SIZE` rows. Uses a server-side cursor where the
+    backend supports it (`chunked_cursor`), so the result is never held in
+    memory as a whole. The cursor is closed when the generator is exhausted
+    or closed.
+    """
+    batch_size = getattr(settings, 'DAL_FETCH_BATCH_SIZE', 500)
+    label = metrics.query_label(sql_key)
+    rows = 0
+    elapsed = None
+    try:
+        with connections['hospital'].chunked_cursor() as cursor:
+            started = time.perf_counter()
+            cursor.execute(sql, params or [])
+            elapsed = time.perf_counter() - started
+            metrics.DAL_QUERY_DURATION.labels(label).observe(elapsed)
+            for row in dictiter(cursor, batch_size):
+                rows += 1
+                yield row
+    except Exception as e:
+        metrics.DAL_QUERY_ERRORS.labels(label).inc()
+        logger.error(f"DAL Error streaming query '{sql_key or 'raw SQL'}': {e}", exc_info=True)
+        raise
+    finally:
+        metrics.DAL_QUERY_ROWS.labels(label).inc(rows)
+        if elapsed is not None:
+            query_trace.record(sql_key, elapsed, rows)
 
 
 # -----------------------------------------------------------------------------
-# Data Standardization Functions (`_standardize_*`)
+# Query Result Cache
+#
+# Per-process LRU cache with a TTL per query key, configured in the `cache`
+# section of the config (`default_ttl`, `max_entries`, `ttl.<query_key>`).
+# A TTL of 0 (the default) disables caching for that key. `flush_query_cache`
+# clears the caches of every process through `settings.QUERY_CACHE_FLUSH_FILE`.
+# -----------------------------------------------------------------------------
+
+_cache_config = _get_config_value('cache', {})
+_query_cache = QueryCache(max_entries=_cache_config.get('max_entries', 512))
+_cache_state = threading.local()
+# Seconds between checks of the flush file, and the last modification time seen
+_FLUSH_CHECK_INTERVAL = 1.0
+_flush_state = {'checked_at': 0.0, 'mtime': None}
+
+
+def _get_cache_ttl(sql_key):
+    if not sql_key or getattr(_cache_state, 'bypass', False):
+        return 0
+    return _cache_config.get('ttl', {}).get(sql_key, _cache_config.get('default_ttl', 0))
+
+def _copy_result(result):
+    """Copies cached rows so callers can never mutate the cached values."""
+    if result is None:
+        return None
+    if isinstance(result, tuple):
+        # (columns, row tuples): the rows themselves are immutable
+        columns, rows = result
+        return columns, list(rows)
+    if isinstance(result, dict):
+        return dict(result)
+    return [dict(row) for row in result]
+
+@contextmanager
+def bypass_query_cache():
+    """Within this block, queries of the current thread skip the query cache."""
+    previous = getattr(_cache_state, 'bypass', False)
+    _cache_state.bypass = True
+    try:
+        yield
+    finally:
+        _cache_state.bypass = previous
+
+def _flush_if_requested():
+    """
+    Clears this process' query cache if the flush file was touched since the
+    last check (at most one `stat` per `_FLUSH_CHECK_INTERVAL` seconds).
+    """
+    now = time.monotonic()
+    if now - _flush_state['checked_at'] < _FLUSH_CHECK_INTERVAL:
+        return
+    _flush_state['checked_at'] = now
+    try:
+        mtime = os.path.getmtime(settings.QUERY_CACHE_FLUSH_FILE)
+    except OSError:
+        return
+    if mtime != _flush_state['mtime']:
+        _flush_state['mtime'] = mtime
+        _query_cache.clear()
+        metrics.DAL_CACHE_ENTRIES.set(0)
+
+def flush_query_cache():
+    """
+    Removes every cached query result of this process and touches the flush
+    file, so that every other process (gunicorn and Celery) clears its cache
+    on its next cached query.
+    """
+    _query_cache.clear()
+    metrics.DAL_CACHE_ENTRIES.set(0)
+    path = settings.QUERY_CACHE_FLUSH_FILE
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a'):
+        os.utime(path)
+    logger.info(f"Query cache flushed ({path} touched).")
+
+
+# -----------------------------------------------------------------------------
+# Data Standardization Plans
 #
 # This block's purpose is to decouple the application logic from the
-# database column names. Each function maps a raw DB result
-# to a Python dictionary with a stable, well-defined structure.
+# database column names. Each plan maps a raw DB row to a record with a
+# stable, well-defined structure. The configured column names are resolved
+# once, here, and each plan compiles a positional extractor per distinct
+# cursor column list, so standardizing a row does not look up the config.
 # -----------------------------------------------------------------------------
 
-def _standardize_internado(raw_dict):
-    if not raw_dict: return None
+def _column_plan(fields, as_dict=False):
+    """Builds a `ColumnPlan` from (key, column config key, converter[, default]) fields."""
     col_map = _get_config_value('columns', {})
-    standardized = {
-        'episode_id': str(raw_dict.get(col_map.get('internado_pk'))),
-        'patient_name': raw_dict.get(col_map.get('nome')),
-        'sala': str(raw_dict.get(col_map.get('sala_id'), '')),
-        'cama': raw_dict.get(col_map.get('cama_id'), ''),
-        'data_entrada': safe_strftime(raw_dict.get(col_map.get('data_entrada'))),
-        'hora_entrada': format_hour(raw_dict.get(col_map.get('hora_entrada'))),
-        'specialty_name': raw_dict.get(col_map.get('specialty_name'))
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+    return ColumnPlan(
+        [(key, col_map.get(column_key), converter, rest[0] if rest else None)
+         for key, column_key, converter, *rest in fields],
+        as_dict=as_dict,
+    )
 
-def _standardize_fenomeno(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'dta_fenom': safe_strftime(raw_dict.get(col_map.get('data_fenomeno'))),
-        'hora_fenom': format_hour(raw_dict.get(col_map.get('hora_fenomeno'))),
-        'fenomeno': raw_dict.get(col_map.get('fenomeno')),
-        'def_fenom': raw_dict.get(col_map.get('definicao_fenomeno'))
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+# Patient headers stay plain dictionaries, as they are extended with the
+# related sections (detail view) or the last diary (patient lists).
+INTERNADO_PLAN = _column_plan([
+    ('episode_id', 'internado_pk', str),
+    ('patient_name', 'nome', None),
+    ('sala', 'sala_id', str, ''),
+    ('cama', 'cama_id', None, ''),
+    ('data_entrada', 'data_entrada', safe_strftime),
+    ('hora_entrada', 'hora_entrada', format_hour),
+    ('specialty_name', 'specialty_name', None),
+], as_dict=True)
 
-def _standardize_medicacao(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'farmaco': raw_dict.get(col_map.get('farmaco')),
-        'via': raw_dict.get(col_map.get('via')),
-        'dose': raw_dict.get(col_map.get('dose')),
-        'horario': raw_dict.get(col_map.get('horario_medicacao')),
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+FENOMENO_PLAN = _column_plan([
+    ('dta_fenom', 'data_fenomeno', safe_strftime),
+    ('hora_fenom', 'hora_fenomeno', format_hour),
+    ('fenomeno', 'fenomeno', None),
+    ('def_fenom', 'definicao_fenomeno', None),
+])
 
-def _standardize_atitude(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'atitude': raw_dict.get(col_map.get('atitude')),
-        'hora_at': raw_dict.get(col_map.get('horario_atitude'))
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+MEDICACAO_PLAN = _column_plan([
+    ('farmaco', 'farmaco', None),
+    ('via', 'via', None),
+    ('dose', 'dose', None),
+    ('horario', 'horario_medicacao', None),
+])
 
-def _standardize_analise(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'analise': raw_dict.get(col_map.get('analise')),
-        'dta_anl': safe_strftime(raw_dict.get(col_map.get('data_analise'))),
-        'hora_anl': format_hour(raw_dict.get(col_map.get('hora_analise')))
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+ATITUDE_PLAN = _column_plan([
+    ('atitude', 'atitude', None),
+    ('hora_at', 'horario_atitude', None),
+])
 
-def _standardize_exame(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'exame': raw_dict.get(col_map.get('exame')),
-        'dta_exm': safe_strftime(raw_dict.get(col_map.get('data_exame')))
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+ANALISE_PLAN = _column_plan([
+    ('analise', 'analise', None),
+    ('dta_anl', 'data_analise', safe_strftime),
+    ('hora_anl', 'hora_analise', format_hour),
+])
 
-def _standardize_diario(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'diario': raw_dict.get(col_map.get('diario')),
-        'hora_dir': format_hour(raw_dict.get(col_map.get('hora_diario'))),
-        'dta_dir': safe_strftime(raw_dict.get(col_map.get('data_diario')))
-    }
-    return {k: v for k, v in standardized.items() if v is not None}
+EXAME_PLAN = _column_plan([
+    ('exame', 'exame', None),
+    ('dta_exm', 'data_exame', safe_strftime),
+])
 
-def _standardize_observacoes(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = { 'observacoes':raw_dict.get(col_map.get('observacoes')) }
-    return {k: v for k, v in standardized.items() if v is not None}
+DIARIO_PLAN = _column_plan([
+    ('diario', 'diario', None),
+    ('hora_dir', 'hora_diario', format_hour),
+    ('dta_dir', 'data_diario', safe_strftime),
+])
 
-def _standardize_pessoa_signif(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = { 'pessoa_signif':raw_dict.get(col_map.get('pessoa_signif')) }
-    return {k: v for k, v in standardized.items() if v is not None}
+OBSERVACOES_PLAN = _column_plan([('observacoes', 'observacoes', None)])
 
-def _standardize_telefone(raw_dict):
-    if not raw_dict: return None
-    col_map = _get_config_value('columns', {})
-    standardized = {
-        'telefone_morada':raw_dict.get(col_map.get('telefone_morada')),
-        'telemovel':raw_dict.get(col_map.get('telemovel')),
+PESSOA_SIGNIF_PLAN = _column_plan([('pessoa_signif', 'pessoa_signif', None)])
+
+TELEFONE_PLAN = _column_plan([
+    ('telefone_morada', 'telefone_morada', None),
+    ('telemovel', 'telemovel', None),
+])
+
+# Related patient sections: (context key, query key, standardization plan).
+# Shared by the single-patient and the batch loaders so both return the same structure.
+PATIENT_SECTIONS = (
+    ('telefone', 'get_telefone', TELEFONE_PLAN),
+    ('observacoes', 'get_observacoes', OBSERVACOES_PLAN),
+    ('pessoa_signif', 'get_pessoa_signif', PESSOA_SIGNIF_PLAN),
+    ('fenomenos', 'get_fenomenos', FENOMENO_PLAN),
+    ('medicacao', 'get_medicacao', MEDICACAO_PLAN),
+    ('atitudes_terapeuticas', 'get_atitudes', ATITUDE_PLAN),
+    ('analises', 'get_analises', ANALISE_PLAN),
+    ('exames', 'get_exames', EXAME_PLAN),
+    ('diarios', 'get_diarios', DIARIO_PLAN),
+)
+
+# Sections served one at a time by `get_patient_section` (lazy patient API):
+# the admission note lists plus the related sections. The long histories are
+# served page by page.
+SECTION_NAMES = ('antecedentes', 'diagnostico') + tuple(section for section, _, _ in PATIENT_SECTIONS)
+PAGINATED_SECTIONS = ('diarios', 'analises')
+_SECTION_QUERIES = {section: (sql_key, plan) for section, sql_key, plan in PATIENT_SECTIONS}
+
+def validate_section_request(section, fields=None):
+    """Raises ValueError for an unknown section, or fields it does not have."""
+    if section not in SECTION_NAMES:
+        raise ValueError(f"Unknown section '{section}'.")
+    if not fields:
+        return
+    if section not in _SECTION_QUERIES:
+        raise ValueError(f"Section '{section}' is a plain list and has no fields.")
+    unknown = [field for field in fields if field not in _SECTION_QUERIES[section][1].index]
+    if unknown:
+        raise ValueError(f"Unknown fields for section '{section}': {', '.join(unknown)}.")
+
+def project_section_items(items, fields=None):
+    """Keeps only `fields` (standardized keys) of the items of a section."""
+    if not fields:
+        return items
+    return [{field: item[field] for field in fields if item.get(field) is not None} for item in items]
+
+def _split_admission_notes(items, history_code, diagnosis_code):
+    """Splits the admission note items into the 'antecedentes' and 'diagnostico' lists."""
+    # Use dict.fromkeys to get unique values while preserving order
+    return {
+        'antecedentes': list(dict.fromkeys(i.get('VALOR') for i in items if i.get('ITEM') == history_code and i.get('VALOR'))),
+        'diagnostico': list(dict.fromkeys(i.get('VALOR') for i in items if i.get('ITEM') == diagnosis_code and i.get('VALOR'))),
     }
-    return {k: v for k, v in standardized.items() if v is not None}
+
+def _execute_batch_query(sql_key, episode_ids, extra_params=None, as_tuples=False):
+    """
+    Executes a query from the `batch_queries` section for a list of episode IDs.
+
+    The `{ids}` placeholder in the configured SQL is expanded into one parameter
+    marker per ID; `extra_params` are bound after the IDs.
+    """
+    sql = _get_config_value(f"batch_queries.{sql_key}")
+    if not sql:
+        raise ValueError(f"Batch query not configured or empty for key: {sql_key}")
+    sql = sql.replace('{ids}', ', '.join([PARAM_STYLE] * len(episode_ids)))
+    return _execute_query(sql_key=f"batch.{sql_key}", sql=sql, params=list(episode_ids) + list(extra_params or []), as_tuples=as_tuples)
+
+def _group_by_episode(rows):
+    """Groups raw rows by their episode ID (as a string), preserving row order."""
+    pk_col = _get_config_value('columns.internado_pk')
+    grouped = {}
+    for row in rows:
+        if row:
+            grouped.setdefault(str(row.get(pk_col)), []).append(row)
+    return grouped
+
+def _group_tuples_by_episode(columns, rows):
+    """Like `_group_by_episode`, for `(columns, row tuples)` results."""
+    pk_position = columns.index(_get_config_value('columns.internado_pk'))
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(str(row[pk_position]), []).append(row)
+    return grouped
+
+def _fetch_admission_notes(pk_decimal):
+    """Fetches the admission note items of one patient, split into history and diagnosis."""
+    history_code = _get_config_value('parameters.ainicial_antecedentes_item')
+    diagnosis_code = _get_config_value('parameters.ainicial_diagnostico_item')
+    admission_note_items = _execute_query('get_ainicial_items', params=[pk_decimal, history_code, diagnosis_code])
+    return _split_admission_notes(admission_note_items, history_code, diagnosis_code)
+
+def _fetch_section(sql_key, plan, pk_decimal):
+    """Fetches and standardizes one related section of a patient."""
+    columns, rows = _execute_query(sql_key, params=[pk_decimal], as_tuples=True)
+    return plan.map_rows(columns, rows)
+
+# Window bound passed for a dimension (entries / days) that is not limited
+_ALL_DIARY_ENTRIES = 2 ** 31 - 1
+_ALL_DIARY_DATES = datetime.datetime(1900, 1, 1)
+
+def _diary_window():
+    """
+    Returns the parameters (max entries, oldest entry date) of the diary window
+    set by `settings.DIARY_WINDOW_ENTRIES` / `DIARY_WINDOW_DAYS`, or None when
+    the whole diary is read. N days are today and the N - 1 days before it.
+    """
+    entries = getattr(settings, 'DIARY_WINDOW_ENTRIES', 0)
+    days = getattr(settings, 'DIARY_WINDOW_DAYS', 0)
+    if not entries and not days:
+        return None
+    since = _ALL_DIARY_DATES
+    if days:
+        since = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days - 1), datetime.time.min)
+    return [entries or _ALL_DIARY_ENTRIES, since]
+
+def _omitted_diaries(columns, rows):
+    """Number of diary entries left out of the window, from the total the windowed query returns on each row."""
+    if not rows:
+        return 0
+    total = rows[0][columns.index(_get_config_value('columns.total_diarios'))]
+    return max(int(total or 0) - len(rows), 0)
+
+def _fetch_diaries(pk_decimal):
+    """
+    Fetches the diary of a patient, most recent first. With a diary window,
+    only the entries in the window (and always the most recent one) are read,
+    in SQL (`get_diarios_window`).
+
+    Returns {'diarios': [...], 'diarios_omitidos': number of entries left out}.
+    """
+    window = _diary_window()
+    if window is None:
+        return {'diarios': _fetch_section('get_diarios', DIARIO_PLAN, pk_decimal), 'diarios_omitidos': 0}
+    columns, rows = _execute_query('get_diarios_window', params=[pk_decimal] + window, as_tuples=True)
+    return {'diarios': DIARIO_PLAN.map_rows(columns, rows), 'diarios_omitidos': _omitted_diaries(columns, rows)}
+
+def _run_in_own_connection(trace, func, *args):
+    """
+    Runs a DAL call in a pool thread. Django connections are thread-local, so
+    each thread opens its own 'hospital' connection, closed here once done.
+    Its queries are recorded in the query trace of the calling request.
+    """
+    try:
+        with query_trace.attached(trace):
+            return func(*args)
+    finally:
+        connections['hospital'].close()
+
+def _fetch_sections_concurrently(pk_decimal):
+    """
+    Fetches all related sections of a patient on a bounded thread pool.
+
+    Returns the section values plus a 'failed_sections' list with the sections
+    that raised or did not finish within `settings.DAL_SECTION_TIMEOUT` seconds
+    (those sections are returned empty).
+    """
+    max_workers = max(1, getattr(settings, 'DAL_SECTION_WORKERS', 4))
+    timeout = getattr(settings, 'DAL_SECTION_TIMEOUT', 30)
+
+    result = {'antecedentes': [], 'diagnostico': [], 'diarios_omitidos': 0}
+    failed_sections = []
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dal-section')
+    trace = query_trace.current()
+    try:
+        futures = {executor.submit(_run_in_own_connection, trace, _fetch_admission_notes, pk_decimal): 'antecedentes'}
+        for section, sql_key, plan in PATIENT_SECTIONS:
+            result[section] = []
+            if section == 'diarios':
+                future = executor.submit(_run_in_own_connection, trace, _fetch_diaries, pk_decimal)
+            else:
+                future = executor.submit(_run_in_own_connection, trace, _fetch_section, sql_key, plan, pk_decimal)
+            futures[future] = section
+
+        done, not_done = wait(futures, timeout=timeout)
+        for future in done:
+            section = futures[future]
+            try:
+                value = future.result()
+            except Exception as e:
+                logger.error(f"DAL: Error fetching section '{section}' for patient {pk_decimal}: {e}")
+                failed_sections.append(section)
+                continue
+            if section in ('antecedentes', 'diarios'):
+                # Admission notes fill both 'antecedentes' and 'diagnostico'; diaries come with 'diarios_omitidos'
+                result.update(value)
+            else:
+                result[section] = value
+        for future in not_done:
+            logger.error(f"DAL: Section '{futures[future]}' for patient {pk_decimal} timed out after {timeout}s.")
+            failed_sections.append(futures[future])
+    finally:
+        # Do not block the request on sections that timed out
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    result['failed_sections'] = sorted(failed_sections)
+    return result
+
+# -----------------------------------------------------------------------------
+# Read Modes (live / replica / auto)
+#
+# The read functions used by the web views can be served from the local
+# census replica (`replica.py`) instead of the hospital database:
+#   - 'live': always query the hospital database (default);
+#   - 'replica': always read the local replica;
+#   - 'auto': query the hospital database and fall back to the replica when
+#     it fails, skipping it for `DAL_REPLICA_RETRY_SECONDS` afterwards.
+# Backup tasks and the replica sync always read live.
+# -----------------------------------------------------------------------------
+
+READ_MODES = ('live', 'replica', 'auto')
+
+_read_state = threading.local()
+_live_down_until = 0.0
+
+
+def get_read_mode() -> str:
+    """Returns the effective read mode of the current thread."""
+    if getattr(_read_state, 'force_live', False):
+        return 'live'
+    mode = getattr(settings, 'DAL_READ_MODE', 'live')
+    return mode if mode in READ_MODES else 'live'
+
+@contextmanager
+def force_live_reads():
+    """Within this block, reads of the current thread always query the hospital database."""
+    previous = getattr(_read_state, 'force_live', False)
+    _read_state.force_live = True
+    try:
+        yield
+    finally:
+        _read_state.force_live = previous
+
+def reset_read_source():
+    """Forgets whether the current thread was served from the replica (called per request)."""
+    _read_state.from_replica = False
+    _read_state.replica_as_of = None
+
+def served_from_replica() -> bool:
+    """True if the current thread read from the replica since `reset_read_source`."""
+    return getattr(_read_state, 'from_replica', False)
+
+def get_replica_as_of():
+    """Returns the sync time of the replica data served to the current thread (None if never synced)."""
+    return getattr(_read_state, 'replica_as_of', None)
+
+def _read_from_replica(name, *args, **kwargs):
+    from . import replica
+    _read_state.from_replica = True
+    _read_state.replica_as_of = replica.get_synced_at()
+    return getattr(replica, name)(*args, **kwargs)
+
+def _replica_fallback(replica_name):
+    """
+    Decorates a live read function so that, depending on the read mode, it is
+    served by the function `replica_name` of the `replica` module instead.
+
+    Generator functions fail while they are iterated, not when they are
+    called: their rows are re-yielded, falling back to the replica if the
+    hospital database fails before the first row (after it, the error is
+    raised, as the rows already sent cannot be taken back).
+    """
+    def use_replica():
+        mode = get_read_mode()
+        return mode == 'replica' or (mode == 'auto' and time.monotonic() < _live_down_until)
+
+    def mark_live_down(live_func, e):
+        global _live_down_until
+        _live_down_until = time.monotonic() + getattr(settings, 'DAL_REPLICA_RETRY_SECONDS', 30)
+        logger.warning(f"DAL: Hospital database unavailable in '{live_func.__name__}' ({e}). Serving from the local replica.")
+
+    def decorator(live_func):
+        if inspect.isgeneratorfunction(live_func):
+            @functools.wraps(live_func)
+            def generator_wrapper(*args, **kwargs):
+                if use_replica():
+                    yield from _read_from_replica(replica_name, *args, **kwargs)
+                    return
+                if get_read_mode() == 'live':
+                    yield from live_func(*args, **kwargs)
+                    return
+                yielded = False
+                try:
+                    for item in live_func(*args, **kwargs):
+                        yielded = True
+                        yield item
+                except DatabaseDriverError as e:
+                    if yielded:
+                        raise
+                    mark_live_down(live_func, e)
+                    yield from _read_from_replica(replica_name, *args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(live_func)
+        def wrapper(*args, **kwargs):
+            if use_replica():
+                return _read_from_replica(replica_name, *args, **kwargs)
+            if get_read_mode() == 'live':
+                return live_func(*args, **kwargs)
+            try:
+                return live_func(*args, **kwargs)
+            except DatabaseDriverError as e:
+                mark_live_down(live_func, e)
+                return _read_from_replica(replica_name, *args, **kwargs)
+        return wrapper
+    return decorator
+
 
 # -----------------------------------------------------------------------------
 # Public DAL Interface
 # -----------------------------------------------------------------------------
 
+@_replica_fallback('get_specialties_list')
+def _get_specialties_list():
+    return _execute_query('get_specialties')
+
 def get_specialties_list() -> list[dict]:
     """Returns a list of all specialties with interned patients."""
     try:
-        return _execute_query('get_specialties')
+        return _get_specialties_list()
     except Exception as e:
         logger.error(f"Error fetching specialties list: {e}", exc_info=True)
         return []
@@ -184,10 +623,127 @@ def get_specialties_list() -> list[dict]:
 def get_all_patient_ids() -> list[Decimal]:
     """Returns a list of all interned patient IDs."""
     pk_col = _get_config_value('columns.internado_pk')
-    results = _execute_query('get_all_patient_ids')
+    if _get_cache_ttl('get_all_patient_ids') > 0:
+        results = _execute_query('get_all_patient_ids')
+    else:
+        # Only the IDs are kept, not one dictionary per row
+        results = _execute_query('get_all_patient_ids', stream=True)
     return [row[pk_col] for row in results if pk_col in row]
 
+def get_backup_priority_rows() -> list[dict]:
+    """
+    Returns, for every interned patient, what the backup cycle orders it by:
+    {'episode_id', 'admitted' (admission datetime) and 'last_activity'
+    (latest diary entry or medication change)}, None when unknown. Without
+    a `get_backup_priorities` query only the IDs are known (from
+    `get_all_patient_ids`).
+    """
+    pk_col = _get_config_value('columns.internado_pk')
+    if not _get_config_value('queries.get_backup_priorities'):
+        return [{'episode_id': patient_id, 'admitted': None, 'last_activity': None}
+                for patient_id in get_all_patient_ids()]
+
+    date_col = _get_config_value('columns.data_entrada')
+    time_col = _get_config_value('columns.hora_entrada')
+    diary_col = _get_config_value('columns.data_ultimo_diario')
+    medication_col = _get_config_value('columns.data_alteracao_medicacao')
+    rows = []
+    for row in _execute_query('get_backup_priorities', stream=True):
+        if row.get(pk_col) is None:
+            continue
+        activity = [value for value in (to_datetime(row.get(diary_col)), to_datetime(row.get(medication_col))) if value]
+        rows.append({
+            'episode_id': row[pk_col],
+            'admitted': to_datetime(row.get(date_col), row.get(time_col)),
+            'last_activity': max(activity) if activity else None,
+        })
+    return rows
 
+def iter_census_rows(specialty_id: str | None = None):
+    """
+    Streams the raw rows of `get_patient_list_base` (optionally of one
+    specialty), ordered by episode ID.
+    """
+    sql_base = _get_config_value('queries.get_patient_list_base')
+    if not sql_base:
+        raise ValueError("Base pagination queries are not configured.")
+
+    pk_col_name = _get_config_value('columns.internado_pk')
+    where_clauses, params = _build_patient_list_filters(specialty_id, '')
+    sql_where_part = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    sql = f"{sql_base}{sql_where_part} ORDER BY i.{pk_col_name}"
+    return _execute_query('get_patient_list_base', sql=sql, params=params, stream=True)
+
+def get_census_specialty_ids(specialties: list[dict]) -> dict[str, str]:
+    """
+    Maps the episode ID of every interned patient to its specialty ID. The
+    list query has no specialty column, so this runs it once per specialty
+    (rows of `get_specialties_list`).
+    """
+    pk_col_name = _get_config_value('columns.internado_pk')
+    specialty_of = {}
+    for specialty in specialties:
+        specialty_id = str(specialty.get('COD_ESPECIALIDADE'))
+        for row in iter_census_rows(specialty_id):
+            specialty_of[str(row.get(pk_col_name))] = specialty_id
+    return specialty_of
+
+@_replica_fallback('get_census_entries')
+def get_census_entries() -> list[dict]:
+    """
+    Returns every interned patient as a list row (see `INTERNADO_PLAN`) plus
+    its 'specialty_id' and 'admitted' (admission date, ISO format), e.g. to
+    build the patient name index.
+    """
+    pk_col_name = _get_config_value('columns.internado_pk')
+    date_col_name = _get_config_value('columns.data_entrada')
+    with bypass_query_cache():
+        specialty_of = get_census_specialty_ids(_get_specialties_list())
+        entries = []
+        for row in iter_census_rows():
+            entry = INTERNADO_PLAN.map_dict(row)
+            if not entry:
+                continue
+            admitted = row.get(date_col_name)
+            entry['specialty_id'] = specialty_of.get(str(row.get(pk_col_name)), '')
+            entry['admitted'] = admitted.isoformat() if hasattr(admitted, 'isoformat') else ''
+            entries.append(entry)
+    return entries
+
+@_replica_fallback('iter_census')
+def iter_census(specialty_id: str | None = None, include_sections: bool = False):
+    """
+    Yields every interned patient (optionally of one specialty), ordered by
+    episode ID, with the same structure as the patient lists or, with
+    `include_sections`, as `get_patient_details_all`.
+
+    Headers are streamed from the database. Sections are loaded per chunk
+    of `settings.BACKUP_BATCH_SIZE` patients with `get_patient_details_many`,
+    after the header cursor is closed (some drivers allow a single open
+    result set per connection).
+    """
+    pk_col_name = _get_config_value('columns.internado_pk')
+    rows = iter_census_rows(specialty_id)
+
+    if not include_sections:
+        for row in rows:
+            patient = INTERNADO_PLAN.map_dict(row)
+            if patient:
+                yield patient
+        return
+
+    episode_ids = [row[pk_col_name] for row in rows if row.get(pk_col_name) is not None]
+    chunk_size = max(1, getattr(settings, 'BACKUP_BATCH_SIZE', 50))
+    for start in range(0, len(episode_ids), chunk_size):
+        chunk = episode_ids[start:start + chunk_size]
+        details = get_patient_details_many(chunk)
+        for episode_id in chunk:
+            patient = details.get(str(episode_id))
+            if patient:
+                yield patient
+
+
+@_replica_fallback('get_recent_patients_list')
 def get_recent_patients_list(specialty_id: str | None = None) -> list[dict]:
     """Returns a list of recent patients, with an optional specialty filter."""
     sql = _get_config_value('queries.get_recent_patients')
@@ -197,19 +753,14 @@ def get_recent_patients_list(specialty_id: str | None = None) -> list[dict]:
         sql = sql.replace("ORDER BY", f"WHERE i.servicoID = {PARAM_STYLE} ORDER BY")
         params.append(specialty_id)
     
-    raw_results = _execute_query(sql=sql, params=params)
-    return [_standardize_internado(row) for row in raw_results if row]
+    raw_results = _execute_query('get_recent_patients', sql=sql, params=params)
+    return [INTERNADO_PLAN.map_dict(row) for row in raw_results if row]
 
 
-def get_paginated_patient_list(page: int, limit: int, specialty_id: str | None = None, sort_key: str = 'admission_date', sort_dir: str = 'desc', search_query: str = '') -> tuple[list[dict], int]:
-    """Returns a paginated list, with optional specialty filter."""
+def _build_patient_list_filters(specialty_id: str | None, search_query: str) -> tuple[list[str], list]:
+    """Builds the WHERE clauses and parameters shared by the patient list queries."""
     pk_col_name = _get_config_value('columns.internado_pk')
     name_col_name = _get_config_value('columns.nome')
-    
-    sql_base = _get_config_value('queries.get_patient_list_base')
-    sql_count_base = _get_config_value('queries.get_patient_list_count_base')
-    if not sql_base or not sql_count_base:
-        raise ValueError("Base pagination queries are not configured.")
 
     params = []
     where_clauses = []
@@ -225,75 +776,243 @@ def get_paginated_patient_list(page: int, limit: int, specialty_id: str | None =
             where_clauses.append(f"i.{pk_col_name} = {PARAM_STYLE}")
             params.append(search_decimal)
         except (ValueError, TypeError, InvalidOperation):
-            # If not numeric, search by name
-            where_clauses.append(f"UPPER(d.{name_col_name}) LIKE {PARAM_STYLE}")
-            params.append(f"%{search_query.upper()}%")
+            # If not numeric, search by name: through the in-memory name index
+            # (accent-insensitive, no scan over the DB link) when it is available.
+            # No match (e.g. admitted after the last index refresh) or more matches
+            # than fit in the IN list fall back to LIKE, which misses no patient.
+            max_matches = _get_config_value('parameters.batch_max_in_list', 1000)
+            matches = name_index.search(search_query, specialty_id, limit=max_matches)
+            if matches and len(matches) < max_matches:
+                where_clauses.append(f"i.{pk_col_name} IN ({', '.join([PARAM_STYLE] * len(matches))})")
+                params.extend(Decimal(m['episode_id']) for m in matches)
+            else:
+                where_clauses.append(f"UPPER(d.{name_col_name}) LIKE {PARAM_STYLE}")
+                params.append(f"%{search_query.upper()}%")
+
+    return where_clauses, params
+
+def _get_patient_list_sort_columns(sort_key: str) -> list[str]:
+    """
+    Returns the qualified columns ('alias.COLUMN') the patient list is sorted by.
+    Sorting by admission date adds the admission time as a secondary key.
+    """
+    sort_map = _get_config_value('sorting.patient_list', {})
+    db_sort_col = sort_map.get(sort_key)
+    if not db_sort_col:
+        raise ValueError(f"Invalid sort key: {sort_key}")
+
+    alias = 'd' if sort_key == 'name' else 'i'
+    columns = [f"{alias}.{db_sort_col}"]
     
+    # Add secondary sort by time if sorting by admission date
+    if sort_key == "admission_date" and 'admission_time' in sort_map:
+        columns.append(f"i.{sort_map['admission_time']}")
+    return columns
+
+def _fetch_first_rows_sql(sql: str, limit: int, offset: int = 0) -> tuple[str, list]:
+    """Appends the DBMS-dependent pagination clause. Returns the SQL and its extra parameters."""
+    if DB_TYPE in ['postgres', 'sqlite']:
+        return sql + f" LIMIT {PARAM_STYLE} OFFSET {PARAM_STYLE}", [limit, offset]
+    elif DB_TYPE in ['oracle', 'sqlserver']:
+        return sql + f" OFFSET {PARAM_STYLE} ROWS FETCH NEXT {PARAM_STYLE} ROWS ONLY", [offset, limit]
+    raise NotImplementedError(f"Pagination not implemented for: {DB_TYPE}")
+
+_last_diary_fallback_logged = False
+
+def _attach_last_diaries_per_patient(standardized_list: list[dict]) -> None:
+    """
+    Adds 'ultimo_diario' with the former per-patient queries (two per
+    patient), for configurations without `batch_queries.get_ultimos_diarios`.
+    """
+    global _last_diary_fallback_logged
+    sql_last_diary_key = _get_config_value('queries.get_ultimo_diario_chave')
+    sql_last_diary_text = _get_config_value('queries.get_ultimo_diario_texto')
+    if not _last_diary_fallback_logged:
+        _last_diary_fallback_logged = True
+        if sql_last_diary_key and sql_last_diary_text:
+            logger.warning("DAL: 'batch_queries.get_ultimos_diarios' is not configured; the patient list "
+                           "fetches the last diaries with two queries per patient.")
+        else:
+            logger.warning("DAL: neither 'batch_queries.get_ultimos_diarios' nor 'queries.get_ultimo_diario_chave/texto' "
+                           "is configured; the patient list shows no last diary.")
+    if not (sql_last_diary_key and sql_last_diary_text):
+        return
+
+    diary_col = _get_config_value('columns.ultimo_diario')
+    date_col = _get_config_value('columns.data_diario')
+    time_col = _get_config_value('columns.hora_diario')
+    for patient_data in standardized_list:
+        try:
+            row_pk = Decimal(patient_data['episode_id'])
+            key_res = _execute_query('get_ultimo_diario_chave', params=[row_pk], fetch_one=True)
+            if key_res:
+                diary_res = _execute_query('get_ultimo_diario_texto', params=[row_pk, key_res.get(date_col), key_res.get(time_col)], fetch_one=True)
+                patient_data['ultimo_diario'] = diary_res.get(diary_col) if diary_res else None
+        except Exception as e:
+            logger.warning(f"DAL: Error fetching last diary for {patient_data['episode_id']}: {e}")
+
+def _attach_last_diaries(standardized_list: list[dict]) -> None:
+    """
+    Adds 'ultimo_diario' to each patient of a list page, fetched in one
+    windowed query (`batch_queries.get_ultimos_diarios`).
+    """
+    if not standardized_list:
+        return
+    if not _get_config_value('batch_queries.get_ultimos_diarios'):
+        _attach_last_diaries_per_patient(standardized_list)
+        return
+    try:
+        page_ids = [Decimal(p['episode_id']) for p in standardized_list]
+        last_diaries = _group_by_episode(_execute_batch_query('get_ultimos_diarios', page_ids))
+        diary_col = _get_config_value('columns.ultimo_diario')
+        for patient_data in standardized_list:
+            rows = last_diaries.get(patient_data['episode_id'])
+            patient_data['ultimo_diario'] = rows[0].get(diary_col) if rows else None
+    except Exception as e:
+        logger.warning(f"DAL: Error fetching last diaries for patient list page: {e}")
+
+def _count_patient_list(where_clauses: list[str], params: list) -> int:
+    """Counts the patients matching the list filters (cacheable via `get_patient_list_count_base`)."""
+    sql_count_base = _get_config_value('queries.get_patient_list_count_base')
+    if not sql_count_base:
+        raise ValueError("Base pagination queries are not configured.")
+    sql_where_part = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    result = _execute_query('get_patient_list_count_base', sql=sql_count_base + sql_where_part, params=params, fetch_one=True)
+    return (result or {}).get('TOTAL', 0)
+
+
+@_replica_fallback('get_paginated_patient_list')
+def get_paginated_patient_list(page: int, limit: int, specialty_id: str | None = None, sort_key: str = 'admission_date', sort_dir: str = 'desc', search_query: str = '') -> tuple[list[dict], int]:
+    """Returns a paginated list, with optional specialty filter."""
+    sql_base = _get_config_value('queries.get_patient_list_base')
+    if not sql_base:
+        raise ValueError("Base pagination queries are not configured.")
+
+    where_clauses, params = _build_patient_list_filters(specialty_id, search_query)
     sql_where_part = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
     
     # Get total count with filters
-    total_patients = _execute_query(sql=sql_count_base + sql_where_part, params=params, fetch_one=True).get('TOTAL', 0)
+    total_patients = _count_patient_list(where_clauses, params)
     if total_patients == 0:
         return [], 0
 
     # Prepare sorting
-    sort_map = _get_config_value('sorting.patient_list', {})
-    db_sort_col = sort_map.get(sort_key)
     direction = "DESC" if sort_dir == 'desc' else "ASC"
-    
-    alias = 'd' if sort_key == 'name' else 'i'
-    order_sql = f" ORDER BY {alias}.{db_sort_col} {direction}"
-    
-    # Add secondary sort by time if sorting by admission date
-    if sort_key == "admission_date" and 'admission_time' in sort_map:
-        order_sql += f", i.{sort_map['admission_time']} {direction}"
-    
-    sql_data = sql_base + sql_where_part + order_sql
+    order_sql = " ORDER BY " + ", ".join(f"{col} {direction}" for col in _get_patient_list_sort_columns(sort_key))
     
     offset = (page - 1) * limit
     
     # Pagination syntax is DBMS-dependent
-    if DB_TYPE == 'postgres':
-        sql_data += f" LIMIT {PARAM_STYLE} OFFSET {PARAM_STYLE}"
-        params_data = params + [limit, offset]
-    elif DB_TYPE in ['oracle', 'sqlserver']:
-        sql_data += f" OFFSET {PARAM_STYLE} ROWS FETCH NEXT {PARAM_STYLE} ROWS ONLY"
-        params_data = params + [offset, limit]
-    else:
-        raise NotImplementedError(f"Pagination not implemented for: {DB_TYPE}")
+    sql_data, pagination_params = _fetch_first_rows_sql(sql_base + sql_where_part + order_sql, limit, offset)
+    raw_results = _execute_query('get_patient_list_base', sql=sql_data, params=params + pagination_params)
 
-    raw_results = _execute_query(sql=sql_data, params=params_data)
+    standardized_list = [p for p in (INTERNADO_PLAN.map_dict(row) for row in raw_results) if p]
+    _attach_last_diaries(standardized_list)
 
-    # Post-process: Fetch last diary entry for each patient in the list
-    standardized_list = []
-    sql_last_diary_key = _get_config_value('queries.get_ultimo_diario_chave')
-    sql_last_diary_text = _get_config_value('queries.get_ultimo_diario_texto')
+    return standardized_list, total_patients
 
-    for row in raw_results:
-        patient_data = _standardize_internado(row)
-        if not patient_data: continue
-        
-        # This N+1 query (one per patient) is acceptable for a small page size (e.g., 10)
-        if sql_last_diary_key and sql_last_diary_text:
-            try:
-                row_pk = Decimal(patient_data['episode_id'])
-                key_res = _execute_query(sql=sql_last_diary_key, params=[row_pk], fetch_one=True)
-                if key_res:
-                    date_val, time_val = key_res.get('DATA_DIARIO'), key_res.get('HORA_DIARIO')
-                    diary_res = _execute_query(sql=sql_last_diary_text, params=[row_pk, date_val, time_val], fetch_one=True)
-                    patient_data['ultimo_diario'] = diary_res.get('ULT_DIARIO') if diary_res else None
-            except Exception as e:
-                logger.warning(f"DAL: Error fetching last diary for {patient_data['episode_id']}: {e}")
-        
-        standardized_list.append(patient_data)
 
-    return standardized_list, total_patients
+def _encode_cursor_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return datetime.date.fromisoformat(value['d'])
+        if 'n' in value:
+            return Decimal(value['n'])
+    return value
 
+def encode_patient_list_cursor(sort_key: str, sort_dir: str, values: list) -> str:
+    """Encodes the sort key values of the last row of a page into an opaque cursor."""
+    payload = {'k': sort_key, 's': sort_dir, 'v': [_encode_cursor_value(v) for v in values]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def decode_patient_list_cursor(cursor: str, sort_key: str, sort_dir: str) -> list:
+    """Decodes a cursor, checking it was issued for the same sorting."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        values = [_decode_cursor_value(v) for v in payload['v']]
+    except Exception:
+        raise ValueError("Invalid pagination cursor.")
+    if payload.get('k') != sort_key or payload.get('s') != sort_dir:
+        raise ValueError("Pagination cursor does not match the requested sorting.")
+    return values
 
-def get_patient_details_all(patient_id_str: str, specialty_id: str | None) -> dict | None:
+
+@_replica_fallback('get_patient_list_page_by_cursor')
+def get_patient_list_page_by_cursor(limit: int, cursor: str | None = None, specialty_id: str | None = None, sort_key: str = 'admission_date', sort_dir: str = 'desc', search_query: str = '', include_total: bool = False) -> tuple[list[dict], str | None, int | None]:
     """
-    Aggregates all information for a single patient, ensuring they belong
-    to the selected specialty (if one is provided).
+    Keyset (seek) pagination for the patient list.
+
+    Instead of skipping `OFFSET` rows, each page starts right after the sort
+    key values of the previous page's last row, encoded in an opaque `cursor`
+    (None for the first page). The episode ID is always added as the final
+    sort key so the order is total (sort columns are expected to be NOT NULL).
+    The total count is only computed when `include_total` is set (typically
+    for the first page).
+
+    Returns (patients, next_cursor, total), where next_cursor is None on the last page.
+    """
+    sql_base = _get_config_value('queries.get_patient_list_base')
+    if not sql_base:
+        raise ValueError("Base pagination queries are not configured.")
+
+    pk_col_name = _get_config_value('columns.internado_pk')
+    where_clauses, params = _build_patient_list_filters(specialty_id, search_query)
+    total_patients = _count_patient_list(list(where_clauses), list(params)) if include_total else None
+
+    sort_columns = _get_patient_list_sort_columns(sort_key)
+    if f"i.{pk_col_name}" not in sort_columns:
+        sort_columns.append(f"i.{pk_col_name}")
+    direction = "DESC" if sort_dir == 'desc' else "ASC"
+    operator = "<" if direction == "DESC" else ">"
+
+    if cursor:
+        last_values = decode_patient_list_cursor(cursor, sort_key, sort_dir)
+        if len(last_values) != len(sort_columns):
+            raise ValueError("Invalid pagination cursor.")
+        # Row-value comparisons are not portable, so expand (a, b, c) < (x, y, z) into
+        # a < x OR (a = x AND (b < y OR (b = y AND c < z)))
+        condition = f"{sort_columns[-1]} {operator} {PARAM_STYLE}"
+        seek_params = [last_values[-1]]
+        for col, value in zip(reversed(sort_columns[:-1]), reversed(last_values[:-1])):
+            condition = f"{col} {operator} {PARAM_STYLE} OR ({col} = {PARAM_STYLE} AND ({condition}))"
+            seek_params = [value, value] + seek_params
+        where_clauses.append(f"({condition})")
+        params += seek_params
+
+    sql_where_part = f" WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    order_sql = " ORDER BY " + ", ".join(f"{col} {direction}" for col in sort_columns)
+
+    # Fetch one extra row to know whether there is a next page
+    sql_data, pagination_params = _fetch_first_rows_sql(sql_base + sql_where_part + order_sql, limit + 1)
+    raw_results = _execute_query('get_patient_list_base', sql=sql_data, params=params + pagination_params)
+
+    next_cursor = None
+    if len(raw_results) > limit:
+        raw_results = raw_results[:limit]
+        last_row = raw_results[-1]
+        next_cursor = encode_patient_list_cursor(sort_key, sort_dir, [last_row.get(col.split('.', 1)[1]) for col in sort_columns])
+
+    standardized_list = [p for p in (INTERNADO_PLAN.map_dict(row) for row in raw_results) if p]
+    _attach_last_diaries(standardized_list)
+
+    return standardized_list, next_cursor, total_patients
+
+
+def _fetch_patient_header(patient_id_str: str, specialty_id: str | None) -> tuple[Decimal, dict]:
+    """
+    Fetches the standardized header of a patient, ensuring they belong to the
+    selected specialty (if one is provided). Returns its primary key and header.
     """
     try:
         pk_decimal = Decimal(patient_id_str)
@@ -308,7 +1027,7 @@ def get_patient_details_all(patient_id_str: str, specialty_id: str | None) -> di
         sql += f" AND i.servicoID = {PARAM_STYLE}"
         params.append(specialty_id)
 
-    raw_details = _execute_query(sql=sql, params=params, fetch_one=True)
+    raw_details = _execute_query('get_patient_details', sql=sql, params=params, fetch_one=True)
     
     if not raw_details:
         if specialty_id:
@@ -317,38 +1036,151 @@ def get_patient_details_all(patient_id_str: str, specialty_id: str | None) -> di
         else:
             raise Http404("Patient not found.")
         
-    context = _standardize_internado(raw_details)
+    context = INTERNADO_PLAN.map_dict(raw_details)
     if not context:
         raise ValueError("Failed to standardize patient details.")
+    return pk_decimal, context
+
+@_replica_fallback('get_patient_details_all')
+def get_patient_details_all(patient_id_str: str, specialty_id: str | None, concurrent: bool | None = None) -> dict | None:
+    """
+    Aggregates all information for a single patient, ensuring they belong
+    to the selected specialty (if one is provided).
+
+    With `concurrent` (default: `settings.DAL_CONCURRENT_SECTIONS`) the section
+    queries run in parallel; sections that fail or time out are returned empty
+    and listed under 'failed_sections'.
+    """
+    pk_decimal, context = _fetch_patient_header(patient_id_str, specialty_id)
     
     # Fetch related data using the primary key
+    if concurrent is None:
+        concurrent = getattr(settings, 'DAL_CONCURRENT_SECTIONS', False)
+    if concurrent:
+        context.update(_fetch_sections_concurrently(pk_decimal))
+    else:
+        context.update(_fetch_admission_notes(pk_decimal))
+        for section, sql_key, plan in PATIENT_SECTIONS:
+            if section == 'diarios':
+                context.update(_fetch_diaries(pk_decimal))
+            else:
+                context[section] = _fetch_section(sql_key, plan, pk_decimal)
+
+    return context
+
+@_replica_fallback('get_patient_header')
+def get_patient_header(patient_id_str: str, specialty_id: str | None) -> dict:
+    """Returns the header of a patient (name, room, bed, admission, specialty) without its sections."""
+    return _fetch_patient_header(patient_id_str, specialty_id)[1]
+
+@_replica_fallback('get_patient_section')
+def get_patient_section(patient_id_str: str, specialty_id: str | None, section: str, fields: list[str] | None = None, offset: int = 0, limit: int | None = None) -> dict:
+    """
+    Returns one section (see `SECTION_NAMES`) of a patient, ensuring they
+    belong to the selected specialty (if one is provided).
+
+    Sections in `PAGINATED_SECTIONS` are read `limit` items at a time from
+    `offset`, in the order of their query (most recent first), with the DBMS
+    pagination clause; the other sections are returned whole. `fields`
+    projects the items on those standardized keys.
+
+    Returns {'items': [...], 'offset': int, 'has_more': bool}.
+    """
+    validate_section_request(section, fields)
+    pk_decimal, _ = _fetch_patient_header(patient_id_str, specialty_id)
+
+    has_more = False
+    if section not in _SECTION_QUERIES:
+        items = _fetch_admission_notes(pk_decimal)[section]
+        offset = 0
+    elif section in PAGINATED_SECTIONS and limit:
+        sql_key, plan = _SECTION_QUERIES[section]
+        params = [pk_decimal]
+        # Diaries are paginated within the diary window
+        window = _diary_window() if section == 'diarios' else None
+        if window is not None:
+            sql_key = 'get_diarios_window'
+            params += window
+        sql = _get_config_value(f"queries.{sql_key}").strip().rstrip(';')
+        # One extra row tells whether there is a next page
+        sql, page_params = _fetch_first_rows_sql(sql, limit + 1, offset)
+        columns, rows = _execute_query(sql_key, sql=sql, params=params + page_params, as_tuples=True)
+        items = plan.map_rows(columns, rows)
+        has_more = len(items) > limit
+        items = items[:limit]
+    elif section == 'diarios':
+        items = _fetch_diaries(pk_decimal)['diarios']
+        offset = 0
+    else:
+        sql_key, plan = _SECTION_QUERIES[section]
+        items = _fetch_section(sql_key, plan, pk_decimal)
+        offset = 0
+
+    return {'items': project_section_items(items, fields), 'offset': offset, 'has_more': has_more}
+
+def get_patient_details_many(episode_ids) -> dict[str, dict]:
+    """
+    Batch version of `get_patient_details_all` (without specialty filter).
+
+    Fetches each section for a whole chunk of episodes with a single IN-list
+    query and groups the rows in Python, so the number of round trips depends
+    on the number of sections rather than on the number of patients.
+
+    Returns a dict mapping each found episode ID (as a string) to the same
+    standardized structure returned by `get_patient_details_all`.
+    """
+    try:
+        pk_list = [Decimal(str(episode_id)) for episode_id in episode_ids]
+    except (ValueError, TypeError, InvalidOperation):
+        raise ValueError("Invalid patient ID in batch.")
+
     history_code = _get_config_value('parameters.ainicial_antecedentes_item')
     diagnosis_code = _get_config_value('parameters.ainicial_diagnostico_item')
-    admission_note_items = _execute_query('get_ainicial_items', params=[pk_decimal, history_code, diagnosis_code])
-    
-    # Use dict.fromkeys to get unique values while preserving order
-    context['antecedentes'] = list(dict.fromkeys(i.get('VALOR') for i in admission_note_items if i.get('ITEM') == history_code and i.get('VALOR')))
-    context['diagnostico'] = list(dict.fromkeys(i.get('VALOR') for i in admission_note_items if i.get('ITEM') == diagnosis_code and i.get('VALOR')))
-
-    # Fetch all other related information sections
-    context['telefone'] = [_standardize_telefone(t) for t in _execute_query('get_telefone', params=[pk_decimal]) if t]
-    context['observacoes'] = [_standardize_observacoes(o) for o in _execute_query('get_observacoes', params=[pk_decimal]) if o]
-    context['pessoa_signif'] = [_standardize_pessoa_signif(p) for p in _execute_query('get_pessoa_signif', params=[pk_decimal]) if p]
-    context['fenomenos'] = [_standardize_fenomeno(f) for f in _execute_query('get_fenomenos', params=[pk_decimal]) if f]
-    context['medicacao'] = [_standardize_medicacao(m) for m in _execute_query('get_medicacao', params=[pk_decimal]) if m]
-    context['atitudes_terapeuticas'] = [_standardize_atitude(a) for a in _execute_query('get_atitudes', params=[pk_decimal]) if a]
-    context['analises'] = [_standardize_analise(a) for a in _execute_query('get_analises', params=[pk_decimal]) if a]
-    context['exames'] = [_standardize_exame(e) for e in _execute_query('get_exames', params=[pk_decimal]) if e]
-    context['diarios'] = [_standardize_diario(d) for d in _execute_query('get_diarios', params=[pk_decimal]) if d]
+    # Oracle rejects IN-lists with more than 1000 expressions
+    chunk_size = int(_get_config_value('parameters.batch_max_in_list', 1000))
+    diary_window = _diary_window()
 
-    return context
+    details = {}
+    for start in range(0, len(pk_list), chunk_size):
+        chunk = pk_list[start:start + chunk_size]
+
+        headers = [INTERNADO_PLAN.map_dict(r) for r in _execute_batch_query('get_patient_details', chunk) if r]
+        headers = {h['episode_id']: h for h in headers if h}
+        if not headers:
+            continue
+
+        notes = _group_by_episode(_execute_batch_query('get_ainicial_items', chunk, [history_code, diagnosis_code]))
+        sections = {}
+        for section, sql_key, plan in PATIENT_SECTIONS:
+            if section == 'diarios' and diary_window is not None:
+                columns, rows = _execute_batch_query('get_diarios_window', chunk, diary_window, as_tuples=True)
+                diary_columns = columns
+            else:
+                columns, rows = _execute_batch_query(sql_key, chunk, as_tuples=True)
+            sections[section] = (plan.bind(columns), _group_tuples_by_episode(columns, rows) if rows else {})
+
+        for episode_id, context in headers.items():
+            context.update(_split_admission_notes(notes.get(episode_id, []), history_code, diagnosis_code))
+            for section, (extract, grouped) in sections.items():
+                context[section] = [extract(r) for r in grouped.get(episode_id, [])]
+            context['diarios_omitidos'] = 0
+            if diary_window is not None:
+                context['diarios_omitidos'] = _omitted_diaries(diary_columns, sections['diarios'][1].get(episode_id, []))
+            details[episode_id] = context
 
+    return details
+
+@_replica_fallback('get_patient_id_by_name')
 def get_patient_id_by_name(patient_name: str, specialty_id: str | None) -> str | None:
     """
     Finds the episode ID of the most recent patient matching a name,
     scoped to a specific specialty.
     """
     try:
+        matches = name_index.search(patient_name, specialty_id, limit=1)
+        if matches:
+            return matches[0]['episode_id']
+
         sql = _get_config_value('queries.get_patient_id_by_name')
         params = [f"%{patient_name.upper()}%"]
 
@@ -356,7 +1188,7 @@ def get_patient_id_by_name(patient_name: str, specialty_id: str | None) -> str |
             sql = sql.replace("WHERE", f"WHERE i.servicoID = {PARAM_STYLE} AND")
             params.insert(0, specialty_id) 
         
-        result = _execute_query(sql=sql, params=params, fetch_one=True)
+        result = _execute_query('get_patient_id_by_name', sql=sql, params=params, fetch_one=True)
         
         if result:
             pk_col = _get_config_value('columns.internado_pk')
@@ -68,6 +68,10 @@ def format_context(patient_data: dict) -> dict:
     context['hora_entrada'] = patient_data.get('hora_entrada')
     context['data_saida'] = patient_data.get('data_saida')
     context['hora_saida'] = patient_data.get('hora_saida')
+    # Sections that could not be loaded (concurrent DAL mode only)
+    context['failed_sections'] = ', '.join(patient_data.get('failed_sections', []))
+    # Sync time of the local replica, when the data did not come from the hospital database
+    context['data_as_of'] = patient_data.get('data_as_of', '')
 
     # Convert lists to comma-separated strings
     context['antecedentes'] = ' ,'.join(patient_data.get('antecedentes', []))
@@ -109,5 +113,7 @@ def format_context(patient_data: dict) -> dict:
         + f"<span style='padding-left: 15px;'>{d.get('diario', '').replace(chr(10), '<br>')}</span>"
         for d in patient_data.get('diarios', [])
     ])
+    # Older entries left out by the diary window (DIARY_WINDOW_DAYS / DIARY_WINDOW_ENTRIES)
+    context['diarios_omitidos'] = patient_data.get('diarios_omitidos', 0)
     
     return context
\ No newline at end of file
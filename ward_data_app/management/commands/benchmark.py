@@ -0,0 +1,128 @@
+"""
+Runs the DAL / PDF benchmarks on synthetic hospital databases.
+
+    DB_TYPE=sqlite HOSPITAL_CONFIG_PATH=configs/config.sqlite.json \\
+        python manage.py benchmark --patients 100,1000,5000
+
+Writes `benchmarks/results/<UTC time>-<git commit>.json` and prints the
+change of the median latencies against the previous results file.
+"""
+import os
+import json
+import time
+import platform
+import datetime
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ward_data_app import benchmark
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the DAL, format_context and the PDF pipeline on synthetic hospital databases (SQLite)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', default='100,1000,5000',
+                            help="Comma-separated census sizes (default: 100,1000,5000).")
+        parser.add_argument('--samples', type=int, default=50,
+                            help="Calls per DAL / formatting benchmark (default: 50).")
+        parser.add_argument('--pdf-samples', type=int, default=10,
+                            help="PDFs generated per census size (default: 10).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--data-dir', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'data'),
+                            help="Where the synthetic databases are written (reused if present).")
+        parser.add_argument('--results-dir', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'results'))
+        parser.add_argument('--rebuild', action='store_true', help="Regenerate the synthetic databases.")
+
+    def handle(self, *args, **options):
+        if not benchmark.hospital_is_synthetic():
+            raise CommandError(
+                "The benchmarks write their own hospital database: run them with DB_TYPE=sqlite and "
+                "HOSPITAL_CONFIG_PATH=configs/config.sqlite.json, never against the hospital EHR."
+            )
+        try:
+            scales = [int(value) for value in options['patients'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError("--patients must be a comma-separated list of integers.")
+
+        os.makedirs(options['data_dir'], exist_ok=True)
+        report = {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'samples': options['samples'],
+            'pdf_samples': options['pdf_samples'],
+            'seed': options['seed'],
+            'scales': {},
+        }
+
+        for patients in scales:
+            path = os.path.join(options['data_dir'], f"hospital_{patients}_{options['seed']}.sqlite3")
+            scale = {}
+            if options['rebuild'] or not os.path.exists(path):
+                self.stdout.write(f"Generating {patients} synthetic inpatients in {path}...")
+                started = time.perf_counter()
+                scale['rows'] = benchmark.build_synthetic_hospital(path, patients, seed=options['seed'])
+                scale['generation_seconds'] = round(time.perf_counter() - started, 2)
+
+            benchmark.use_hospital_database(path)
+            self.stdout.write(f"Benchmarking {patients} inpatients...")
+            scale['benchmarks'] = benchmark.run_benchmarks(
+                patients, samples=options['samples'], pdf_samples=options['pdf_samples'], seed=options['seed'])
+            report['scales'][str(patients)] = scale
+            for name, stats in scale['benchmarks'].items():
+                if stats.get('iterations'):
+                    size = f"  {stats['avg_pdf_bytes'] / 1e3:>8.1f} kB/PDF" if 'avg_pdf_bytes' in stats else ''
+                    self.stdout.write(f"  {name:28} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  "
+                                      f"{stats['ops_per_second']:>8.1f} ops/s{size}")
+                else:
+                    self.stdout.write(f"  {name:28} skipped ({stats.get('skipped', 'no samples')})")
+
+        previous = self._latest_results(options['results_dir'])
+        os.makedirs(options['results_dir'], exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        output = os.path.join(options['results_dir'], f"{stamp}-{report['git_commit'] or 'nogit'}.json")
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if previous:
+            self._compare(previous, report)
+
+    @staticmethod
+    def _latest_results(results_dir):
+        try:
+            names = sorted(name for name in os.listdir(results_dir) if name.endswith('.json'))
+        except FileNotFoundError:
+            return None
+        if not names:
+            return None
+        path = os.path.join(results_dir, names[-1])
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)
+        previous['path'] = path
+        return previous
+
+    def _compare(self, previous, report):
+        self.stdout.write(f"Median latency vs {os.path.basename(previous['path'])} (commit {previous.get('git_commit')}):")
+        for patients, scale in report['scales'].items():
+            before = previous.get('scales', {}).get(patients, {}).get('benchmarks', {})
+            for name, stats in scale['benchmarks'].items():
+                old = before.get(name, {}).get('p50_ms')
+                new = stats.get('p50_ms')
+                if old and new:
+                    change = (new - old) / old * 100
+                    line = f"  {patients:>6} {name:28} {old:>9.2f} -> {new:>9.2f} ms ({change:+.1f}%)"
+                    self.stdout.write(self.style.WARNING(line) if change > 10 else line)
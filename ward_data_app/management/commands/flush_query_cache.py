@@ -0,0 +1,24 @@
+"""
+Clears the query cache of every gunicorn and Celery process.
+
+    python manage.py flush_query_cache
+
+Each process keeps its own cache (see `dal`); the command touches
+`settings.QUERY_CACHE_FLUSH_FILE` and each process clears its cache on its
+next cached query, within a second.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ward_data_app import dal
+
+
+class Command(BaseCommand):
+    help = "Clears the hospital query cache of every web and Celery process."
+
+    def handle(self, *args, **options):
+        try:
+            dal.flush_query_cache()
+        except OSError as e:
+            raise CommandError(f"Could not touch {settings.QUERY_CACHE_FLUSH_FILE}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Query cache flush requested ({settings.QUERY_CACHE_FLUSH_FILE})."))
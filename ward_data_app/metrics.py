@@ -0,0 +1,136 @@
+"""
+Prometheus metrics of the portal and the backup workers.
+
+The metrics are defined here and updated by the DAL (query latency and rows,
+query cache),
+the connection pools (checkout waits, timeouts and usage), `MetricsMiddleware` (request latency per view), the PDF renderer (render
+duration and PDF size) and the backup tasks (cycle duration, patients
+processed, retries). They are exposed by the `/metrics` view.
+
+gunicorn and Celery run several processes, so in production every service
+sets `PROMETHEUS_MULTIPROC_DIR` to its own directory (prometheus_client then
+keeps the values in files there instead of in memory) and `/metrics` merges
+the files of every directory in `settings.METRICS_COLLECT_DIRS`, which lets
+the web container also report the Celery workers. Without it, `/metrics`
+only reports the process that serves the scrape.
+"""
+import os
+import glob
+
+from django.conf import settings
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Hospital DB queries (cache hits are not counted)
+DAL_QUERY_DURATION = Histogram(
+    'ward_dal_query_duration_seconds',
+    'Time spent executing hospital DB queries (until the rows are fetched; streamed queries until execute returns).',
+    ['sql_key'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DAL_QUERY_ROWS = Counter('ward_dal_query_rows', 'Rows returned by hospital DB queries.', ['sql_key'])
+DAL_QUERY_ERRORS = Counter('ward_dal_query_errors', 'Hospital DB queries that raised.', ['sql_key'])
+DAL_CACHE_LOOKUPS = Counter(
+    'ward_dal_query_cache_lookups',
+    'Query cache lookups of the queries with a TTL, by result (hit or miss).',
+    ['sql_key', 'result'],
+)
+DAL_CACHE_ENTRIES = Gauge('ward_dal_query_cache_entries', 'Results held in the query caches.', multiprocess_mode='livesum')
+DAL_CACHE_EVICTIONS = Counter('ward_dal_query_cache_evictions', 'Query cache entries evicted to stay within max_entries.')
+
+# Hospital DB connection pools (`project.db_backends.pool`), per process; gauges sum the live processes
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'ward_db_pool_checkout_wait_seconds',
+    'Time DB connection checkouts waited for a free pooled connection (timed out checkouts included).',
+    ['alias'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_SATURATED_CHECKOUTS = Counter(
+    'ward_db_pool_saturated_checkouts',
+    'DB connection checkouts that found every pooled connection in use and had to wait.',
+    ['alias'],
+)
+DB_POOL_TIMEOUTS = Counter('ward_db_pool_checkout_timeouts', 'DB connection checkouts that timed out.', ['alias'])
+DB_POOL_IN_USE = Gauge('ward_db_pool_connections_in_use', 'Pooled DB connections checked out.', ['alias'], multiprocess_mode='livesum')
+DB_POOL_MAX_SIZE = Gauge('ward_db_pool_connections_max', 'Maximum size of the DB connection pools.', ['alias'], multiprocess_mode='livesum')
+DB_POOL_SATURATION = Gauge(
+    'ward_db_pool_saturation_ratio',
+    'Connections in use over the pool maximum, in the most saturated process.',
+    ['alias'],
+    multiprocess_mode='livemax',
+)
+
+# HTTP requests
+HTTP_REQUEST_DURATION = Histogram(
+    'ward_http_request_duration_seconds',
+    'Time spent serving HTTP requests, by view.',
+    ['view', 'method', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+# PDF rendering ('patient' reports and ward 'booklet's)
+PDF_RENDER_DURATION = Histogram(
+    'ward_pdf_render_duration_seconds',
+    'Time spent rendering PDFs with WeasyPrint (template, layout and write).',
+    ['kind'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+PDF_ON_DEMAND = Counter(
+    'ward_pdf_on_demand',
+    'PDFs requested from the web app, by source (fresh backup file, rendered in the request or by a PDF job).',
+    ['source'],
+)
+PDF_SIZE = Histogram(
+    'ward_pdf_size_bytes',
+    'Size of the rendered PDFs.',
+    ['kind'],
+    buckets=(25e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6, 25e6),
+)
+
+# Backup cycles
+BACKUP_CYCLE_DURATION = Histogram(
+    'ward_backup_cycle_duration_seconds',
+    'Duration of the PDF backup cycles, from scheduling to the last chunk.',
+    buckets=(30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400),
+)
+BACKUP_PATIENTS = Counter('ward_backup_patients', 'Patients processed by the backup cycles, by outcome.', ['outcome'])
+BACKUP_BYTES_WRITTEN = Counter(
+    'ward_backup_bytes_written',
+    'Bytes of PDF written to the offline backup, by kind (patient or booklet).',
+    ['kind'],
+)
+BACKUP_RETRIES = Counter('ward_backup_task_retries', 'Retries scheduled by the backup tasks.', ['task'])
+BACKUP_LAST_CYCLE = Gauge(
+    'ward_backup_last_cycle_timestamp_seconds',
+    'Unix time at which the last backup cycle finished.',
+    multiprocess_mode='max',
+)
+
+
+def query_label(sql_key):
+    """Label of a DAL query: its configured key ('raw' for ad hoc SQL)."""
+    return sql_key or 'raw'
+
+
+class _MultiDirectoryCollector:
+    """Merges the multiprocess files of several directories (one per service)."""
+
+    def __init__(self, directories):
+        self.directories = directories
+
+    def collect(self):
+        files = []
+        for directory in self.directories:
+            files.extend(glob.glob(os.path.join(directory, '*.db')))
+        return MultiProcessCollector.merge(files, accumulate=True)
+
+
+def render_latest():
+    """Returns the current metrics in the Prometheus text format, with its content type."""
+    directories = getattr(settings, 'METRICS_COLLECT_DIRS', [])
+    if directories and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        registry.register(_MultiDirectoryCollector(directories))
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
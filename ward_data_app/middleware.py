@@ -0,0 +1,87 @@
+"""
+Middleware of the `ward_data_app` application.
+"""
+import time
+
+from django.conf import settings
+
+from . import dal, metrics, query_trace
+from .replica import format_as_of
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every request in `metrics.HTTP_REQUEST_DURATION`,
+    labelled by view name (first in `MIDDLEWARE`, so it covers the whole stack).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.HTTP_REQUEST_DURATION.labels(view, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+        return response
+
+
+class QueryTraceMiddleware:
+    """
+    Traces the hospital queries of every request. With DEBUG, the response
+    gets a `Server-Timing` header with the DB time and the slowest query keys
+    (shown by the browser dev tools).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trace = query_trace.start('request', f"{request.method} {request.path}")
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            query_trace.finish()
+            raise
+        query_trace.detach()
+        if settings.DEBUG and trace.queries:
+            response['Server-Timing'] = trace.server_timing()
+        if response.streaming and getattr(response, 'file_to_stream', None) is None:
+            # A streamed body (e.g. the census export) runs its queries while
+            # it is iterated, after this method returns (files, sent with the
+            # server's file wrapper, run none)
+            response.streaming_content = self._traced_content(response.streaming_content, trace)
+        else:
+            query_trace.finish(trace)
+        return response
+
+    @staticmethod
+    def _traced_content(content, trace):
+        """Iterates a streamed body recording into `trace`, which ends when the body is closed."""
+        try:
+            with query_trace.attached(trace):
+                yield from content
+        finally:
+            query_trace.finish(trace)
+
+
+class DataSourceMiddleware:
+    """
+    Marks responses built (even partly) from the local census replica with the
+    `X-Data-Source: replica` and `X-Data-As-Of` headers, so the pages can show
+    the "data as of" watermark (see `dal.get_read_mode`).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        dal.reset_read_source()
+        response = self.get_response(request)
+        if dal.served_from_replica():
+            response['X-Data-Source'] = 'replica'
+            response['X-Data-As-Of'] = format_as_of(dal.get_replica_as_of())
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-17 03:49
+
+from django.db import migrations, models
+import ward_data_app.records
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CensusPatient',
+            fields=[
+                ('episode_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('episode_number', models.DecimalField(db_index=True, decimal_places=0, max_digits=38, null=True)),
+                ('specialty_id', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('patient_name', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('admission_date', models.DateField(db_index=True, null=True)),
+                ('admission_time', models.IntegerField(null=True)),
+                ('header', models.JSONField(default=dict, encoder=ward_data_app.records.RecordJSONEncoder)),
+                ('sections', models.JSONField(default=dict, encoder=ward_data_app.records.RecordJSONEncoder)),
+                ('last_diary', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['episode_number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CensusSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('synced_at', models.DateTimeField(null=True)),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('patients', models.IntegerField(default=0)),
+                ('specialties', models.JSONField(default=list, encoder=ward_data_app.records.RecordJSONEncoder)),
+                ('last_attempt_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+    ]
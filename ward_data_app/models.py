@@ -0,0 +1,54 @@
+"""
+Models of the local census replica.
+
+The hospital database has no Django models (it is queried through the DAL).
+These models hold a periodic copy of the census and of the standardized
+patient sections in the internal 'default' database, so the portal can keep
+serving read-only data (marked with its "data as of" time) when the hospital
+database is unreachable. They are routed to 'default' by `HospitalRouter`
+through the `local_replica` flag and only written by `replica.sync_census_replica`.
+"""
+from django.db import models
+
+from .records import RecordJSONEncoder
+
+
+class CensusPatient(models.Model):
+    """One interned patient, as of the last replica sync."""
+
+    local_replica = True
+
+    episode_id = models.CharField(max_length=64, primary_key=True)
+    # Numeric episode ID, for sorting like the hospital database does
+    episode_number = models.DecimalField(max_digits=38, decimal_places=0, null=True, db_index=True)
+    specialty_id = models.CharField(max_length=64, blank=True, db_index=True)
+    patient_name = models.CharField(max_length=255, blank=True, db_index=True)
+    admission_date = models.DateField(null=True, db_index=True)
+    admission_time = models.IntegerField(null=True)
+    # Standardized header (as in the patient lists) and sections (as in `get_patient_details_all`)
+    header = models.JSONField(default=dict, encoder=RecordJSONEncoder)
+    sections = models.JSONField(default=dict, encoder=RecordJSONEncoder)
+    last_diary = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['episode_number']
+
+    def __str__(self):
+        return f"{self.episode_id} - {self.patient_name}"
+
+
+class CensusSyncState(models.Model):
+    """Single row with the outcome of the replica syncs."""
+
+    local_replica = True
+
+    synced_at = models.DateTimeField(null=True)
+    duration_seconds = models.FloatField(default=0)
+    patients = models.IntegerField(default=0)
+    # Rows of the `get_specialties` query, served by the specialty selection page
+    specialties = models.JSONField(default=list, encoder=RecordJSONEncoder)
+    last_attempt_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Census replica as of {self.synced_at}"
@@ -0,0 +1,209 @@
+"""
+In-memory patient name index.
+
+Searching names with `UPPER(name) LIKE '%X%'` scans the patient identity view
+over the DB link and is accent-sensitive ("JOAO" does not find "JOÃO"). This
+module keeps, per process, an index of the active inpatients built from the
+census (`dal.get_census_entries`) and refreshed every
+`settings.NAME_INDEX_REFRESH_SECONDS`. Names are normalized with
+`utils.normalize_name` (NFKD, no accents, upper case) and indexed by
+character trigrams; a query intersects the posting lists of its trigrams and
+verifies the few candidates, so a search takes well under a millisecond for
+a hospital-sized census.
+
+The index is built and refreshed in a background thread, never in the
+request that finds it missing or stale (which keeps using the previous
+index, or the SQL search while there is none). Patients admitted after the
+last refresh are not in the index yet; callers fall back to SQL when it
+finds nothing.
+"""
+import time
+import heapq
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from .logging_config import setup_logger
+from .utils import normalize_name
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+NGRAM_SIZE = 3
+
+
+def _ngrams(text):
+    """Returns the set of character trigrams of a normalized text."""
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class NameIndex:
+    """
+    Trigram index over census entries (dicts with 'episode_id', 'patient_name',
+    'specialty_id' and 'admitted', among other list fields).
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.by_episode = {str(entry.get('episode_id')): entry for entry in self.entries}
+        self.names = [normalize_name(entry.get('patient_name') or '') for entry in self.entries]
+        self.words = [name.split() for name in self.names]
+        self.postings = {}
+        # Word prefixes shorter than a trigram, for one- and two-letter queries
+        self.prefixes = {}
+        for position, name in enumerate(self.names):
+            # Padding makes word boundaries part of the trigrams (" JO", "AO ")
+            for gram in _ngrams(f" {name} "):
+                self.postings.setdefault(gram, set()).add(position)
+            for word in self.words[position]:
+                for length in range(1, NGRAM_SIZE):
+                    self.prefixes.setdefault(word[:length], set()).add(position)
+        # Tie-break rank of each entry: most recent admission first, then name
+        by_name = sorted(range(len(self.entries)), key=lambda p: self.names[p])
+        by_recency = sorted(by_name, key=lambda p: self.entries[p].get('admitted') or '', reverse=True)
+        self.rank = [0] * len(self.entries)
+        for rank, position in enumerate(by_recency):
+            self.rank[position] = rank
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _candidates(self, tokens):
+        """
+        Positions whose name contains every trigram of the query tokens (and a
+        word starting with each shorter token).
+        """
+        postings = []
+        for token in tokens:
+            if len(token) < NGRAM_SIZE:
+                postings.append(self.prefixes.get(token, set()))
+            else:
+                postings.extend(self.postings.get(gram, set()) for gram in _ngrams(token))
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return candidates
+
+    def _score(self, position, query, tokens):
+        """Ranks a match: exact name, name prefix, word prefixes, then any substring."""
+        name = self.names[position]
+        if name.startswith(query):
+            return 100 if name == query else 80
+        if not all(token in name for token in tokens):
+            return 0
+        words = self.words[position]
+        if all(any(word.startswith(token) for word in words) for token in tokens):
+            return 60
+        return 40
+
+    def search(self, query, specialty_id=None, limit=10):
+        """
+        Returns up to `limit` entries matching every word of `query` (in any
+        order, accent- and case-insensitive), best matches first and, among
+        equal matches, the most recent admissions first. Each result is a copy
+        of the entry with its 'score'. Numeric queries match episode ID prefixes.
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+        specialty_id = str(specialty_id) if specialty_id else None
+
+        matches = []
+        if query.isdigit():
+            for position, entry in enumerate(self.entries):
+                if str(entry.get('episode_id', '')).startswith(query):
+                    matches.append((100 if entry.get('episode_id') == query else 80, position))
+        else:
+            tokens = query.split()
+            for position in self._candidates(tokens):
+                score = self._score(position, query, tokens)
+                if score:
+                    matches.append((score, position))
+
+        if specialty_id:
+            matches = [m for m in matches if str(self.entries[m[1]].get('specialty_id')) == specialty_id]
+        rank = self.rank
+        best = heapq.nsmallest(limit, matches, key=lambda m: (-m[0], rank[m[1]]))
+
+        results = []
+        for score, position in best:
+            result = dict(self.entries[position])
+            result['score'] = score
+            results.append(result)
+        return results
+
+
+# -----------------------------------------------------------------------------
+# Per-process index
+# -----------------------------------------------------------------------------
+
+_index = None
+_lock = threading.Lock()
+_retry_after = 0.0
+
+
+def _is_stale(index):
+    return time.time() - index.built_at >= getattr(settings, 'NAME_INDEX_REFRESH_SECONDS', 300)
+
+
+def _rebuild():
+    """Builds the index of this process (background thread started holding `_lock`)."""
+    global _index, _retry_after
+    try:
+        from . import dal
+        started = time.perf_counter()
+        try:
+            _index = NameIndex(dal.get_census_entries())
+        except Exception as e:
+            # Do not retry a failing census query on every keystroke
+            _retry_after = time.monotonic() + 30
+            logger.error(f"Could not build the patient name index: {e}", exc_info=True)
+            return
+        logger.info(f"Patient name index built: {len(_index)} patients in "
+                    f"{(time.perf_counter() - started) * 1000:.0f} ms.")
+    finally:
+        # The connections of this thread are not closed by any request
+        connections.close_all()
+        _lock.release()
+
+
+def get_name_index():
+    """
+    Returns the index of this process, starting a background build when it
+    is missing or stale. Until the build finishes, the previous index is
+    returned (None if there is none yet).
+    """
+    index = _index
+    if index is not None and not _is_stale(index):
+        return index
+    if time.monotonic() < _retry_after:
+        return index
+    # Released by the build thread; skipped if a build is already running
+    if _lock.acquire(blocking=False):
+        try:
+            threading.Thread(target=_rebuild, name='name-index-build', daemon=True).start()
+        except Exception:
+            _lock.release()
+            raise
+    return index
+
+
+def get_entry(episode_id):
+    """Returns the census entry of an episode from the index of this process, or None."""
+    index = get_name_index()
+    if index is None:
+        return None
+    return index.by_episode.get(str(episode_id))
+
+
+def search(query, specialty_id=None, limit=10):
+    """Searches the index of this process. Returns None if the index is not available."""
+    index = get_name_index()
+    if index is None:
+        return None
+    return index.search(query, specialty_id=specialty_id, limit=limit)
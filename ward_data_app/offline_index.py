@@ -0,0 +1,114 @@
+"""
+Static search page for the offline backup.
+
+`<OFFLINE_BACKUP_DIR>/index.html` lists every patient in the backup
+(episode, name, specialty, room, bed and when their PDF was generated) as
+JSON embedded in the page, with a client-side search linking to the PDFs.
+It needs no server: during downtime it is opened straight from the file
+system (file://).
+
+The rows are kept in `<BACKUP_MANIFEST_DIR>/offline_index/rows.json`, updated
+by every backup chunk from the manifest entries of the patients it wrote or
+confirmed (and by the cycle for discharged patients), under a file lock
+shared by the Celery workers. The page is only rewritten when a row
+changed; the PDF tree is never rescanned.
+"""
+import os
+import time
+import fcntl
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from . import backup_manifest
+from .logging_config import setup_logger
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+INDEX_TEMPLATE_NAME = 'dadosenfermaria/offline-index.html'
+INDEX_FILENAME = 'index.html'
+
+
+def index_path():
+    """Path of the static search page."""
+    return os.path.join(settings.OFFLINE_BACKUP_DIR, INDEX_FILENAME)
+
+
+def _state_dir():
+    # Not directly in the manifest directory, whose JSON files are the patient entries
+    return os.path.join(settings.BACKUP_MANIFEST_DIR, 'offline_index')
+
+
+def _rows_path():
+    return os.path.join(_state_dir(), 'rows.json')
+
+
+@contextmanager
+def _locked():
+    """Serializes the index updates of the Celery workers (read-modify-write of the rows)."""
+    os.makedirs(_state_dir(), exist_ok=True)
+    with open(os.path.join(_state_dir(), 'rows.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _row(episode_id, entry):
+    """Builds the compact index row of a manifest entry, or None if its PDF is missing."""
+    file_path = entry.get('file_path') if entry else None
+    try:
+        generated_at = os.path.getmtime(file_path)
+    except (OSError, TypeError):
+        return None
+    return {
+        'e': str(episode_id),
+        'n': entry.get('patient_name') or '',
+        's': entry.get('specialty_name') or '',
+        'r': str(entry.get('sala') or ''),
+        'b': str(entry.get('cama') or ''),
+        'f': os.path.relpath(file_path, settings.OFFLINE_BACKUP_DIR).replace(os.sep, '/'),
+        't': int(generated_at),
+    }
+
+
+def _write_page(rows):
+    ordered = sorted(rows.values(), key=lambda row: (row['s'], row['r'], row['e']))
+    html = render_to_string(INDEX_TEMPLATE_NAME, {'rows': ordered, 'updated_at': int(time.time())})
+    path = index_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+
+
+def update(episode_ids=(), removed_ids=()):
+    """
+    Refreshes the rows of `episode_ids` from their manifest entries and drops
+    `removed_ids`, rewriting the page if anything changed (or it is missing).
+    Returns True if the page was rewritten.
+    """
+    if not settings.BACKUP_OFFLINE_INDEX:
+        return False
+    with _locked():
+        rows = backup_manifest.read_json(_rows_path()) or {}
+        changed = False
+        for episode_id in removed_ids:
+            changed |= rows.pop(str(episode_id), None) is not None
+        for episode_id in episode_ids:
+            episode_id = str(episode_id)
+            row = _row(episode_id, backup_manifest.get_entry(episode_id))
+            if row is None:
+                changed |= rows.pop(episode_id, None) is not None
+            elif rows.get(episode_id) != row:
+                rows[episode_id] = row
+                changed = True
+        if not changed and os.path.exists(index_path()):
+            return False
+        backup_manifest.write_json(_rows_path(), rows)
+        _write_page(rows)
+    logger.debug(f"Offline index rewritten ({len(rows)} patients).")
+    return True
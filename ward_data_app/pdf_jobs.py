@@ -0,0 +1,120 @@
+"""
+On-demand PDF jobs.
+
+Rendering a chart with WeasyPrint takes seconds; done inside a gunicorn
+worker (2 workers x 2 threads) a few concurrent "Generate PDF" clicks block
+the whole web tier and large charts can reach the gunicorn timeout. Instead,
+the web app creates a job here and enqueues `tasks.render_pdf_job` on the
+dedicated `pdf_jobs` queue (its own Celery worker, so on-demand PDFs never
+wait behind a backup cycle); the browser polls the job status and downloads
+the file once it is done.
+
+Each job is a small JSON file (and, once rendered, its PDF) under
+`settings.PDF_JOBS_DIR`, shared by the web and Celery containers. Jobs
+older than `settings.PDF_JOB_TTL` seconds are removed by the render task;
+jobs still queued or running after `settings.PDF_JOB_TIMEOUT` seconds (e.g.
+the worker is down) are marked failed, so the browser stops polling them.
+"""
+import os
+import time
+import uuid
+import logging
+
+from django.conf import settings
+
+from .backup_manifest import read_json, remove_file, write_json
+from .logging_config import setup_logger
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+# Job states: 'queued' -> 'running' (stage 'loading', then 'rendering') -> 'done' or 'failed'
+FINISHED_STATES = ('done', 'failed')
+
+
+def _job_path(job_id):
+    return os.path.join(settings.PDF_JOBS_DIR, f"{job_id}.json")
+
+
+def pdf_path(job_id):
+    """Path of the PDF rendered by a job."""
+    return os.path.join(settings.PDF_JOBS_DIR, f"{job_id}.pdf")
+
+
+def create_job(patient_id, specialty_id, username, base_url):
+    """Records a new queued job for a patient's PDF and returns it."""
+    job = {
+        'id': uuid.uuid4().hex,
+        'patient_id': str(patient_id),
+        'specialty_id': specialty_id,
+        'username': username,
+        'base_url': base_url,
+        'status': 'queued',
+        'stage': None,
+        'progress': 0,
+        'created_at': time.time(),
+        'updated_at': time.time(),
+    }
+    write_json(_job_path(job['id']), job)
+    return job
+
+
+def get_job(job_id):
+    """Returns a job, or None if it does not exist (or the ID is not a job ID)."""
+    if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    return read_json(_job_path(job_id))
+
+
+def update_job(job_id, **fields):
+    """Updates the given fields of a job. Returns the job (None if it no longer exists)."""
+    job = get_job(job_id)
+    if job is None:
+        return None
+    job.update(fields, updated_at=time.time())
+    write_json(_job_path(job_id), job)
+    return job
+
+
+def fail_if_timed_out(job):
+    """
+    Marks a job still queued or running `settings.PDF_JOB_TIMEOUT` seconds
+    after it was created as failed. Returns the job (updated if it timed out).
+    """
+    if job['status'] in FINISHED_STATES or time.time() - job.get('created_at', 0) <= settings.PDF_JOB_TIMEOUT:
+        return job
+    logger.warning(f"PDF job {job['id']} timed out while {job['status']}.")
+    return update_job(job['id'], status='failed', stage=None, error='PDF generation timed out.') or job
+
+
+def save_pdf(job_id, pdf_bytes):
+    """Atomically writes the PDF of a job."""
+    path = pdf_path(job_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return path
+
+
+def remove_expired_jobs(max_age=None):
+    """Removes the jobs (and PDFs) created more than `max_age` seconds ago. Returns how many were removed."""
+    max_age = settings.PDF_JOB_TTL if max_age is None else max_age
+    try:
+        names = os.listdir(settings.PDF_JOBS_DIR)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    now = time.time()
+    for name in names:
+        job_id, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+        job = get_job(job_id)
+        if job is not None and now - job.get('created_at', now) <= max_age:
+            continue
+        remove_file(pdf_path(job_id))
+        remove_file(_job_path(job_id))
+        removed += 1
+    if removed:
+        logger.info(f"Removed {removed} expired PDF jobs.")
+    return removed
@@ -0,0 +1,159 @@
+"""
+Patient PDF renderer.
+
+Holds the state WeasyPrint needs to render the patient report, loaded once
+per process (per thread, as WeasyPrint objects are not thread-safe) and
+reused for every PDF: the compiled Django template, the report stylesheet
+parsed as a shared `CSS` object, the font configuration and the image cache.
+Celery workers warm it when their process starts; web worker threads build
+it on their first request.
+"""
+import os
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from . import metrics
+from .logging_config import setup_logger
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+# WeasyPrint import is optional, allowing the app to run
+# even if the PDF generation library is not installed.
+try:
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+    WEASYPRINT_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError: the Python package is installed but its native libraries (Pango) are not
+    WEASYPRINT_AVAILABLE = False
+    logger.warning("WeasyPrint library not found. PDF generation is disabled.")
+
+PDF_TEMPLATE_NAME = 'ward_data_app/patient-pdf.html'
+REPORT_BODY_TEMPLATE_NAME = 'ward_data_app/patient-report-body.html'
+BOOKLET_TEMPLATE_NAME = 'ward_data_app/patient-booklet.html'
+PDF_STYLESHEET_PATH = os.path.join(settings.BASE_DIR, 'static', 'css', 'patient-pdf.css')
+
+# WeasyPrint output options per profile (`settings.BACKUP_PDF_PROFILE` for the backup).
+# 'compact' spends render CPU on smaller files by downsampling and recompressing images.
+# Font subsetting and stream compression are already WeasyPrint's defaults, and it has no
+# stronger stream compression: charts without images come out about the same size.
+PDF_PROFILES = {
+    'default': {},
+    'compact': {
+        'optimize_images': True,
+        'jpeg_quality': 75,
+        'dpi': 150,
+    },
+}
+
+
+class PatientPdfRenderer:
+    """
+    Renders formatted patient contexts (see `format_context`) to PDF bytes.
+
+    The timings of the last render are kept in `last_timings` (milliseconds
+    spent in template render, layout and PDF write).
+    """
+
+    def __init__(self):
+        started = time.perf_counter()
+        self.template = get_template(PDF_TEMPLATE_NAME)
+        self.body_template = get_template(REPORT_BODY_TEMPLATE_NAME)
+        self.booklet_template = get_template(BOOKLET_TEMPLATE_NAME)
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(filename=PDF_STYLESHEET_PATH, font_config=self.font_config)
+        self.image_cache = {}
+        self.last_timings = {}
+        logger.info(f"PDF renderer ready in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+    def render_html(self, context):
+        """Renders the report HTML for a formatted context."""
+        return self.template.render(context)
+
+    def render(self, context, base_url, profile='default'):
+        """
+        Renders a formatted context to PDF bytes with the output options of
+        `profile` (see `PDF_PROFILES`).
+
+        `base_url` is used by WeasyPrint to resolve relative URLs (static files, images).
+        """
+        started = time.perf_counter()
+        html_string = self.render_html(context)
+        pdf_bytes = self._write_pdf(html_string, base_url, started, 'patient', profile)
+        logger.debug(f"PDF for patient {context.get('episode_id')} rendered: {self.last_timings}")
+        return pdf_bytes
+
+    def render_booklet(self, title, reports, base_url, profile='default'):
+        """
+        Renders several patient reports into a single PDF in one WeasyPrint pass.
+
+        Each item of `reports` is a dict with the formatted 'context', the
+        outline entry ('bookmark', 'level') and an optional 'group_title'
+        heading printed (and bookmarked) before it.
+        """
+        started = time.perf_counter()
+        items = [
+            {
+                'html': self.body_template.render(report['context']),
+                'bookmark': report['bookmark'],
+                'level': report.get('level', 1),
+                'group_title': report.get('group_title'),
+            }
+            for report in reports
+        ]
+        html_string = self.booklet_template.render({'title': title, 'reports': items})
+        pdf_bytes = self._write_pdf(html_string, base_url, started, 'booklet', profile)
+        logger.debug(f"Booklet '{title}' with {len(items)} reports rendered: {self.last_timings}")
+        return pdf_bytes
+
+    def _write_pdf(self, html_string, base_url, started, kind, profile='default'):
+        """
+        Lays out and writes the HTML as PDF, recording the per-stage timings
+        and the render metrics of `kind` ('patient' or 'booklet').
+        """
+        rendered = time.perf_counter()
+        options = get_profile_options(profile)
+
+        # Image options apply when images are loaded (layout), the others when writing
+        document = HTML(string=html_string, base_url=base_url).render(
+            stylesheets=[self.stylesheet],
+            font_config=self.font_config,
+            cache=self.image_cache,
+            **options,
+        )
+        laid_out = time.perf_counter()
+
+        pdf_bytes = document.write_pdf(**options)
+        written = time.perf_counter()
+
+        self.last_timings = {
+            'template_ms': round((rendered - started) * 1000, 1),
+            'layout_ms': round((laid_out - rendered) * 1000, 1),
+            'write_ms': round((written - laid_out) * 1000, 1),
+        }
+        metrics.PDF_RENDER_DURATION.labels(kind).observe(written - started)
+        metrics.PDF_SIZE.labels(kind).observe(len(pdf_bytes))
+        return pdf_bytes
+
+
+def get_profile_options(profile):
+    """Returns the WeasyPrint options of an output profile ('default' for an unknown one)."""
+    if profile not in PDF_PROFILES:
+        logger.warning(f"Unknown PDF profile '{profile}', using 'default'.")
+        profile = 'default'
+    return PDF_PROFILES[profile]
+
+
+_local = threading.local()
+
+
+def get_renderer():
+    """Returns the renderer of the current thread, creating it on first use."""
+    renderer = getattr(_local, 'renderer', None)
+    if renderer is None:
+        renderer = _local.renderer = PatientPdfRenderer()
+    return renderer
@@ -0,0 +1,73 @@
+"""
+Per-process TTL cache for hospital query results.
+
+Used by `dal._execute_query` to avoid repeating identical queries (same
+query key and bound parameters) for data that barely changes within
+minutes. Each gunicorn/Celery process keeps its own bounded LRU cache,
+so no state is shared between workers.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """A thread-safe, size-bounded LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns (True, value) for a fresh entry, or (False, None)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl):
+        """
+        Stores a value for `ttl` seconds, evicting the least recently used
+        entries if full. Returns the number of entries evicted.
+        """
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        return evicted
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Removes every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the entry count and the hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
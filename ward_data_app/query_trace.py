@@ -0,0 +1,163 @@
+"""
+Per-request / per-task tracing of hospital DB queries.
+
+`middleware.QueryTraceMiddleware` (for requests) and the Celery `task_prerun` /
+`task_postrun` handlers in `tasks` (for tasks) start a `QueryTrace` for the
+current thread; `dal._execute_query` records in it the key, duration and row
+count of every query it runs (and every result it serves from the query
+cache). When the unit of work finishes, a trace that exceeds its query count
+or time budget (`settings.QUERY_BUDGET_*`) is logged as a structured
+(JSON) slow-request record, with the queries aggregated by key, so N+1
+patterns and slow configured queries show up at a glance.
+
+Outside a trace (shell, management commands) recording is a no-op.
+"""
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .logging_config import setup_logger
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+_state = threading.local()
+
+
+class QueryTrace:
+    """The queries run by one request or task."""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished = None
+        self.queries = []
+        # Sections fetched concurrently record from pool threads
+        self._lock = threading.Lock()
+
+    def record(self, sql_key, seconds, rows, cached=False):
+        with self._lock:
+            self.queries.append((sql_key or 'raw', seconds, rows, cached))
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self):
+        """Returns the totals and the queries aggregated by key, slowest key first."""
+        by_key = {}
+        db_seconds = 0.0
+        executed = cache_hits = 0
+        with self._lock:
+            queries = list(self.queries)
+        for sql_key, seconds, rows, cached in queries:
+            entry = by_key.setdefault(sql_key, {'sql_key': sql_key, 'count': 0, 'cached': 0, 'ms': 0.0, 'rows': 0})
+            if cached:
+                entry['cached'] += 1
+                cache_hits += 1
+                continue
+            entry['count'] += 1
+            entry['ms'] += seconds * 1000
+            entry['rows'] += rows
+            db_seconds += seconds
+            executed += 1
+        for entry in by_key.values():
+            entry['ms'] = round(entry['ms'], 1)
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'elapsed_ms': round(self.elapsed * 1000, 1),
+            'queries': executed,
+            'cache_hits': cache_hits,
+            'db_ms': round(db_seconds * 1000, 1),
+            'by_key': sorted(by_key.values(), key=lambda e: e['ms'], reverse=True),
+        }
+
+    def exceeded_budgets(self):
+        """Returns the budgets ('count', 'time') this trace exceeded."""
+        prefix = f"QUERY_BUDGET_{self.kind.upper()}"
+        max_count = getattr(settings, f"{prefix}_COUNT", 0)
+        max_seconds = getattr(settings, f"{prefix}_SECONDS", 0)
+        with self._lock:
+            executed = sum(1 for query in self.queries if not query[3])
+        exceeded = []
+        if max_count and executed > max_count:
+            exceeded.append('count')
+        if max_seconds and self.elapsed > max_seconds:
+            exceeded.append('time')
+        return exceeded
+
+    def server_timing(self):
+        """Formats the trace as a `Server-Timing` header value (total, then the 5 slowest keys)."""
+        summary = self.summary()
+        parts = [f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries, {summary["cache_hits"]} cached"']
+        for entry in summary['by_key'][:5]:
+            if entry['count']:
+                parts.append(f'{entry["sql_key"]};dur={entry["ms"]};desc="x{entry["count"]}, {entry["rows"]} rows"')
+        return ', '.join(parts)
+
+
+def current():
+    """Returns the trace of the current thread, or None."""
+    return getattr(_state, 'trace', None)
+
+
+def record(sql_key, seconds, rows, cached=False):
+    """Records one query in the trace of the current thread, if any."""
+    trace = getattr(_state, 'trace', None)
+    if trace is not None:
+        trace.record(sql_key, seconds, rows, cached)
+
+
+def start(kind, name):
+    """Starts a trace ('request' or 'task') for the current thread."""
+    trace = _state.trace = QueryTrace(kind, name)
+    return trace
+
+
+def detach():
+    """Removes the trace of the current thread without ending it (see `finish`). Returns it, or None."""
+    trace = getattr(_state, 'trace', None)
+    _state.trace = None
+    return trace
+
+
+def finish(trace=None):
+    """
+    Ends `trace` (default: the trace of the current thread), logging it if it
+    exceeded a budget. Returns the trace (or None if none was started).
+    """
+    if trace is None or trace is getattr(_state, 'trace', None):
+        trace = detach()
+    if trace is None or trace.finished is not None:
+        return trace
+    trace.finished = time.perf_counter()
+    exceeded = trace.exceeded_budgets()
+    if exceeded:
+        logger.warning(json.dumps({'event': 'slow_' + trace.kind, 'exceeded': exceeded, **trace.summary()}))
+    return trace
+
+
+@contextmanager
+def attached(trace):
+    """Makes another thread (e.g. a DAL section worker) record into `trace`."""
+    previous = getattr(_state, 'trace', None)
+    _state.trace = trace
+    try:
+        yield trace
+    finally:
+        _state.trace = previous
+
+
+@contextmanager
+def tracing(kind, name):
+    """Traces the queries of a block of code (e.g. a management command) like a request."""
+    trace = start(kind, name)
+    try:
+        yield trace
+    finally:
+        finish()
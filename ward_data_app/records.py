@@ -0,0 +1,130 @@
+"""
+Compiled column-mapping plans and compact records for DAL standardization.
+
+A `ColumnPlan` describes how one kind of row (a diary entry, a medication,
+...) is mapped from the hospital database columns to the stable keys used by
+the rest of the app. The configured column names are resolved once, when the
+plan is built; binding the plan to a cursor's column list then yields an
+extractor that reads the row tuples directly by position, without building
+an intermediate dictionary per row.
+
+Extracted rows are `Record` objects: read-only mappings backed by a tuple of
+values and the key index shared by every record of the plan. Like the
+dictionaries they replace, they only expose the keys whose value is not None,
+and `RecordJSONEncoder` serializes them to the same JSON.
+"""
+import threading
+from collections.abc import Mapping
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class Record(Mapping):
+    """A compact, read-only mapping for one standardized row."""
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        position = self._index.get(key)
+        if position is None or self._values[position] is None:
+            raise KeyError(key)
+        return self._values[position]
+
+    def get(self, key, default=None):
+        position = self._index.get(key)
+        if position is None:
+            return default
+        value = self._values[position]
+        return default if value is None else value
+
+    def __iter__(self):
+        return (key for key, value in zip(self._index, self._values) if value is not None)
+
+    def __len__(self):
+        return sum(1 for value in self._values if value is not None)
+
+    def to_dict(self):
+        return {key: value for key, value in zip(self._index, self._values) if value is not None}
+
+    def __repr__(self):
+        return f"Record({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # Pickles (e.g. Celery, caches) as a plain dict
+        return dict, (self.to_dict(),)
+
+
+class ColumnPlan:
+    """
+    Maps rows of one kind from database columns to standardized keys.
+
+    `fields` is a sequence of `(key, column, converter, default)`: the value of
+    `column` (or `default` when the query does not return that column) is
+    passed through `converter`, if any, and stored under `key`. Keys whose
+    final value is None are left out. With `as_dict`, rows are extracted as
+    plain (mutable) dictionaries instead of `Record`s.
+    """
+
+    def __init__(self, fields, as_dict=False):
+        self.fields = tuple(fields)
+        self.as_dict = as_dict
+        self.index = {key: position for position, (key, *_) in enumerate(self.fields)}
+        self._extractors = {}
+        self._lock = threading.Lock()
+
+    def bind(self, columns):
+        """Returns a function mapping a row tuple with the given `columns` to a record."""
+        columns = tuple(columns)
+        extractor = self._extractors.get(columns)
+        if extractor is None:
+            extractor = self._compile(columns)
+            with self._lock:
+                self._extractors[columns] = extractor
+        return extractor
+
+    def _compile(self, columns):
+        positions = {name: position for position, name in enumerate(columns)}
+        steps = tuple((positions.get(column), converter, default) for _, column, converter, default in self.fields)
+        index = self.index
+        keys = tuple(index)
+
+        def extract_values(row):
+            values = []
+            for position, converter, default in steps:
+                value = default if position is None else row[position]
+                if converter is not None:
+                    value = converter(value)
+                values.append(value)
+            return values
+
+        if self.as_dict:
+            def extract(row):
+                return {key: value for key, value in zip(keys, extract_values(row)) if value is not None}
+        else:
+            def extract(row):
+                return Record(index, tuple(extract_values(row)))
+        return extract
+
+    def map_rows(self, columns, rows):
+        """Maps a list of row tuples sharing the same `columns`."""
+        extract = self.bind(columns)
+        return [extract(row) for row in rows if row]
+
+    def map_dict(self, raw_dict):
+        """Maps a single row given as a dictionary (column name -> value)."""
+        if not raw_dict:
+            return None
+        return self.bind(raw_dict.keys())(tuple(raw_dict.values()))
+
+
+class RecordJSONEncoder(DjangoJSONEncoder):
+    """JSON encoder that serializes `Record`s like the dictionaries they replace."""
+
+    def default(self, o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return super().default(o)
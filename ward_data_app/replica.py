@@ -0,0 +1,307 @@
+"""
+Local census replica.
+
+`sync_census_replica` (run periodically by Celery Beat) copies the census and
+the standardized sections of every interned patient from the hospital
+database into the `CensusPatient` / `CensusSyncState` tables of the internal
+'default' database. The read functions below mirror the public read
+functions of the DAL on top of those tables; the DAL dispatches to them in
+the 'replica' and 'auto' read modes (see `dal.get_read_mode`).
+
+Everything served from here is as of the last successful sync
+(`get_synced_at`), which the views show as a "data as of" watermark.
+"""
+import time
+import logging
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+
+from . import dal
+from .logging_config import setup_logger
+from .models import CensusPatient, CensusSyncState
+
+logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
+
+# Same length as the `get_ultimos_diarios` batch query
+LAST_DIARY_LENGTH = 300
+
+# Replica fields for each `sorting.patient_list` key (the last one breaks ties)
+SORT_FIELDS = {
+    'admission_date': ['admission_date', 'admission_time', 'episode_number'],
+    'name': ['patient_name', 'episode_number'],
+    'id': ['episode_number'],
+}
+
+
+# -----------------------------------------------------------------------------
+# Sync
+# -----------------------------------------------------------------------------
+
+def _section_keys():
+    return list(dal.SECTION_NAMES)
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return None
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _as_decimal(value):
+    try:
+        return Decimal(str(value))
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+
+
+def _build_patient(row, specialty_id, details, section_keys, columns):
+    """Builds the replica row of one patient from its list row and its details (if any)."""
+    header = dal.INTERNADO_PLAN.map_dict(row) or {}
+    sections = {key: [] for key in section_keys}
+    if details:
+        header.update({k: v for k, v in details.items() if k not in section_keys and k != 'failed_sections'})
+        sections.update({key: details.get(key, []) for key in section_keys})
+
+    diaries = sections.get('diarios') or []
+    last_diary = (diaries[0].get('diario') or '')[:LAST_DIARY_LENGTH] if diaries else ''
+
+    return CensusPatient(
+        episode_id=header.get('episode_id', str(row.get(columns['internado_pk']))),
+        episode_number=_as_decimal(row.get(columns['internado_pk'])),
+        specialty_id=specialty_id or '',
+        patient_name=header.get('patient_name') or '',
+        admission_date=_as_date(row.get(columns['data_entrada'])),
+        admission_time=_as_int(row.get(columns['hora_entrada'])),
+        header=header,
+        sections=sections,
+        last_diary=last_diary,
+    )
+
+
+def sync_census_replica() -> dict:
+    """
+    Replaces the replica with the current census read from the hospital
+    database, in a single transaction (readers keep seeing the previous
+    snapshot until it commits). Costs one list query per specialty plus one
+    query per section for every `BACKUP_BATCH_SIZE` patients.
+
+    Returns a summary with the number of patients and the duration. On
+    failure the previous snapshot is kept and the error is recorded.
+    """
+    started = time.monotonic()
+    attempt_at = timezone.now()
+    columns = settings.HOSPITAL_CONFIG.get('columns', {})
+    pk_col = columns.get('internado_pk')
+    section_keys = _section_keys()
+
+    try:
+        with dal.force_live_reads(), dal.bypass_query_cache():
+            specialties = dal.get_specialties_list()
+            rows = list(dal.iter_census_rows())
+            if rows and not specialties:
+                # get_specialties_list logs and hides its errors; do not replace a good snapshot
+                raise RuntimeError("No specialties returned for a non-empty census.")
+
+            specialty_of = dal.get_census_specialty_ids(specialties)
+
+            patients = []
+            chunk_size = max(1, getattr(settings, 'BACKUP_BATCH_SIZE', 50))
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                details = dal.get_patient_details_many([row.get(pk_col) for row in chunk])
+                for row in chunk:
+                    episode_id = str(row.get(pk_col))
+                    patients.append(_build_patient(row, specialty_of.get(episode_id), details.get(episode_id), section_keys, columns))
+    except Exception as e:
+        logger.error(f"Census replica sync failed: {e}", exc_info=True)
+        CensusSyncState.objects.update_or_create(pk=1, defaults={'last_attempt_at': attempt_at, 'last_error': str(e)})
+        raise
+
+    duration = round(time.monotonic() - started, 2)
+    with transaction.atomic(using='default'):
+        CensusPatient.objects.all().delete()
+        CensusPatient.objects.bulk_create(patients, batch_size=500)
+        CensusSyncState.objects.update_or_create(pk=1, defaults={
+            'synced_at': attempt_at,
+            'duration_seconds': duration,
+            'patients': len(patients),
+            'specialties': specialties,
+            'last_attempt_at': attempt_at,
+            'last_error': '',
+        })
+
+    logger.info(f"Census replica synced: {len(patients)} patients in {duration}s.")
+    return {'patients': len(patients), 'duration_seconds': duration}
+
+
+# -----------------------------------------------------------------------------
+# Reads (same signatures and results as the DAL functions)
+# -----------------------------------------------------------------------------
+
+def _get_state():
+    return CensusSyncState.objects.filter(pk=1).first()
+
+
+def get_synced_at():
+    """Returns the time of the last successful sync, or None if the replica is empty."""
+    state = _get_state()
+    return state.synced_at if state else None
+
+
+def format_as_of(synced_at):
+    """Formats a sync time for the "data as of" watermark."""
+    if not synced_at:
+        return 'never synced'
+    return timezone.localtime(synced_at).strftime('%d-%m-%Y %H:%M')
+
+
+def _patients(specialty_id=None, search_query=''):
+    queryset = CensusPatient.objects.all()
+    if specialty_id:
+        queryset = queryset.filter(specialty_id=str(specialty_id))
+    if search_query:
+        number = _as_decimal(search_query)
+        if number is not None:
+            queryset = queryset.filter(episode_number=number)
+        else:
+            queryset = queryset.filter(patient_name__icontains=search_query)
+    return queryset
+
+
+def _sort_fields(sort_key):
+    fields = SORT_FIELDS.get(sort_key)
+    if not fields:
+        raise ValueError(f"Invalid sort key: {sort_key}")
+    return fields
+
+
+def _list_item(patient):
+    item = dict(patient.header)
+    # The live patient lists have no specialty column
+    item.pop('specialty_name', None)
+    if patient.last_diary:
+        item['ultimo_diario'] = patient.last_diary
+    return item
+
+
+def get_specialties_list():
+    state = _get_state()
+    return state.specialties if state else []
+
+
+def get_recent_patients_list(specialty_id=None):
+    queryset = _patients(specialty_id).order_by('-admission_date', '-admission_time')[:10]
+    return [dict(p.header) for p in queryset]
+
+
+def get_paginated_patient_list(page, limit, specialty_id=None, sort_key='admission_date', sort_dir='desc', search_query=''):
+    prefix = '-' if sort_dir == 'desc' else ''
+    queryset = _patients(specialty_id, search_query)
+    total = queryset.count()
+    offset = (page - 1) * limit
+    ordered = queryset.order_by(*[prefix + f for f in _sort_fields(sort_key)])[offset:offset + limit]
+    return [_list_item(p) for p in ordered], total
+
+
+def get_patient_list_page_by_cursor(limit, cursor=None, specialty_id=None, sort_key='admission_date', sort_dir='desc', search_query='', include_total=False):
+    fields = _sort_fields(sort_key)
+    queryset = _patients(specialty_id, search_query)
+    total = queryset.count() if include_total else None
+    lookup = 'lt' if sort_dir == 'desc' else 'gt'
+
+    if cursor:
+        values = dal.decode_patient_list_cursor(cursor, sort_key, sort_dir)
+        if len(values) != len(fields):
+            raise ValueError("Invalid pagination cursor.")
+        # Cursors issued by the live DAL hold the database values
+        values = [_as_date(v) if f == 'admission_date' else v for f, v in zip(fields, values)]
+        condition = Q(**{f"{fields[-1]}__{lookup}": values[-1]})
+        for field, value in zip(reversed(fields[:-1]), reversed(values[:-1])):
+            condition = Q(**{f"{field}__{lookup}": value}) | (Q(**{field: value}) & condition)
+        queryset = queryset.filter(condition)
+
+    prefix = '-' if sort_dir == 'desc' else ''
+    page = list(queryset.order_by(*[prefix + f for f in fields])[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = dal.encode_patient_list_cursor(sort_key, sort_dir, [getattr(page[-1], f) for f in fields])
+    return [_list_item(p) for p in page], next_cursor, total
+
+
+def _get_patient(patient_id_str, specialty_id):
+    if _as_decimal(patient_id_str) is None:
+        raise Http404("Invalid patient ID.")
+    patient = CensusPatient.objects.filter(episode_id=str(patient_id_str)).first()
+    if patient is None or (specialty_id and patient.specialty_id != str(specialty_id)):
+        raise Http404("Patient not found.")
+    return patient
+
+
+def get_patient_details_all(patient_id_str, specialty_id, concurrent=None):
+    patient = _get_patient(patient_id_str, specialty_id)
+    context = dict(patient.header)
+    context.update(patient.sections)
+    context['data_as_of'] = format_as_of(get_synced_at())
+    return context
+
+
+def get_patient_header(patient_id_str, specialty_id):
+    header = dict(_get_patient(patient_id_str, specialty_id).header)
+    header['data_as_of'] = format_as_of(get_synced_at())
+    return header
+
+
+def get_patient_section(patient_id_str, specialty_id, section, fields=None, offset=0, limit=None):
+    dal.validate_section_request(section, fields)
+    items = _get_patient(patient_id_str, specialty_id).sections.get(section, [])
+    has_more = False
+    if section in dal.PAGINATED_SECTIONS and limit:
+        has_more = len(items) > offset + limit
+        items = items[offset:offset + limit]
+    else:
+        offset = 0
+    return {'items': dal.project_section_items(items, fields), 'offset': offset, 'has_more': has_more}
+
+
+def get_patient_id_by_name(patient_name, specialty_id):
+    patient = (
+        _patients(specialty_id)
+        .filter(patient_name__icontains=patient_name)
+        .order_by('-admission_date')
+        .first()
+    )
+    return patient.episode_id if patient else None
+
+
+def get_census_entries():
+    entries = []
+    for patient in CensusPatient.objects.all():
+        entry = _list_item(patient)
+        entry['specialty_id'] = patient.specialty_id
+        entry['admitted'] = patient.admission_date.isoformat() if patient.admission_date else ''
+        entries.append(entry)
+    return entries
+
+
+def iter_census(specialty_id=None, include_sections=False):
+    for patient in _patients(specialty_id).order_by('episode_number').iterator():
+        item = dict(patient.header)
+        if include_sections:
+            item.update(patient.sections)
+        yield item
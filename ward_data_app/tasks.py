@@ -3,30 +3,123 @@ Module for asynchronous tasks (Celery) related to PDF generation.
 
 This script contains the logic for:
 1. Defining asynchronous tasks to generate PDF files from an HTML template.
-2. Saving the results to the filesystem.
+2. Saving the results to the filesystem, skipping patients whose report
+   did not change since the last backup (see `backup_manifest`).
 """
 import os
+import json
+import time
 import logging
-from celery import shared_task
+import datetime
+from celery import chord, group, shared_task
+from celery.signals import task_postrun, task_prerun, worker_process_init
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.http import Http404
 
-from . import dal
+from . import backup_manifest, booklets, dal, metrics, offline_index, pdf_jobs, query_trace, replica
 from .logging_config import setup_logger
+from .pdf_renderer import WEASYPRINT_AVAILABLE, get_renderer
 from .utils import slugify
 # Import the formatting logic from its single source of truth
 from .format_utils import format_context
 
 logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
 
-# WeasyPrint import is optional, allowing the app to run
-# even if the PDF generation library is not installed.
-try:
-    from weasyprint import HTML
-    WEASYPRINT_AVAILABLE = True
-except ImportError:
-    WEASYPRINT_AVAILABLE = False
-    logger.warning("WeasyPrint library not found. PDF generation is disabled.")
+
+@worker_process_init.connect
+def _warm_pdf_renderer(**kwargs):
+    """Loads the PDF renderer (template, stylesheet, fonts) once per worker process."""
+    if WEASYPRINT_AVAILABLE:
+        try:
+            get_renderer()
+        except Exception as e:
+            logger.error(f"Could not warm the PDF renderer: {e}", exc_info=True)
+
+
+@task_prerun.connect
+def _start_query_trace(task=None, **kwargs):
+    """Traces the hospital queries of every task (see `query_trace`)."""
+    query_trace.start('task', task.name if task else 'unknown')
+
+
+@task_postrun.connect
+def _finish_query_trace(**kwargs):
+    query_trace.finish()
+
+# -----------------------------------------------------------------------------
+# PDF Rendering Helpers
+# -----------------------------------------------------------------------------
+
+def _get_pdf_path(context):
+    """Builds the backup path `<Specialty>/<Room>/<Bed>_<Episode>_<Name>.pdf` for a formatted context."""
+    specialty_name = context.get('specialty_name')
+    room = context.get('sala')
+    bed = context.get('cama')
+    episode_id = context.get('episode_id')
+    patient_name = context.get('patient_name', 'NAME_NOT_FOUND')
+    safe_filename = slugify(patient_name)
+
+    # Build the destination path for the offline backup
+    specialty_dir_name = slugify(specialty_name) if specialty_name else "No_Specialty"
+    room_dir_name = slugify(room) if room else "No_Room"
+
+    target_dir = os.path.join(
+        settings.OFFLINE_BACKUP_DIR,
+        specialty_dir_name,
+        room_dir_name
+    )
+    file_name = f"{bed}_{episode_id}_{safe_filename}.pdf"
+    return os.path.join(target_dir, file_name)
+
+
+def _save_patient_pdf(context_from_dal):
+    """
+    Formats, renders and writes the PDF for one patient's DAL context.
+
+    Rendering is skipped when the formatted context hashes to the same value
+    as the one recorded in the backup manifest for the existing file.
+    Returns a tuple (file_path, rendered).
+    """
+    # 1. Format data using the imported utility
+    final_context_for_template = format_context(context_from_dal)
+    episode_id = final_context_for_template.get('episode_id')
+    file_path = _get_pdf_path(final_context_for_template)
+
+    # 2. Skip unchanged charts
+    hash_value = backup_manifest.context_hash(final_context_for_template)
+    if backup_manifest.is_unchanged(episode_id, hash_value, file_path):
+        # The web app serves PDFs confirmed current recently instead of rendering them
+        backup_manifest.touch_entry(episode_id)
+        return file_path, False
+
+    # 3. Render the PDF with the warm per-process renderer
+    # base_url is crucial for WeasyPrint to find static files (CSS, images)
+    base_url = getattr(settings, 'SITE_BASE_URL_FOR_PDFS', '/')
+    pdf_bytes = get_renderer().render(final_context_for_template, base_url, profile=settings.BACKUP_PDF_PROFILE)
+
+    # 4. Write file, removing the previous one if the patient changed room, bed or name.
+    # The file is replaced atomically: it may be served or replicated while the backup runs.
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, file_path)
+    metrics.BACKUP_BYTES_WRITTEN.labels('patient').inc(len(pdf_bytes))
+
+    previous = backup_manifest.get_entry(episode_id)
+    if previous and previous.get('file_path') and previous['file_path'] != file_path:
+        backup_manifest.remove_file(previous['file_path'])
+    backup_manifest.save_entry(episode_id, hash_value, file_path, final_context_for_template)
+
+    return file_path, True
+
+
+def _update_offline_index(episode_ids=(), removed_ids=()):
+    """Updates the static offline search page (see `offline_index`); a failure never fails the backup."""
+    try:
+        offline_index.update(episode_ids, removed_ids)
+    except Exception as e:
+        logger.error(f"Could not update the offline index: {e}", exc_info=True)
 
 # -----------------------------------------------------------------------------
 # Asynchronous Tasks (Celery)
@@ -43,72 +136,301 @@ def generate_patient_pdf(self, patient_id):
         return
 
     try:
-        # 1. Fetch raw data from DAL
-        context_from_dal = dal.get_patient_details_all(patient_id, specialty_id=None)
+        # The backup must never be rendered from the local replica, nor with
+        # sections missing: sequential loading raises instead of leaving them empty
+        with dal.force_live_reads():
+            context_from_dal = dal.get_patient_details_all(patient_id, specialty_id=None, concurrent=False)
         if not context_from_dal:
             logger.warning(f"No context found for patient {patient_id}")
             return
+        if context_from_dal.get('failed_sections'):
+            raise RuntimeError(f"Sections could not be loaded: {', '.join(context_from_dal['failed_sections'])}")
 
-        # 2. Format data using the imported utility
-        final_context_for_template = format_context(context_from_dal)
-        
-        # 3. Render HTML string
-        html_string = render_to_string('ward_data_app/patient-pdf.html', final_context_for_template)
-        
-        # base_url is crucial for WeasyPrint to find static files (CSS, images)
-        base_url = getattr(settings, 'SITE_BASE_URL_FOR_PDFS', '/')
-        pdf_bytes = HTML(string=html_string, base_url=base_url).write_pdf()
-
-        # 4. Prepare file path and name
-        specialty_name = final_context_for_template.get('specialty_name')
-        room = final_context_for_template.get('sala')
-        bed = final_context_for_template.get('cama')
-        episode_id = final_context_for_template.get('episode_id')
-        patient_name = final_context_for_template.get('patient_name', 'NAME_NOT_FOUND')
-        safe_filename = slugify(patient_name)
-        
-        # Build the destination path for the offline backup
-        specialty_dir_name = slugify(specialty_name) if specialty_name else "No_Specialty"
-        room_dir_name = slugify(room) if room else "No_Room"
+        file_path, rendered = _save_patient_pdf(context_from_dal)
+        if rendered:
+            logger.info(f"PDF for patient {patient_id} saved to {file_path}")
+        else:
+            logger.debug(f"PDF for patient {patient_id} unchanged, skipped {file_path}")
+        _update_offline_index([patient_id])
+    except Exception as e:
+        logger.error(f"Error generating PDF for patient {patient_id}: {e}", exc_info=True)
+        # Retry the task after 60 seconds
+        metrics.BACKUP_RETRIES.labels('generate_patient_pdf').inc()
+        raise self.retry(exc=e, countdown=60)
 
-        target_dir = os.path.join(
-            settings.OFFLINE_BACKUP_DIR, 
-            specialty_dir_name, 
-            room_dir_name
-        )
 
-        os.makedirs(target_dir, exist_ok=True)
+@shared_task(bind=True, max_retries=3)
+def generate_patient_pdf_batch(self, patient_ids):
+    """
+    Celery task that generates and saves the PDFs for a chunk of patients.
 
-        file_name = f"{bed}_{episode_id}_{safe_filename}.pdf"
-        file_path = os.path.join(target_dir, file_name)
+    All patient data is loaded with the DAL batch loader (one query per
+    section for the whole chunk). A failure while loading retries the
+    chunk; a failure while rendering one patient falls back to the
+    single-patient task so it keeps its own retries.
 
-        # 5. Write file
-        with open(file_path, 'wb') as f:
-            f.write(pdf_bytes)
+    Returns the counts of rendered, skipped (unchanged) and failed patients,
+    the bytes of PDF written and the number of retries of the chunk. Once the retries are exhausted
+    the chunk reports all its patients as failed instead of raising, so the
+    backup cycle callback still runs.
+    """
+    counts = {'rendered': 0, 'skipped': 0, 'failed': 0, 'bytes_written': 0, 'retries': self.request.retries}
+    if not WEASYPRINT_AVAILABLE:
+        logger.error("PDF generation was invoked, but WeasyPrint is not available.")
+        counts['failed'] = len(patient_ids)
+        return counts
 
-        logger.info(f"PDF for patient {patient_id} saved to {file_path}")
+    try:
+        contexts = dal.get_patient_details_many(patient_ids)
     except Exception as e:
-        logger.error(f"Error generating PDF for patient {patient_id}: {e}", exc_info=True)
-        # Retry the task after 60 seconds
+        logger.error(f"Error loading batch of {len(patient_ids)} patients for backup: {e}", exc_info=True)
+        if self.request.retries >= self.max_retries:
+            counts['failed'] = len(patient_ids)
+            return counts
+        metrics.BACKUP_RETRIES.labels('generate_patient_pdf_batch').inc()
         raise self.retry(exc=e, countdown=60)
 
+    saved_ids = []
+    for patient_id in patient_ids:
+        context_from_dal = contexts.get(str(patient_id))
+        if not context_from_dal:
+            logger.warning(f"No context found for patient {patient_id}")
+            continue
+        try:
+            file_path, rendered = _save_patient_pdf(context_from_dal)
+        except Exception as e:
+            logger.error(f"Error generating PDF for patient {patient_id} in batch: {e}", exc_info=True)
+            counts['failed'] += 1
+            generate_patient_pdf.delay(str(patient_id))
+            continue
+        saved_ids.append(patient_id)
+        if rendered:
+            counts['rendered'] += 1
+            counts['bytes_written'] += os.path.getsize(file_path)
+            logger.info(f"PDF for patient {patient_id} saved to {file_path}")
+        else:
+            counts['skipped'] += 1
+
+    _update_offline_index(saved_ids)
+    logger.info(f"Backup batch of {len(patient_ids)} patients: {counts['rendered']} rendered, "
+                f"{counts['skipped']} unchanged, {counts['failed']} failed.")
+    return counts
+
+
+@shared_task
+def render_pdf_job(job_id):
+    """
+    Renders the PDF of an on-demand job (see `pdf_jobs`), reporting its stage
+    in the job as it goes. Routed to the dedicated `pdf_jobs` queue. Reads
+    like the web views (specialty check, `DAL_READ_MODE`).
+    """
+    job = pdf_jobs.get_job(job_id)
+    if job is None:
+        logger.warning(f"PDF job {job_id} not found (expired?).")
+        return
+    if pdf_jobs.fail_if_timed_out(job)['status'] in pdf_jobs.FINISHED_STATES:
+        logger.warning(f"PDF job {job_id} was {job['status']} before it started; not rendering it.")
+        return
+    job = pdf_jobs.update_job(job_id, status='running', stage='loading', progress=10)
+    patient_id = job['patient_id']
+    try:
+        if not WEASYPRINT_AVAILABLE:
+            raise RuntimeError("WeasyPrint is not available.")
+        dal.reset_read_source()
+        context = format_context(dal.get_patient_details_all(patient_id, job.get('specialty_id')))
+        pdf_jobs.update_job(job_id, stage='rendering', progress=40)
+        renderer = get_renderer()
+        pdf_bytes = renderer.render(context, base_url=job.get('base_url') or '/')
+        pdf_jobs.save_pdf(job_id, pdf_bytes)
+    except Http404:
+        logger.warning(f"PDF job {job_id}: patient {patient_id} not found.")
+        pdf_jobs.update_job(job_id, status='failed', stage=None, error='Patient not found.')
+        return
+    except Exception as e:
+        logger.error(f"PDF job {job_id} for patient {patient_id} failed: {e}", exc_info=True)
+        pdf_jobs.update_job(job_id, status='failed', stage=None, error='Unexpected internal error generating PDF.')
+        return
+    finally:
+        pdf_jobs.remove_expired_jobs()
+
+    metrics.PDF_ON_DEMAND.labels('job').inc()
+    pdf_jobs.update_job(job_id, status='done', stage=None, progress=100, size=len(pdf_bytes))
+    logger.info(f"PDF job {job_id} for patient {patient_id} done ({renderer.last_timings})")
+
+
+# RabbitMQ message priorities of the backup chunks (higher is consumed first,
+# up to `settings.CELERY_TASK_QUEUE_MAX_PRIORITY`), by the reason to back a patient up early
+BACKUP_PRIORITIES = {
+    'missing': 9,           # No backup PDF yet
+    'new_admission': 6,     # Admitted within BACKUP_PRIORITY_RECENT_HOURS
+    'recent_activity': 3,   # Diary entry or medication change within BACKUP_PRIORITY_RECENT_HOURS
+    'other': 0,
+}
+
+
+def prioritize_backup(priority_rows, now=None):
+    """
+    Orders the patients of a backup cycle so the ones that most need a fresh
+    PDF are rendered first: patients with no backup file, then recent
+    admissions, then charts with recent activity, then the rest (newest
+    admission first within each level).
+
+    Args:
+        priority_rows (list[dict]): Rows of `dal.get_backup_priority_rows`.
+        now (datetime.datetime | None): Reference time (default: now).
+
+    Returns:
+        list[tuple[str, str]]: (episode ID, priority level) pairs, in backup order.
+    """
+    now = now or datetime.datetime.now()
+    recent = now - datetime.timedelta(hours=settings.BACKUP_PRIORITY_RECENT_HOURS)
+    ordered = []
+    for row in priority_rows:
+        episode_id = str(row['episode_id'])
+        if not backup_manifest.has_pdf(episode_id):
+            level = 'missing'
+        elif row.get('admitted') and row['admitted'] >= recent:
+            level = 'new_admission'
+        elif row.get('last_activity') and row['last_activity'] >= recent:
+            level = 'recent_activity'
+        else:
+            level = 'other'
+        ordered.append((episode_id, level, row.get('admitted') or datetime.datetime.min))
+    # Newest admission first, then by level (the sort is stable)
+    ordered.sort(key=lambda item: item[2], reverse=True)
+    ordered.sort(key=lambda item: BACKUP_PRIORITIES[item[1]], reverse=True)
+    return [(episode_id, level) for episode_id, level, _ in ordered]
+
 
 @shared_task
 def generate_periodic_pdf_backup():
     """
-    Periodic task that finds all active patients and schedules
-    a PDF generation task for each one.
+    Periodic task that finds all active patients and schedules a batch PDF
+    generation task for each chunk of them, as a chord whose callback
+    (`finalize_backup_cycle`) records the cycle report.
+
+    Patients are chunked in priority order (see `prioritize_backup`) and
+    each chunk is sent with the message priority of its first patient, so
+    a cycle interrupted by an EHR failure still leaves the patients without
+    a backup, and the new admissions, covered first.
     """
     if not WEASYPRINT_AVAILABLE:
         return # Do nothing if the library isn't available
         
+    started_at = time.time()
     try:
-        active_patient_ids = dal.get_all_patient_ids()
+        # The census must be current, never a cached copy
+        with dal.bypass_query_cache():
+            priority_rows = dal.get_backup_priority_rows()
     except Exception as e:
         logger.error(f"Error getting active patient IDs for backup: {e}", exc_info=True)
         return
 
-    logger.info(f"Scheduling PDF generation for {len(active_patient_ids)} active patients.")
-    for patient_id in active_patient_ids:
-        # Send each generation as a separate task to the Celery worker
-        generate_patient_pdf.delay(str(patient_id))
\ No newline at end of file
+    # Drop the PDFs of patients that are no longer admitted
+    removed_ids = backup_manifest.remove_stale_entries(row['episode_id'] for row in priority_rows)
+    removed = len(removed_ids)
+    if removed_ids:
+        _update_offline_index(removed_ids=removed_ids)
+
+    ordered = prioritize_backup(priority_rows)
+    patient_ids = [episode_id for episode_id, _ in ordered]
+    levels = {level: 0 for level in BACKUP_PRIORITIES}
+    for _, level in ordered:
+        levels[level] += 1
+
+    batch_size = max(1, settings.BACKUP_BATCH_SIZE)
+    chunks = [ordered[start:start + batch_size] for start in range(0, len(ordered), batch_size)]
+    cycle = {'started_at': started_at, 'patients': len(patient_ids), 'chunks': len(chunks), 'removed': removed,
+             'priorities': levels}
+    logger.info(f"Scheduling PDF generation for {len(patient_ids)} active patients in {len(chunks)} batches of "
+                f"{batch_size} ({levels['missing']} without backup, {levels['new_admission']} new admissions, "
+                f"{levels['recent_activity']} with recent activity).")
+
+    header = group(
+        generate_patient_pdf_batch.s([episode_id for episode_id, _ in chunk]).set(priority=BACKUP_PRIORITIES[chunk[0][1]])
+        for chunk in chunks
+    )
+    if not settings.CELERY_RESULT_BACKEND:
+        # Chords need a result backend; without one, chunks still run but no report is recorded
+        logger.warning("CELERY_RESULT_BACKEND is not configured. The backup cycle report is disabled.")
+        header.apply_async()
+    elif not chunks:
+        finalize_backup_cycle.delay([], cycle)
+    else:
+        chord(header)(finalize_backup_cycle.s(cycle))
+
+
+@shared_task
+def finalize_backup_cycle(chunk_results, cycle):
+    """
+    Chord callback run once every chunk of a backup cycle has finished.
+    Aggregates the chunk counts and records the cycle report (start, end,
+    duration, throughput, bytes written and failures) in `settings.BACKUP_REPORT_PATH`.
+    """
+    finished_at = time.time()
+    totals = {'rendered': 0, 'skipped': 0, 'failed': 0, 'bytes_written': 0, 'retries': 0}
+    for result in chunk_results:
+        for key in totals:
+            totals[key] += (result or {}).get(key, 0)
+
+    duration = max(finished_at - cycle['started_at'], 0.001)
+    report = {
+        'started_at': datetime.datetime.fromtimestamp(cycle['started_at'], tz=datetime.timezone.utc).isoformat(),
+        'finished_at': datetime.datetime.fromtimestamp(finished_at, tz=datetime.timezone.utc).isoformat(),
+        'duration_seconds': round(duration, 3),
+        'patients': cycle['patients'],
+        'chunks': cycle['chunks'],
+        'removed': cycle['removed'],
+        'priorities': cycle.get('priorities', {}),
+        **totals,
+        'throughput_patients_per_second': round(cycle['patients'] / duration, 3),
+        'pdf_profile': settings.BACKUP_PDF_PROFILE,
+        'fits_interval': duration <= settings.BACKUP_INTERVAL_SECONDS,
+    }
+
+    metrics.BACKUP_CYCLE_DURATION.observe(duration)
+    for outcome in ('rendered', 'skipped', 'failed'):
+        metrics.BACKUP_PATIENTS.labels(outcome).inc(totals[outcome])
+    metrics.BACKUP_LAST_CYCLE.set(finished_at)
+
+    try:
+        os.makedirs(os.path.dirname(settings.BACKUP_REPORT_PATH), exist_ok=True)
+        with open(settings.BACKUP_REPORT_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+    except OSError as e:
+        logger.error(f"Could not write backup cycle report to {settings.BACKUP_REPORT_PATH}: {e}")
+
+    if settings.BACKUP_BOOKLETS:
+        generate_ward_booklets.delay()
+
+    log = logger.info if report['fits_interval'] else logger.warning
+    log(f"Backup cycle finished in {report['duration_seconds']}s for {report['patients']} patients "
+        f"({report['throughput_patients_per_second']} patients/s): {report['rendered']} rendered, "
+        f"{report['skipped']} unchanged, {report['removed']} removed, {report['failed']} failed, "
+        f"{report['bytes_written'] / 1e6:.1f} MB written.")
+    return report
+
+
+@shared_task
+def generate_ward_booklets():
+    """
+    Writes the ward booklets (one PDF per room and/or specialty, see `booklets`)
+    configured in `settings.BACKUP_BOOKLETS`, after a backup cycle.
+    """
+    if not WEASYPRINT_AVAILABLE or not settings.BACKUP_BOOKLETS:
+        return
+
+    base_url = getattr(settings, 'SITE_BASE_URL_FOR_PDFS', '/')
+    counts = booklets.generate_booklets(settings.BACKUP_BOOKLETS, base_url)
+    logger.info(f"Ward booklets: {counts['rendered']} rendered, {counts['skipped']} unchanged, "
+                f"{counts['removed']} removed, {counts['bytes_written'] / 1e6:.1f} MB written.")
+    return counts
+
+
+@shared_task
+def sync_census_replica():
+    """
+    Refreshes the local census replica (see `replica`) used by the 'replica'
+    and 'auto' read modes.
+    """
+    return replica.sync_census_replica()
@@ -1,3 +1,694 @@
-from django.test import TestCase
+import io
+import os
+import json
+import datetime
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from prometheus_client import REGISTRY
+
+from project.db_backends.pool import ConnectionPool
+
+from . import backup_manifest, benchmark, dal, pdf_jobs, query_trace
+from .middleware import QueryTraceMiddleware
+from .name_index import NameIndex
+from .query_cache import QueryCache
+from .records import Record, RecordJSONEncoder
+from .tasks import _save_patient_pdf, prioritize_backup
+from .utils import format_hour, safe_strftime
+from .views import _conditional_json_response, _fresh_backup_pdf_path, _get_own_pdf_job, pdf_job_status_api
+
+
+@unittest.skipUnless(settings.DB_TYPE == 'sqlite', "needs the synthetic hospital database (DB_TYPE=sqlite)")
+class SyntheticHospitalTestCase(SimpleTestCase):
+    """Runs the DAL against the synthetic hospital database of the benchmarks."""
+
+    databases = {'default', 'hospital'}
+    patients = 40
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data_dir = tempfile.TemporaryDirectory()
+        cls.previous_name = connections['hospital'].settings_dict['NAME']
+        path = os.path.join(cls.data_dir.name, 'hospital.sqlite3')
+        benchmark.build_synthetic_hospital(path, patients=cls.patients, seed=7)
+        benchmark.use_hospital_database(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        benchmark.use_hospital_database(cls.previous_name)
+        cls.data_dir.cleanup()
+        super().tearDownClass()
+
+
+class PatientListCursorTests(SimpleTestCase):
+
+    def test_round_trip_keeps_value_types(self):
+        values = [datetime.date(2024, 3, 1), datetime.datetime(2024, 3, 1, 14, 30), Decimal('1234'), 'SILVA', None]
+        cursor = dal.encode_patient_list_cursor('admission_date', 'desc', values)
+        self.assertEqual(dal.decode_patient_list_cursor(cursor, 'admission_date', 'desc'), values)
+
+    def test_cursor_of_another_sorting_is_rejected(self):
+        cursor = dal.encode_patient_list_cursor('name', 'asc', ['SILVA', Decimal('1')])
+        with self.assertRaises(ValueError):
+            dal.decode_patient_list_cursor(cursor, 'name', 'desc')
+        with self.assertRaises(ValueError):
+            dal.decode_patient_list_cursor(cursor, 'admission_date', 'asc')
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('not-a-cursor', 'e30=', ''):
+            with self.assertRaises(ValueError):
+                dal.decode_patient_list_cursor(cursor, 'name', 'asc')
+
+
+class QueryTraceMiddlewareTests(SimpleTestCase):
+
+    def _call(self, view):
+        with mock.patch.object(query_trace, 'finish', wraps=query_trace.finish) as finish:
+            response = QueryTraceMiddleware(view)(RequestFactory().get('/'))
+            return response, finish
+
+    def test_trace_ends_with_the_response(self):
+        def view(request):
+            query_trace.record('get_patient_details', 0.01, 1)
+            return HttpResponse('ok')
+
+        response, finish = self._call(view)
+        trace = finish.call_args.args[0]
+        self.assertEqual(len(trace.queries), 1)
+        self.assertIsNotNone(trace.finished)
+        self.assertIsNone(query_trace.current())
+
+    def test_streamed_body_is_traced_until_closed(self):
+        def body():
+            for _ in range(3):
+                query_trace.record('get_census', 0.01, 10)
+                yield b'row\n'
+
+        response, finish = self._call(lambda request: StreamingHttpResponse(body()))
+        finish.assert_not_called()
+        self.assertIsNone(query_trace.current())
+        with mock.patch.object(query_trace, 'finish', wraps=query_trace.finish) as finish:
+            self.assertEqual(b''.join(response.streaming_content), b'row\n' * 3)
+            response.close()
+        trace = finish.call_args.args[0]
+        self.assertEqual(len(trace.queries), 3)
+        self.assertIsNotNone(trace.finished)
+        self.assertIsNone(query_trace.current())
+
+
+class PatientListDALTests(SyntheticHospitalTestCase):
+    """Patient list queries against the synthetic hospital database."""
+
+    def _all_pages_by_cursor(self, sort_key, sort_dir, limit):
+        episode_ids, cursor, pages = [], None, 0
+        while True:
+            patients, cursor, _ = dal.get_patient_list_page_by_cursor(limit, cursor, sort_key=sort_key, sort_dir=sort_dir)
+            episode_ids += [patient['episode_id'] for patient in patients]
+            pages += 1
+            if cursor is None:
+                return episode_ids, pages
+
+    def test_cursor_pages_cover_the_list_without_gaps_or_repeats(self):
+        with dal.bypass_query_cache():
+            for sort_key in ('name', 'admission_date'):
+                for sort_dir in ('asc', 'desc'):
+                    with self.subTest(sort_key=sort_key, sort_dir=sort_dir):
+                        expected, total = dal.get_paginated_patient_list(1, 1000, sort_key=sort_key, sort_dir=sort_dir)
+                        episode_ids, pages = self._all_pages_by_cursor(sort_key, sort_dir, limit=7)
+                        # No patient skipped or repeated across pages, including ties of the sort column
+                        self.assertEqual(len(episode_ids), total)
+                        self.assertEqual(set(episode_ids), {patient['episode_id'] for patient in expected})
+                        self.assertEqual(pages, -(-total // 7))
+
+    def test_first_page_reports_the_total(self):
+        with dal.bypass_query_cache():
+            patients, cursor, total = dal.get_patient_list_page_by_cursor(5, include_total=True)
+        self.assertEqual(len(patients), 5)
+        self.assertIsNotNone(cursor)
+        self.assertEqual(total, dal.get_paginated_patient_list(1, 5)[1])
+
+
+class QueryCacheTests(SimpleTestCase):
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = QueryCache()
+        with mock.patch('ward_data_app.query_cache.time.monotonic', return_value=100.0):
+            cache.set('key', 'value', ttl=10)
+            self.assertEqual(cache.get('key'), (True, 'value'))
+        with mock.patch('ward_data_app.query_cache.time.monotonic', return_value=110.0):
+            self.assertEqual(cache.get('key'), (False, None))
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryCache(max_entries=2)
+        cache.set('a', 1, ttl=60)
+        cache.set('b', 2, ttl=60)
+        cache.get('a')
+        cache.set('c', 3, ttl=60)
+        self.assertEqual(cache.get('a'), (True, 1))
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.get('c'), (True, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.set('d', 4, ttl=60), 1)
+
+
+class QueryCacheFlushTests(SyntheticHospitalTestCase):
+    """`flush_query_cache` clears the cache of every process; lookups are exported as metrics."""
+
+    patients = 5
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        self.flush_file = os.path.join(self.data_dir.name, 'query_cache.flush')
+        self.settings_override = override_settings(QUERY_CACHE_FLUSH_FILE=self.flush_file)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = mock.patch.dict(dal._flush_state, {'checked_at': 0.0, 'mtime': None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        dal._query_cache.clear()
+
+    def _lookups(self, result):
+        return REGISTRY.get_sample_value('ward_dal_query_cache_lookups_total', {'sql_key': 'get_specialties', 'result': result}) or 0
+
+    def test_lookups_are_exported_as_metrics(self):
+        hits, misses = self._lookups('hit'), self._lookups('miss')
+        first = dal._execute_query('get_specialties')
+        self.assertEqual(dal._execute_query('get_specialties'), first)
+        self.assertEqual((self._lookups('hit'), self._lookups('miss')), (hits + 1, misses + 1))
+        self.assertEqual(REGISTRY.get_sample_value('ward_dal_query_cache_entries'), len(dal._query_cache))
+
+    def test_command_clears_the_cache_of_other_processes(self):
+        dal._execute_query('get_specialties')
+        dal._flush_state['checked_at'] = 0.0
+        dal._execute_query('get_specialties')
+        self.assertEqual(len(dal._query_cache), 1)
+
+        call_command('flush_query_cache', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(self.flush_file))
+        self.assertEqual(len(dal._query_cache), 0)
+        # Another process: its cache is cleared on its next cached query after the file changed
+        dal._query_cache.set(('other',), 'stale', ttl=60)
+        dal._flush_state.update(checked_at=0.0, mtime=os.path.getmtime(self.flush_file) - 1)
+        misses = self._lookups('miss')
+        dal._execute_query('get_specialties')
+        self.assertEqual(self._lookups('miss'), misses + 1)
+        self.assertEqual(dal._query_cache.get(('other',)), (False, None))
+
+
+class ColumnPlanTests(SimpleTestCase):
+    """The compiled plans return what the former `_standardize_*` functions returned."""
+
+    def setUp(self):
+        self.col_map = dal._get_config_value('columns', {})
+
+    def _legacy_internado(self, raw_dict):
+        col_map = self.col_map
+        standardized = {
+            'episode_id': str(raw_dict.get(col_map.get('internado_pk'))),
+            'patient_name': raw_dict.get(col_map.get('nome')),
+            'sala': str(raw_dict.get(col_map.get('sala_id'), '')),
+            'cama': raw_dict.get(col_map.get('cama_id'), ''),
+            'data_entrada': safe_strftime(raw_dict.get(col_map.get('data_entrada'))),
+            'hora_entrada': format_hour(raw_dict.get(col_map.get('hora_entrada'))),
+            'specialty_name': raw_dict.get(col_map.get('specialty_name')),
+        }
+        return {k: v for k, v in standardized.items() if v is not None}
+
+    def _legacy_diario(self, raw_dict):
+        col_map = self.col_map
+        standardized = {
+            'diario': raw_dict.get(col_map.get('diario')),
+            'hora_dir': format_hour(raw_dict.get(col_map.get('hora_diario'))),
+            'dta_dir': safe_strftime(raw_dict.get(col_map.get('data_diario'))),
+        }
+        return {k: v for k, v in standardized.items() if v is not None}
+
+    def test_internado_matches_legacy(self):
+        c = self.col_map
+        rows = [
+            {c['internado_pk']: Decimal('42'), c['nome']: 'ANA', c['sala_id']: 3, c['cama_id']: '12',
+             c['data_entrada']: datetime.date(2024, 1, 2), c['hora_entrada']: 930, c['specialty_name']: 'CARDIO'},
+            # Missing room/bed columns fall back to '' and None values are dropped
+            {c['internado_pk']: 7, c['nome']: None, c['data_entrada']: None},
+        ]
+        for row in rows:
+            self.assertEqual(dal.INTERNADO_PLAN.map_dict(row), self._legacy_internado(row))
+
+    def test_records_match_legacy_dicts(self):
+        c = self.col_map
+        columns = [c['diario'], c['hora_diario'], c['data_diario'], 'UNUSED']
+        rows = [
+            ('Stable.', 1405, datetime.date(2024, 5, 6), 1),
+            (None, None, datetime.date(2024, 5, 7), 2),
+        ]
+        records = dal.DIARIO_PLAN.map_rows(columns, rows)
+        for record, row in zip(records, rows):
+            expected = self._legacy_diario(dict(zip(columns, row)))
+            self.assertIsInstance(record, Record)
+            self.assertEqual(dict(record), expected)
+            self.assertEqual(record.to_dict(), expected)
+            self.assertEqual(len(record), len(expected))
+        self.assertNotIn('diario', records[1])
+        self.assertIsNone(records[1].get('diario'))
+        with self.assertRaises(KeyError):
+            records[1]['diario']
+
+
+class NameIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = NameIndex([
+            {'episode_id': '101', 'patient_name': 'MARIA JOÃO SANTOS', 'specialty_id': '1', 'admitted': '2024-05-01'},
+            {'episode_id': '102', 'patient_name': 'João Silva', 'specialty_id': '2', 'admitted': '2024-04-01'},
+            {'episode_id': '103', 'patient_name': 'JOÃO SILVA', 'specialty_id': '1', 'admitted': '2024-05-10'},
+            {'episode_id': '204', 'patient_name': 'ANTÓNIO CONCEIÇÃO', 'specialty_id': '1', 'admitted': '2024-03-01'},
+        ])
+
+    def _ids(self, results):
+        return [result['episode_id'] for result in results]
+
+    def test_search_ignores_accents_and_case(self):
+        self.assertEqual(self._ids(self.index.search('antonio conceicao')), ['204'])
+        self.assertEqual(self._ids(self.index.search('CONCEIÇÃO')), ['204'])
+
+    def test_name_prefix_ranks_first_then_most_recent_admission(self):
+        results = self.index.search('joao')
+        self.assertEqual(self._ids(results), ['103', '102', '101'])
+        self.assertEqual([result['score'] for result in results], [80, 80, 60])
+
+    def test_words_match_in_any_order(self):
+        self.assertEqual(self._ids(self.index.search('silva jo')), ['103', '102'])
+
+    def test_specialty_filter_and_limit(self):
+        self.assertEqual(self._ids(self.index.search('joao', specialty_id=1)), ['103', '101'])
+        self.assertEqual(self._ids(self.index.search('joao', limit=1)), ['103'])
+
+    def test_numeric_query_matches_episode_prefix(self):
+        self.assertEqual(sorted(self._ids(self.index.search('10'))), ['101', '102', '103'])
+        self.assertEqual(self._ids(self.index.search('zzz')), [])
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_idle_connection_is_reused(self):
+        pool = ConnectionPool('test', max_size=2)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = ConnectionPool('test', max_size=1, timeout=0.05)
+        pool.acquire(FakeConnection)
+        with self.assertRaises(OperationalError):
+            pool.acquire(FakeConnection)
+        stats = pool.stats()
+        self.assertEqual((stats['timeouts'], stats['in_use'], stats['saturation']), (1, 1, 1.0))
+
+    def test_usage_and_waits_are_exported_as_metrics(self):
+        sample = lambda name: REGISTRY.get_sample_value(name, {'alias': 'metrics-test'}) or 0  # noqa: E731
+        timeouts, waits = sample('ward_db_pool_checkout_timeouts_total'), sample('ward_db_pool_checkout_wait_seconds_count')
+        pool = ConnectionPool('metrics-test', max_size=2, timeout=0.05)
+        connections_in_use = [pool.acquire(FakeConnection), pool.acquire(FakeConnection)]
+        self.assertEqual((sample('ward_db_pool_connections_in_use'), sample('ward_db_pool_saturation_ratio')), (2, 1.0))
+        with self.assertRaises(OperationalError):
+            pool.acquire(FakeConnection)
+        self.assertEqual(sample('ward_db_pool_checkout_timeouts_total'), timeouts + 1)
+        self.assertEqual(sample('ward_db_pool_checkout_wait_seconds_count'), waits + 3)
+        pool.release(connections_in_use.pop())
+        self.assertEqual((sample('ward_db_pool_connections_in_use'), sample('ward_db_pool_saturation_ratio')), (1, 0.5))
+
+    def test_discarded_connection_frees_its_slot(self):
+        pool = ConnectionPool('test', max_size=1, timeout=0.05)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection, discard=True)
+        self.assertTrue(connection.closed)
+        replacement = pool.acquire(FakeConnection)
+        self.assertIsNot(replacement, connection)
+        stats = pool.stats()
+        self.assertEqual((stats['size'], stats['discarded'], stats['created']), (1, 1, 2))
+
+    def test_broken_idle_connection_is_replaced(self):
+        def ping(connection):
+            raise OSError("connection reset")
+
+        pool = ConnectionPool('test', max_size=1, ping_interval=0, ping=ping)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        replacement = pool.acquire(FakeConnection)
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool('test', max_size=1, timeout=0.05)
+
+        def connect():
+            raise OperationalError("unreachable")
+
+        with self.assertRaises(OperationalError):
+            pool.acquire(connect)
+        self.assertIsInstance(pool.acquire(FakeConnection), FakeConnection)
+
+
+class PrioritizeBackupTests(SimpleTestCase):
+
+    def setUp(self):
+        self.manifest_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.manifest_dir.cleanup)
+        self.settings_override = override_settings(BACKUP_MANIFEST_DIR=self.manifest_dir.name, BACKUP_BOOKLETS=[],
+                                                   BACKUP_PRIORITY_RECENT_HOURS=24)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def _with_pdf(self, episode_id):
+        file_path = os.path.join(self.manifest_dir.name, f"{episode_id}.pdf")
+        with open(file_path, 'wb') as f:
+            f.write(b'%PDF')
+        backup_manifest.save_entry(episode_id, 'hash', file_path, {})
+
+    def test_order_by_level_then_newest_admission(self):
+        now = datetime.datetime(2024, 6, 1, 12, 0)
+        days_ago = lambda days: now - datetime.timedelta(days=days)  # noqa: E731
+        for episode_id in ('1', '2', '3', '4', '5'):
+            self._with_pdf(episode_id)
+        rows = [
+            {'episode_id': 1, 'admitted': days_ago(30), 'last_activity': days_ago(10)},
+            {'episode_id': 2, 'admitted': days_ago(20), 'last_activity': now - datetime.timedelta(hours=2)},
+            {'episode_id': 3, 'admitted': now - datetime.timedelta(hours=5), 'last_activity': None},
+            {'episode_id': 4, 'admitted': days_ago(5), 'last_activity': days_ago(3)},
+            {'episode_id': 5, 'admitted': None, 'last_activity': None},
+            {'episode_id': 6, 'admitted': days_ago(40), 'last_activity': None},
+        ]
+        self.assertEqual(prioritize_backup(rows, now=now), [
+            ('6', 'missing'),
+            ('3', 'new_admission'),
+            ('2', 'recent_activity'),
+            ('4', 'other'),
+            ('1', 'other'),
+            ('5', 'other'),
+        ])
+
+
+class BackupPriorityRowsTests(SyntheticHospitalTestCase):
+    """`get_backup_priorities` dates a medication change by its start, or by its end once stopped."""
+
+    patients = 5
+
+    def test_new_active_prescription_counts_as_activity(self):
+        episode_id = dal.get_all_patient_ids()[0]
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        stamp = lambda hours: (now + datetime.timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')  # noqa: E731
+        with connections['hospital'].cursor() as cursor:
+            cursor.execute("DELETE FROM VW_CLINICAL_DIARY WHERE EPISODE_ID = %s", [episode_id])
+            cursor.execute("DELETE FROM VW_MEDICATION WHERE EPISODE_ID = %s", [episode_id])
+            for started, stopped in ((-30, -3), (-5, 24), (-2, None), (1, None)):
+                cursor.execute("INSERT INTO VW_MEDICATION (EPISODE_ID, DOSE, SCHEDULE, MED_CODE, ROUTE_CODE, START_DATE, END_DATE) "
+                               "VALUES (%s, '1 g', '8/8h', 1, 'EV', %s, %s)", [episode_id, stamp(started), stopped and stamp(stopped)])
+        with dal.bypass_query_cache():
+            rows = {row['episode_id']: row for row in dal.get_backup_priority_rows()}
+        self.assertEqual(rows[episode_id]['last_activity'], now - datetime.timedelta(hours=2))
+
+
+class BatchLoaderTests(SyntheticHospitalTestCase):
+    """`get_patient_details_many` returns what `get_patient_details_all` returns for each patient."""
+
+    def _as_json(self, context):
+        return json.loads(json.dumps(context, cls=RecordJSONEncoder))
+
+    def test_batch_matches_single_patient_loader(self):
+        with dal.bypass_query_cache():
+            episode_ids = [str(pk) for pk in dal.get_all_patient_ids()[:12]]
+            batch = dal.get_patient_details_many(episode_ids + ['999999999'])
+            self.assertEqual(sorted(batch), sorted(episode_ids))
+            self.assertTrue(any(batch[episode_id]['diarios'] for episode_id in episode_ids))
+            for episode_id in episode_ids:
+                with self.subTest(episode_id=episode_id):
+                    single = dal.get_patient_details_all(episode_id, specialty_id=None, concurrent=False)
+                    self.assertEqual(self._as_json(batch[episode_id]), self._as_json(single))
+
+    def test_batch_is_split_in_in_lists_of_the_configured_size(self):
+        with dal.bypass_query_cache():
+            episode_ids = [str(pk) for pk in dal.get_all_patient_ids()[:5]]
+            expected = self._as_json(dal.get_patient_details_many(episode_ids))
+            original = dal._get_config_value
+            with mock.patch.object(dal, '_get_config_value', lambda key, default=None: 2 if key == 'parameters.batch_max_in_list' else original(key, default)):
+                self.assertEqual(self._as_json(dal.get_patient_details_many(episode_ids)), expected)
+
+
+class IncrementalBackupTests(SimpleTestCase):
+    """Unchanged charts are not rendered again; stale PDFs are only removed from a plausible census."""
+
+    def setUp(self):
+        self.backup_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.backup_dir.cleanup)
+        self.settings_override = override_settings(
+            OFFLINE_BACKUP_DIR=self.backup_dir.name, BACKUP_MANIFEST_DIR=os.path.join(self.backup_dir.name, 'manifest'),
+            BACKUP_BOOKLETS=[], BACKUP_MAX_REMOVED_FRACTION=0.5,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.renderer = mock.Mock()
+        self.renderer.render.return_value = b'%PDF-1.7'
+        patcher = mock.patch.object(backup_manifest, '_template_fingerprint', 'template')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for target, value in (('get_renderer', lambda: self.renderer), ('format_context', dict)):
+            patcher = mock.patch(f'ward_data_app.tasks.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _context(self, episode_id, **changes):
+        context = {'episode_id': episode_id, 'patient_name': 'ANA SILVA', 'specialty_name': 'CARDIO',
+                   'sala': '3', 'cama': '12', 'diarios': [{'diario': 'Stable.'}]}
+        context.update(changes)
+        return context
+
+    def test_unchanged_chart_is_not_rendered_again(self):
+        file_path, rendered = _save_patient_pdf(self._context('1'))
+        self.assertTrue(rendered)
+        self.assertTrue(os.path.isfile(file_path))
+        self.assertEqual(_save_patient_pdf(self._context('1')), (file_path, False))
+        self.assertEqual(self.renderer.render.call_count, 1)
+
+    def test_changed_chart_is_rendered_and_moved_file_replaced(self):
+        old_path, _ = _save_patient_pdf(self._context('1'))
+        _, rendered = _save_patient_pdf(self._context('1', diarios=[{'diario': 'Worse.'}]))
+        self.assertTrue(rendered)
+        new_path, rendered = _save_patient_pdf(self._context('1', cama='14', diarios=[{'diario': 'Worse.'}]))
+        self.assertTrue(rendered)
+        self.assertNotEqual(new_path, old_path)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(self.renderer.render.call_count, 3)
+
+    def test_stale_entries_of_discharged_patients_are_removed(self):
+        paths = {episode_id: _save_patient_pdf(self._context(episode_id))[0] for episode_id in '1234'}
+        self.assertEqual(backup_manifest.remove_stale_entries(['1', '2', '3']), ['4'])
+        self.assertFalse(os.path.exists(paths['4']))
+        self.assertTrue(os.path.exists(paths['1']))
+
+    def test_empty_or_partial_census_removes_nothing(self):
+        paths = [_save_patient_pdf(self._context(episode_id))[0] for episode_id in '1234']
+        self.assertEqual(backup_manifest.remove_stale_entries([]), [])
+        self.assertEqual(backup_manifest.remove_stale_entries(['1']), [])
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        self.assertEqual(len(list(backup_manifest.iter_entries())), 4)
+
+
+class ConditionalJSONResponseTests(SimpleTestCase):
+    """The JSON APIs answer a revalidation with 304 while the payload is unchanged."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.data = {'patients': [{'episode_id': '1', 'cama': '12'}]}
+
+    def test_first_request_gets_payload_and_etag(self):
+        response = _conditional_json_response(self.factory.get('/api/patients/'), self.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), self.data)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_matching_if_none_match_gets_304(self):
+        etag = _conditional_json_response(self.factory.get('/api/patients/'), self.data)['ETag']
+        response = _conditional_json_response(self.factory.get('/api/patients/', HTTP_IF_NONE_MATCH=etag), self.data)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changed_payload_gets_200(self):
+        etag = _conditional_json_response(self.factory.get('/api/patients/'), self.data)['ETag']
+        changed = {'patients': [{'episode_id': '1', 'cama': '14'}]}
+        response = _conditional_json_response(self.factory.get('/api/patients/', HTTP_IF_NONE_MATCH=etag), changed)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content), changed)
+
+
+class DiaryWindowTests(SyntheticHospitalTestCase):
+    """The diary window keeps the last N days and/or N entries, always the most recent one, and counts the rest."""
+
+    def setUp(self):
+        self.episode_ids = [str(pk) for pk in dal.get_all_patient_ids()[:8]]
+
+    def _full_diary(self, episode_id):
+        with override_settings(DIARY_WINDOW_DAYS=0, DIARY_WINDOW_ENTRIES=0), dal.bypass_query_cache():
+            dates = [row[0] for row in dal._execute_query('get_diarios', params=[Decimal(episode_id)], as_tuples=True)[1]]
+            return dates, dal._fetch_diaries(Decimal(episode_id))['diarios']
+
+    def _windowed(self, episode_id, **window):
+        with override_settings(**window), dal.bypass_query_cache():
+            return dal._fetch_diaries(Decimal(episode_id))
+
+    def test_days_window_includes_today_and_the_days_before(self):
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+        for days in (1, 3):
+            since = today - datetime.timedelta(days=days - 1)
+            for episode_id in self.episode_ids:
+                with self.subTest(days=days, episode_id=episode_id):
+                    dates, diary = self._full_diary(episode_id)
+                    kept = max(sum(1 for entry_date in dates if entry_date >= since), 1)
+                    result = self._windowed(episode_id, DIARY_WINDOW_DAYS=days, DIARY_WINDOW_ENTRIES=0)
+                    self.assertEqual(result['diarios'], diary[:kept])
+                    self.assertEqual(result['diarios_omitidos'], len(dates) - kept)
+
+    def test_entries_window_keeps_the_most_recent_entries(self):
+        for episode_id in self.episode_ids:
+            with self.subTest(episode_id=episode_id):
+                dates, diary = self._full_diary(episode_id)
+                result = self._windowed(episode_id, DIARY_WINDOW_DAYS=0, DIARY_WINDOW_ENTRIES=5)
+                self.assertEqual(result['diarios'], diary[:5])
+                self.assertEqual(result['diarios_omitidos'], max(len(dates) - 5, 0))
+
+    def test_most_recent_entry_is_kept_outside_the_window(self):
+        future = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=30), datetime.time.min)
+        for episode_id in self.episode_ids:
+            with self.subTest(episode_id=episode_id):
+                dates, diary = self._full_diary(episode_id)
+                with mock.patch.object(dal, '_diary_window', return_value=[dal._ALL_DIARY_ENTRIES, future]):
+                    result = self._windowed(episode_id)
+                self.assertEqual(result['diarios'], diary[:1])
+                self.assertEqual(result['diarios_omitidos'], len(dates) - 1)
+
+    def test_batch_loader_applies_the_same_window(self):
+        with override_settings(DIARY_WINDOW_DAYS=2, DIARY_WINDOW_ENTRIES=4), dal.bypass_query_cache():
+            batch = dal.get_patient_details_many(self.episode_ids)
+            self.assertTrue(any(batch[episode_id]['diarios_omitidos'] for episode_id in self.episode_ids))
+            for episode_id in self.episode_ids:
+                with self.subTest(episode_id=episode_id):
+                    single = dal._fetch_diaries(Decimal(episode_id))
+                    self.assertEqual(batch[episode_id]['diarios'], single['diarios'])
+                    self.assertEqual(batch[episode_id]['diarios_omitidos'], single['diarios_omitidos'])
+
+
+class FreshBackupPDFTests(SimpleTestCase):
+    """A recent backup PDF is served for the selected specialty; anything else is rendered."""
+
+    specialties = [{'COD_ESPECIALIDADE': 7, 'DES_ESPECIALIDADE': 'CARDIOLOGIA'},
+                   {'COD_ESPECIALIDADE': 9, 'DES_ESPECIALIDADE': 'ORTOPEDIA'}]
+
+    def setUp(self):
+        self.backup_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.backup_dir.cleanup)
+        self.settings_override = override_settings(BACKUP_MANIFEST_DIR=self.backup_dir.name, BACKUP_BOOKLETS=[], BACKUP_PDF_MAX_AGE=600)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = mock.patch.object(dal, 'get_specialties_list', return_value=self.specialties)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.file_path = os.path.join(self.backup_dir.name, '1001.pdf')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'%PDF')
+        backup_manifest.save_entry('1001', 'hash', self.file_path, {'specialty_name': 'CARDIOLOGIA'})
+
+    def _age_entry(self, seconds):
+        entry_path = backup_manifest._entry_path('1001')
+        then = os.path.getmtime(entry_path) - seconds
+        os.utime(entry_path, (then, then))
+
+    def test_recent_pdf_is_served(self):
+        self.assertEqual(_fresh_backup_pdf_path('1001', None), self.file_path)
+        self.assertEqual(_fresh_backup_pdf_path('1001', '7'), self.file_path)
+
+    def test_old_or_missing_pdf_is_rendered(self):
+        self.assertIsNone(_fresh_backup_pdf_path('1002', None))
+        self._age_entry(601)
+        self.assertIsNone(_fresh_backup_pdf_path('1001', None))
+        backup_manifest.touch_entry('1001')
+        self.assertEqual(_fresh_backup_pdf_path('1001', None), self.file_path)
+        os.remove(self.file_path)
+        self.assertIsNone(_fresh_backup_pdf_path('1001', None))
+
+    def test_other_or_unknown_specialty_is_rendered(self):
+        self.assertIsNone(_fresh_backup_pdf_path('1001', '9'))
+        self.assertIsNone(_fresh_backup_pdf_path('1001', '404'))
+
+    def test_disabled_or_invalid_id_is_rendered(self):
+        self.assertIsNone(_fresh_backup_pdf_path('../1001', None))
+        with override_settings(BACKUP_PDF_MAX_AGE=0):
+            self.assertIsNone(_fresh_backup_pdf_path('1001', None))
+
+
+class PdfJobTests(SimpleTestCase):
+    """On-demand PDF jobs are only visible to their owner and fail once they time out."""
+
+    def setUp(self):
+        self.jobs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.jobs_dir.cleanup)
+        self.settings_override = override_settings(PDF_JOBS_DIR=self.jobs_dir.name, PDF_JOB_TIMEOUT=300)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.factory = RequestFactory()
+        self.job = pdf_jobs.create_job('1001', None, 'nurse', 'http://testserver/')
+
+    def _request(self, username):
+        request = self.factory.get('/')
+        request.user = mock.Mock(username=username, is_authenticated=True)
+        return request
+
+    def test_get_job_only_accepts_job_ids(self):
+        self.assertEqual(pdf_jobs.get_job(self.job['id'])['patient_id'], '1001')
+        for job_id in ('', None, '../' + self.job['id'], self.job['id'].upper(), 'missing0'):
+            with self.subTest(job_id=job_id):
+                self.assertIsNone(pdf_jobs.get_job(job_id))
+
+    def test_job_is_only_visible_to_its_owner(self):
+        self.assertEqual(_get_own_pdf_job(self._request('nurse'), self.job['id'])['id'], self.job['id'])
+        with self.assertRaises(Http404):
+            _get_own_pdf_job(self._request('other'), self.job['id'])
+        response = pdf_job_status_api(self._request('other'), self.job['id'])
+        self.assertEqual(response.status_code, 404)
+
+    def test_job_queued_past_the_timeout_is_reported_failed(self):
+        self.assertEqual(json.loads(pdf_job_status_api(self._request('nurse'), self.job['id']).content)['status'], 'queued')
+        pdf_jobs.update_job(self.job['id'], status='running', created_at=self.job['created_at'] - 301)
+        payload = json.loads(pdf_job_status_api(self._request('nurse'), self.job['id']).content)
+        self.assertEqual(payload['status'], 'failed')
+        self.assertTrue(payload['error'])
+        self.assertEqual(pdf_jobs.get_job(self.job['id'])['status'], 'failed')
+
+    def test_finished_job_does_not_time_out(self):
+        pdf_jobs.update_job(self.job['id'], status='done', created_at=self.job['created_at'] - 301)
+        self.assertEqual(pdf_jobs.fail_if_timed_out(pdf_jobs.get_job(self.job['id']))['status'], 'done')
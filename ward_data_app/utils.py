@@ -51,6 +51,45 @@ def dictfetchone(cursor):
         return None
 
 
+def dictiter(cursor, batch_size=500):
+    """
+    Yield the rows of a database cursor as dictionaries, fetching them in
+    batches with `fetchmany` instead of materializing the whole result.
+
+    Args:
+        cursor: The executed cursor object.
+        batch_size (int): The number of rows fetched per round trip.
+
+    Yields:
+        dict: One dictionary per row.
+    """
+    columns = [col[0] for col in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+def tuplefetchall(cursor):
+    """
+    Return all rows from a database cursor as tuples, with the column names.
+
+    Args:
+        cursor: The executed cursor object.
+
+    Returns:
+        tuple[tuple[str], list[tuple]]: The column names and the row tuples.
+    """
+    try:
+        columns = tuple(col[0] for col in cursor.description)
+        return columns, [tuple(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Error in tuplefetchall: {e}", exc_info=True)
+        return (), []
+
+
 def format_hour(hour_seconds):
     """
     Converts a total number of seconds since midnight to an HH:MM string format.
@@ -93,14 +132,62 @@ def safe_strftime(date_obj, fmt='%d-%m-%Y'):
     # Return None if not a valid date/datetime object
     return None
 
+def to_datetime(value, time_seconds=None):
+    """
+    Converts a date, datetime or ISO string (e.g. a SQLite expression result)
+    to a naive datetime, adding a time of day in seconds since midnight.
+
+    Args:
+        value (datetime.date | datetime.datetime | str | None): The date.
+        time_seconds (int | None): Time of day, as in the hospital `*_TIME` columns.
+
+    Returns:
+        datetime.datetime or None: The datetime, or None if the input is invalid.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value.strip())
+        except ValueError:
+            logger.warning(f"Invalid date received: {value}")
+            return None
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+    elif isinstance(value, datetime.date):
+        value = datetime.datetime.combine(value, datetime.time())
+    else:
+        return None
+    if time_seconds:
+        try:
+            value = value.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(seconds=int(time_seconds))
+        except (ValueError, TypeError):
+            logger.warning(f"Invalid hour format received: {time_seconds}")
+    return value
+
+def strip_accents(value):
+    """
+    Removes accents and other non-ASCII characters using NFKD normalization
+    (e.g. "JOÃO" -> "JOAO").
+    """
+    return unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+
+
+def normalize_name(value):
+    """
+    Normalizes a name for accent- and case-insensitive matching: accents are
+    removed, letters are upper-cased and any other characters collapse into
+    single spaces (e.g. " joão  d'Ávila" -> "JOAO D AVILA").
+    """
+    return re.sub(r'[^A-Z0-9]+', ' ', strip_accents(value).upper()).strip()
+
+
 def slugify(value):
     """
     Normalizes a string, removes non-alphanumeric characters,
     converts spaces to underscores, and limits length.
     Used for creating safe filenames.
     """
-    value = str(value)
-    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    value = strip_accents(value)
     value = re.sub(r'[^\w\s-]', '', value).strip().upper()
     value = re.sub(r'[-\s]+', '_', value)
     return value[:50]
\ No newline at end of file
@@ -4,30 +4,54 @@ Views module for the `ward_data_app` application.
 This file defines the application's endpoints, including views that render
 HTML pages and APIs that provide JSON data to the frontend.
 """
+import os
+import json
+import time
+import hashlib
 import logging
-from io import BytesIO
+from urllib.parse import quote
 
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import FileResponse, JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
-from django.template.loader import render_to_string
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 
-from . import dal
+from . import backup_manifest, dal, metrics, name_index, pdf_jobs
 # Import formatter from the correct utility module
 from .format_utils import format_context
 from .logging_config import setup_logger
+from .pdf_renderer import WEASYPRINT_AVAILABLE, get_renderer
+from .records import RecordJSONEncoder
+from .tasks import render_pdf_job
 
 logger = setup_logger(__name__, log_to_file=True, log_level=logging.DEBUG)
 
+# Page size of the paginated sections of `patient_section_api` (default / maximum)
+SECTION_PAGE_SIZE = 20
+SECTION_MAX_PAGE_SIZE = 200
+
+
+def _conditional_json_response(request, data, encoder=DjangoJSONEncoder):
+    """
+    JSON response with a strong ETag (a hash of the serialized payload).
+    When the client's `If-None-Match` holds the same ETag (the frontend
+    fetches with `cache: "no-cache"`, so the browser revalidates its copy),
+    returns an empty 304 instead of the payload. `private, no-cache` keeps
+    shared caches out (the data depends on the session) and makes browsers
+    always revalidate.
+    """
+    content = json.dumps(data, cls=encoder)
+    etag = quote_etag(hashlib.sha256(content.encode('utf-8')).hexdigest()[:32])
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
 
-# Check WeasyPrint availability at application startup.
-try:
-    from weasyprint import HTML
-    WEASYPRINT_AVAILABLE = True
-except ImportError:
-    WEASYPRINT_AVAILABLE = False
-    logger.error('WeasyPrint is not installed. PDF generation functionality is disabled.')
 
 # -----------------------------------------------------------------------------
 # HTML Page Rendering Views
@@ -99,7 +123,7 @@ def recent_patients_api(request):
     try:
         specialty_id = request.session.get('selected_specialty_id')
         data = dal.get_recent_patients_list(specialty_id=specialty_id) 
-        return JsonResponse(data, safe=False)
+        return _conditional_json_response(request, data)
     except Exception as e:
         logger.error(f"Error in recent_patients_api (view layer): {e}", exc_info=True)
         return JsonResponse({'error': 'Internal error fetching recent patients'}, status=500)
@@ -120,6 +144,32 @@ def all_patients_api(request):
         sort_order = request.GET.get("sort_order", "desc")
         search_query = request.GET.get("search", "") 
 
+        # Keyset pagination: pages are addressed by an opaque cursor instead of a page number
+        cursor = request.GET.get("cursor", "")
+        if cursor or request.GET.get("pagination") == "cursor":
+            if limit <= 0:
+                raise ValueError("limit must be positive.")
+            patients_list, next_cursor, total_count = dal.get_patient_list_page_by_cursor(
+                specialty_id=specialty_id,
+                limit=limit,
+                cursor=cursor or None,
+                sort_key=sort_by,
+                sort_dir=sort_order,
+                search_query=search_query,
+                # The total only changes with the filters, so it is computed for the first page only
+                include_total=not cursor,
+            )
+            response = {
+                "patients": patients_list,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None,
+                "limit": limit,
+            }
+            if total_count is not None:
+                response["total"] = total_count
+                response["total_pages"] = (total_count + limit - 1) // limit
+            return _conditional_json_response(request, response)
+
         patients_list, total_count = dal.get_paginated_patient_list(
             specialty_id=specialty_id,
             page=page, 
@@ -131,7 +181,7 @@ def all_patients_api(request):
 
         total_pages = (total_count + limit - 1) // limit if limit > 0 else 1
 
-        return JsonResponse({
+        return _conditional_json_response(request, {
             "patients": patients_list, 
             "total": total_count,
             "page": page, 
@@ -147,6 +197,79 @@ def all_patients_api(request):
         return JsonResponse({'error': 'Internal error fetching patient list'}, status=500)
 
 
+@login_required
+def census_export_api(request):
+    """
+    Streams the census of the selected specialty (or all patients) as NDJSON,
+    one patient per line. With `?sections=1`, each line holds the full
+    patient details (as in `patient_info_api`) instead of the list fields.
+    """
+    specialty_id = request.session.get('selected_specialty_id')
+    include_sections = request.GET.get("sections", "").lower() in ['1', 'true']
+
+    def ndjson_lines():
+        exported = 0
+        try:
+            for patient in dal.iter_census(specialty_id=specialty_id, include_sections=include_sections):
+                exported += 1
+                yield json.dumps(patient, cls=RecordJSONEncoder) + "\n"
+        except Exception as e:
+            # Headers are already sent: end the stream with an error line
+            logger.error(f"Error in census_export_api after {exported} patients: {e}", exc_info=True)
+            yield json.dumps({'error': 'Internal error exporting census'}) + "\n"
+            return
+        logger.info(f"Census export finished: {exported} patients (sections: {include_sections}).")
+
+    response = StreamingHttpResponse(ndjson_lines(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="census.ndjson"'
+    return response
+
+
+@login_required
+def patient_search_api(request):
+    """
+    Typeahead API: returns the patients of the selected specialty whose name
+    matches `q` (accent- and case-insensitive, ranked), from the in-memory
+    name index.
+    """
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit.'}, status=400)
+
+    started = time.perf_counter()
+    results = name_index.search(query, request.session.get('selected_specialty_id'), limit=limit)
+    if results is None:
+        return JsonResponse({'error': 'Patient search is temporarily unavailable.'}, status=503)
+
+    return JsonResponse({
+        "query": query,
+        "results": [
+            {key: patient.get(key) for key in ('episode_id', 'patient_name', 'sala', 'cama', 'data_entrada', 'score')}
+            for patient in results
+        ],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+
+def _resolve_patient_id(search_query, specialty_id):
+    """Returns the episode ID for a search term (an ID or a name). Raises Http404 if no patient matches."""
+    patient_id = None
+
+    # Check if search query is a numeric ID or a name
+    if search_query.isdigit():
+        patient_id = search_query
+        logger.info(f"Searching patient by ID: {patient_id} (Specialty: {specialty_id or 'All'})")
+    else:
+        logger.info(f"Searching patient by Name: '{search_query}' (Specialty: {specialty_id or 'All'})")
+        patient_id = dal.get_patient_id_by_name(search_query, specialty_id)
+
+    if not patient_id:
+        raise Http404("Patient not found for the given search term.")
+    return patient_id
+
+
 @login_required
 def patient_info_api(request):
     """
@@ -160,25 +283,13 @@ def patient_info_api(request):
         if not search_query:
             return JsonResponse({'error': 'Search term not provided.'}, status=400)
 
-        patient_id = None
-
-        # Check if search query is a numeric ID or a name
-        if search_query.isdigit():
-            patient_id = search_query
-            logger.info(f"Searching patient by ID: {patient_id} (Specialty: {specialty_id or 'All'})")
-        else:
-            logger.info(f"Searching patient by Name: '{search_query}' (Specialty: {specialty_id or 'All'})")
-            patient_id = dal.get_patient_id_by_name(search_query, specialty_id)
-
-        if not patient_id:
-            raise Http404("Patient not found for the given search term.")
-
+        patient_id = _resolve_patient_id(search_query, specialty_id)
         patient_data = dal.get_patient_details_all(patient_id, specialty_id=specialty_id)
         
         if not patient_data:
              raise Http404(f"Data not found for patient ID {patient_id}.")
              
-        return JsonResponse(patient_data)
+        return _conditional_json_response(request, patient_data, encoder=RecordJSONEncoder)
     
     except Http404 as e:
         logger.warning(f"Patient not found in API patient_info for search '{search_query}': {e}")
@@ -187,16 +298,128 @@ def patient_info_api(request):
         logger.error(f"Unexpected error in patient_info_api for search '{search_query}': {e}", exc_info=True)
         return JsonResponse({'error': 'Internal error fetching patient info'}, status=500)
 
+
+@login_required
+def patient_header_api(request):
+    """
+    Lazy patient API: returns only the header of a patient found by ID or name
+    (like `patient_info_api`) and the names of its sections, which are then
+    loaded one by one from `patient_section_api`.
+    """
+    search_query = request.GET.get("search", "").strip()
+    try:
+        if not search_query:
+            return JsonResponse({'error': 'Search term not provided.'}, status=400)
+        specialty_id = request.session.get('selected_specialty_id')
+        header = dal.get_patient_header(_resolve_patient_id(search_query, specialty_id), specialty_id)
+        header['sections'] = list(dal.SECTION_NAMES)
+        header['paginated_sections'] = list(dal.PAGINATED_SECTIONS)
+        return _conditional_json_response(request, header)
+    except Http404 as e:
+        logger.warning(f"Patient not found in API patient_header for search '{search_query}': {e}")
+        return JsonResponse({'error': 'Patient not found.'}, status=404)
+    except Exception as e:
+        logger.error(f"Unexpected error in patient_header_api for search '{search_query}': {e}", exc_info=True)
+        return JsonResponse({'error': 'Internal error fetching patient info'}, status=500)
+
+
+@login_required
+def patient_section_api(request, patient_id_str: str, section: str):
+    """
+    Lazy patient API: returns one section of a patient. `?fields=a,b` keeps
+    only those keys of each item; the long sections (diaries, analyses) are
+    paginated with `?offset=` and `?limit=` (`next_offset` is set while there
+    are more items).
+    """
+    try:
+        specialty_id = request.session.get('selected_specialty_id')
+        fields = [field.strip() for field in request.GET.get("fields", "").split(",") if field.strip()]
+        offset = max(int(request.GET.get("offset", 0)), 0)
+        limit = min(max(int(request.GET.get("limit", SECTION_PAGE_SIZE)), 1), SECTION_MAX_PAGE_SIZE)
+
+        data = dal.get_patient_section(patient_id_str, specialty_id, section, fields=fields or None, offset=offset, limit=limit)
+        response = {"episode_id": patient_id_str, "section": section, **data}
+        if section in dal.PAGINATED_SECTIONS:
+            response["limit"] = limit
+            response["next_offset"] = data["offset"] + limit if data["has_more"] else None
+        return _conditional_json_response(request, response, encoder=RecordJSONEncoder)
+
+    except Http404 as e:
+        logger.warning(f"Patient not found in API patient_section for ID {patient_id_str}: {e}")
+        return JsonResponse({'error': 'Patient not found.'}, status=404)
+    except ValueError as ve:
+        logger.warning(f"Value error in patient_section_api (view layer): {ve}")
+        return JsonResponse({'error': f'Invalid parameter or config error: {ve}'}, status=400)
+    except Exception as e:
+        logger.error(f"Unexpected error in patient_section_api for ID {patient_id_str}, section '{section}': {e}", exc_info=True)
+        return JsonResponse({'error': 'Internal error fetching patient section'}, status=500)
+
 # -----------------------------------------------------------------------------
 # File Generation Views
 # -----------------------------------------------------------------------------
 
+def _fresh_backup_pdf_path(patient_id_str, specialty_id):
+    """
+    Returns the path of the patient's PDF in the offline backup if the backup
+    wrote it, or confirmed it unchanged, within `BACKUP_PDF_MAX_AGE` seconds;
+    None to render it instead.
+
+    With a specialty selected, the patient must belong to it in the manifest
+    entry, written by the backup from the same data as the PDF; when that
+    cannot be confirmed the PDF is rendered, which checks the specialty in SQL.
+    """
+    max_age = getattr(settings, 'BACKUP_PDF_MAX_AGE', 0)
+    if max_age <= 0 or not patient_id_str.isdigit():
+        return None
+    file_path = backup_manifest.get_fresh_pdf(patient_id_str, max_age)
+    if file_path is None:
+        return None
+    if specialty_id:
+        specialty_names = {str(s.get('COD_ESPECIALIDADE')): s.get('DES_ESPECIALIDADE') for s in dal.get_specialties_list()}
+        specialty_name = specialty_names.get(str(specialty_id))
+        entry = backup_manifest.get_entry(patient_id_str)
+        if not specialty_name or entry is None or entry.get('specialty_name') != specialty_name:
+            return None
+    return file_path
+
+
+def _pdf_file_response(file_path, filename, root_dir, accel_prefix):
+    """
+    Returns a response sending a PDF file under `root_dir`. Behind nginx
+    (`accel_prefix`, an internal location aliasing `root_dir`) the file is
+    sent by nginx (`X-Accel-Redirect`) instead of by the Python worker.
+    Returns None if the file disappeared.
+    """
+    relative_path = os.path.relpath(file_path, root_dir).replace(os.sep, '/')
+    if accel_prefix and not relative_path.startswith('../'):
+        response = HttpResponse(content_type='application/pdf')
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative_path)
+    else:
+        try:
+            response = FileResponse(open(file_path, 'rb'), content_type='application/pdf')
+        except FileNotFoundError:
+            # Replaced by the backup since the lookup
+            return None
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
+
+
 @login_required
 def generate_pdf_view(request, patient_id_str: str):
     """
-    Generates and returns a PDF file with a specific patient's details
-    "on-the-fly" at the user's request.
+    Returns a PDF file with a specific patient's details at the user's
+    request: the backup PDF if it is fresh, otherwise generated "on-the-fly".
     """
+    specialty_id = request.session.get('selected_specialty_id')
+    backup_path = _fresh_backup_pdf_path(patient_id_str, specialty_id)
+    if backup_path is not None:
+        response = _pdf_file_response(backup_path, f"patient_{patient_id_str}.pdf",
+                                      settings.OFFLINE_BACKUP_DIR, getattr(settings, 'BACKUP_PDF_ACCEL_PREFIX', ''))
+        if response is not None:
+            metrics.PDF_ON_DEMAND.labels('backup').inc()
+            logger.info(f"Serving backup PDF for patient ID {patient_id_str} ({backup_path})")
+            return response
+
     if not WEASYPRINT_AVAILABLE:
         logger.error("Attempted to generate PDF without WeasyPrint installed.")
         return HttpResponse("Server Error: PDF generation library not available.", status=500)
@@ -204,28 +427,22 @@ def generate_pdf_view(request, patient_id_str: str):
     logger.info(f"Received request to generate PDF for ID: {patient_id_str}")
 
     try:
-        specialty_id = request.session.get('selected_specialty_id')
-        
         # 1. Get raw data from DAL
         context = dal.get_patient_details_all(patient_id_str, specialty_id)
         
         # 2. Format data for the template
         context = format_context(context)
         
-        # 3. Render template to HTML string
-        html_string = render_to_string('ward_data_app/patient-pdf.html', context)
-
-        # 4. Use WeasyPrint to convert HTML string to PDF bytes
-        html = HTML(string=html_string, base_url=request.build_absolute_uri('/')) 
-        pdf_buffer = BytesIO()
-        html.write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
+        # 3. Render the PDF with the warm per-thread renderer
+        renderer = get_renderer()
+        pdf_bytes = renderer.render(context, base_url=request.build_absolute_uri('/'))
 
-        # 5. Create an HTTP response with the PDF content
-        response = HttpResponse(pdf_buffer, content_type='application/pdf')
+        # 4. Create an HTTP response with the PDF content
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
         response['Content-Disposition'] = f'inline; filename="patient_{context.get("episode_id", "unknown")}.pdf"' 
 
-        logger.info(f"PDF generated successfully for patient ID {patient_id_str}")
+        metrics.PDF_ON_DEMAND.labels('rendered').inc()
+        logger.info(f"PDF generated successfully for patient ID {patient_id_str} ({renderer.last_timings})")
         return response
     
     except Http404:
@@ -238,4 +455,97 @@ def generate_pdf_view(request, patient_id_str: str):
     
     except Exception as e: 
         logger.error(f"Unexpected error generating PDF for patient ID {patient_id_str}: {e}", exc_info=True)
-        return HttpResponse(f"Unexpected internal error generating PDF.", status=500)
\ No newline at end of file
+        return HttpResponse(f"Unexpected internal error generating PDF.", status=500)
+
+@login_required
+@require_POST
+def pdf_job_create_api(request):
+    """
+    Asynchronous "Generate PDF": enqueues a render job for `patient_id` on the
+    `pdf_jobs` queue and returns it (202) with the URLs to poll its status and
+    download the file. A fresh backup PDF is returned as an already finished
+    job pointing to `generate_pdf_view`.
+    """
+    patient_id_str = request.POST.get('patient_id', '').strip()
+    if not patient_id_str.isdigit():
+        return JsonResponse({'error': 'Invalid patient ID.'}, status=400)
+    specialty_id = request.session.get('selected_specialty_id')
+
+    if _fresh_backup_pdf_path(patient_id_str, specialty_id) is not None:
+        return JsonResponse({
+            'status': 'done',
+            'progress': 100,
+            'download_url': reverse('generate_patient_pdf', args=[patient_id_str]),
+        })
+
+    base_url = request.build_absolute_uri('/')
+    try:
+        job = pdf_jobs.create_job(patient_id_str, specialty_id, request.user.username, base_url)
+        render_pdf_job.delay(job['id'])
+    except Exception as e:
+        logger.error(f"Could not enqueue PDF job for patient ID {patient_id_str}: {e}", exc_info=True)
+        return JsonResponse({'error': 'PDF generation is temporarily unavailable.'}, status=503)
+
+    logger.info(f"PDF job {job['id']} queued for patient ID {patient_id_str} by '{request.user.username}'")
+    return JsonResponse(_pdf_job_payload(job), status=202)
+
+
+def _pdf_job_payload(job):
+    payload = {key: job.get(key) for key in ('id', 'patient_id', 'status', 'stage', 'progress', 'error')}
+    payload['timeout'] = settings.PDF_JOB_TIMEOUT
+    payload['status_url'] = reverse('pdf_job_status_api', args=[job['id']])
+    if job['status'] == 'done':
+        payload['download_url'] = reverse('pdf_job_download', args=[job['id']])
+    return payload
+
+
+def _get_own_pdf_job(request, job_id):
+    """Returns a PDF job created by the current user, or raises Http404."""
+    job = pdf_jobs.get_job(job_id)
+    if job is None or job.get('username') != request.user.username:
+        raise Http404("PDF job not found.")
+    return job
+
+
+@login_required
+def pdf_job_status_api(request, job_id: str):
+    """
+    Status of a PDF job: 'queued', 'running' (with its stage), 'done' (with
+    `download_url`) or 'failed', also once queued or running longer than
+    `PDF_JOB_TIMEOUT`.
+    """
+    try:
+        job = _get_own_pdf_job(request, job_id)
+    except Http404:
+        return JsonResponse({'error': 'PDF job not found.'}, status=404)
+    return JsonResponse(_pdf_job_payload(pdf_jobs.fail_if_timed_out(job)))
+
+
+@login_required
+def pdf_job_download_view(request, job_id: str):
+    """Returns the PDF of a finished job."""
+    try:
+        job = _get_own_pdf_job(request, job_id)
+    except Http404:
+        return HttpResponse("Error: PDF job not found.", status=404)
+    if job['status'] != 'done':
+        return HttpResponse("Error: the PDF is not ready.", status=409)
+    response = _pdf_file_response(pdf_jobs.pdf_path(job_id), f"patient_{job['patient_id']}.pdf",
+                                  settings.PDF_JOBS_DIR, getattr(settings, 'PDF_JOBS_ACCEL_PREFIX', ''))
+    if response is None:
+        return HttpResponse("Error: the PDF has expired.", status=410)
+    return response
+
+
+# -----------------------------------------------------------------------------
+# Monitoring
+# -----------------------------------------------------------------------------
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint (see `metrics`). Not behind the login: nginx
+    keeps it off the public port, so it is only reachable inside the Docker
+    network (`http://web:8000/metrics`).
+    """
+    body, content_type = metrics.render_latest()
+    return HttpResponse(body, content_type=content_type)